@@ -0,0 +1,4 @@
+"""
+Synthetic end-to-end benchmarks of scanning and executing, run with "python setup.py bench"
+or "python -m benchmarks.bench".
+"""
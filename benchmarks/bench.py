@@ -0,0 +1,211 @@
+"""
+Times DirectoryScanner.find per checker and OperationManager.execute per operation type
+against generated trees, writing the results as JSON to compare between releases.
+
+Every result holds the wall time, the os level calls seen through a audit hook (stat calls
+are not audited), the read and write syscalls from /proc/self/io and the peak memory
+traced by tracemalloc. Tracing memory slows python code down, pass --no-memory for wall
+times closer to a real run.
+"""
+import json
+import sys
+import tracemalloc
+from collections import Counter
+from logging import ERROR
+from optparse import OptionParser
+from os.path import exists, join
+from platform import platform, python_version
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from msort import __version__
+from msort.conf import Config
+from msort.log import setLevel
+from msort.filesystem import DirectoryScanner, scandir, size_index
+from msort.operation import OperationManager, MoveOperation, MoveContentsOperation, DeleteOperation
+from msort.check.age import AgeCheck
+from msort.check.inuse import InUseCheck
+from msort.check.empty import EmptyCheck
+from msort.check.release import ReleaseCheck
+from msort.check.prune import Pruner
+from msort.trash import find_trash_dirs, Reaper
+from benchmarks.tree import generate_tree, write_config
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+CHECKERS = (AgeCheck, InUseCheck, EmptyCheck, ReleaseCheck, Pruner)
+
+# Audit hooks can not be removed once added, so a single hook counts into this while enabled
+_events = Counter()
+_counting = [False]
+
+def _audit(event, args):
+    if _counting[0] and (event.startswith('os.') or event.startswith('shutil.') or event == 'open'):
+        _events[event] += 1
+
+sys.addaudithook(_audit)
+
+def _proc_io():
+    """ Read the syscall counters of /proc/self/io
+
+    :return: syscr and syscw, empty without /proc
+    :rtype: dict
+    """
+    if not exists('/proc/self/io'):
+        return {}
+    with open('/proc/self/io') as fp:
+        fields = dict([line.split(': ') for line in fp.read().splitlines()])
+    return dict([(key, int(fields[key])) for key in ('syscr', 'syscw')])
+
+def measure(func, memory=True):
+    """ Run func once, measuring it
+
+    :param func: Callable to measure
+    :type func: callable
+    :param memory: Trace the peak memory allocated
+    :type memory: bool
+    :return: func result and the measurements
+    :rtype: tuple
+    """
+    _events.clear()
+    if memory:
+        tracemalloc.start()
+    io_before = _proc_io()
+    _counting[0] = True
+    start = time()
+    try:
+        result = func()
+    finally:
+        wall = time() - start
+        _counting[0] = False
+    io_after = _proc_io()
+    measured = {
+        'wall': wall,
+        'calls': dict(_events),
+        'syscalls': dict([(key, io_after[key] - io_before[key]) for key in io_after]),
+        'peak_memory': None
+    }
+    if memory:
+        measured['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, measured
+
+def bench_scan(conf, entries, memory=True):
+    """ Time a full scan of the TV section with each checker on its own, then all of them
+
+    :return: Results
+    :rtype: dict[]
+    """
+    results = []
+    for checkers in [(checker,) for checker in CHECKERS] + [CHECKERS]:
+        scanner = DirectoryScanner(conf)
+        for checker in checkers:
+            scanner.registerChecker(checker(conf))
+        size_index.clear()
+        found, measured = measure(lambda: scanner.find('TV'), memory)
+        name = checkers[0].__name__ if len(checkers) == 1 else 'all'
+        measured.update(bench='scan', checker=name, entries=entries, operations=len(found))
+        results.append(measured)
+    return results
+
+def _operations(source, dest, operation_type):
+    ops = []
+    for path in sorted(scandir(source)):
+        if operation_type == 'MoveOperation':
+            ops.append(MoveOperation(path, join(dest, path.split('/')[-1])))
+        elif operation_type == 'MoveContentsOperation':
+            if path.isdir:
+                ops.append(MoveContentsOperation(path, join(dest, path.split('/')[-1])))
+        else:
+            ops.append(DeleteOperation(path, operation_type == 'DeleteOperation(trash)'))
+    return ops
+
+def bench_execute(root, entries, seed=0, memory=True):
+    """ Time executing one type of operation against every entry of a fresh tree
+
+    :return: Results
+    :rtype: dict[]
+    """
+    results = []
+    for operation_type in ('MoveOperation', 'MoveContentsOperation', 'DeleteOperation', 'DeleteOperation(trash)'):
+        tree = mkdtemp(dir=root)
+        try:
+            source = generate_tree(tree, entries, seed)
+            operation_mgr = OperationManager(True)
+            operation_mgr['TV'] = _operations(source, join(tree, 'sorted'), operation_type)
+            _, measured = measure(operation_mgr.execute, memory)
+            measured.update(bench='execute', operation=operation_type, entries=entries,
+                            operations=len(operation_mgr), errors=len(operation_mgr.error_list))
+            results.append(measured)
+            if operation_type == 'DeleteOperation(trash)':
+                reaper = Reaper(find_trash_dirs([tree]))
+                _, measured = measure(reaper.reapAll, memory)
+                measured.update(bench='execute', operation='Reaper', entries=entries, operations=reaper.reaped)
+                results.append(measured)
+        finally:
+            rmtree(tree, ignore_errors=True)
+    return results
+
+def run(sizes=DEFAULT_SIZES, directory=None, seed=0, memory=True):
+    """ Run all the benchmarks at every size
+
+    :param sizes: Number of top level entries of the trees to benchmark
+    :type sizes: int[]
+    :param directory: Directory to generate the trees in, ideally on a tmpfs
+    :type directory: str
+    :param seed: Tree generation seed
+    :type seed: int
+    :param memory: Trace the peak memory
+    :type memory: bool
+    :return: Report
+    :rtype: dict
+    """
+    if directory is None:
+        directory = '/dev/shm' if exists('/dev/shm') else None
+    results = []
+    for entries in sizes:
+        root = mkdtemp(prefix='msort-bench-', dir=directory)
+        try:
+            generate_tree(root, entries, seed)
+            conf = Config(write_config(root))
+            results.extend(bench_scan(conf, entries, memory))
+            results.extend(bench_execute(root, entries, seed, memory))
+        finally:
+            rmtree(root, ignore_errors=True)
+    return {
+        'version': __version__,
+        'python': python_version(),
+        'platform': platform(),
+        'seed': seed,
+        'memory_traced': memory,
+        'results': results
+    }
+
+def main(args=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--sizes', dest='sizes', default=','.join(map(str, DEFAULT_SIZES)),
+        help='Comma separated numbers of top level entries to benchmark')
+    parser.add_option('-o', '--output', dest='output', default='benchmark.json',
+        help='JSON file to write the results to, - for stdout')
+    parser.add_option('-d', '--dir', dest='directory', default=None,
+        help='Directory to generate the trees in, defaults to /dev/shm')
+    parser.add_option('--seed', dest='seed', type='int', default=0, help='Tree generation seed')
+    parser.add_option('--no-memory', dest='memory', action='store_false', default=True,
+        help='Dont trace the peak memory, it slows python code down')
+    options, _ = parser.parse_args(args)
+    # Progress logging would be measured along with everything else
+    setLevel(ERROR)
+    report = run([int(size) for size in options.sizes.split(',')], options.directory, options.seed, options.memory)
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if options.output == '-':
+        print(data)
+    else:
+        with open(options.output, 'w') as fp:
+            fp.write(data)
+    for result in report['results']:
+        print('{0:>7} {1:<8} {2:<24} {3:>9.3f}s {4:>7} ops'.format(
+            result['entries'], result['bench'], result.get('checker') or result.get('operation'),
+            result['wall'], result['operations']), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
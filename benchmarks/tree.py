@@ -0,0 +1,143 @@
+"""
+Generates realistic, deterministic, source trees to benchmark against. Entry names follow the
+corpus used by tests/testScanner.py: episodes, nested season packs, dated daily shows, loose
+video files, empty files and directories and folders no rule matches.
+"""
+from os import makedirs, utime
+from os.path import basename, join
+from random import Random
+from time import time
+
+DAY = 86400
+
+SHOWS = ['Entourage', 'Bridezillas', 'NOVA', 'Crave', 'Kingdom', 'Will.And.Grace', 'The.Thick.Of.It',
+         'The.Old.Guys', 'The.Life.and.Times.of.Tim', 'La.Femme.Nikita', 'Jeeves.and.Wooster',
+         'Japanorama', 'Inside.The.Human.Body', 'Im.Alan.Partridge', 'How.I.Met.Your.Mother',
+         'Hatfields.and.McCoys', 'Deadliest.Warrior', 'Comedy.Central.Presents', 'Jonathan.Creek',
+         'The.Twilight.Zone']
+TAGS = ['720p.HDTV.x264', 'HDTV.XviD', 'DSR.XviD', '480p.HDTV.x264', 'DVDRip.XviD', 'PDTV.XviD']
+GROUPS = ['Extinct', 'OMiCRON', 'mSD', 'SYS', 'BTN', 'FOV', 'SAiNTS', 'REWARD', '2HD', 'W4F']
+
+# Which kind of entry each index creates, cycling every len(LAYOUT) entries
+LAYOUT = ['episode'] * 11 + ['season', 'season', 'daily', 'loose', 'empty_dir', 'empty_file',
+                             'unknown', 'old_episode', 'old_episode']
+
+CONFIG = """[general]
+error_continue = true
+scan_sections = TV
+inuse_backend = auto
+
+[minimum_age]
+enabled = true
+days = 3
+
+[cleanup]
+enable = true
+
+[ignored]
+rx1=(.avi|.mkv)$
+
+[seasons]
+rx1=(?P<name>.+?)S(\\d{{2}}|0\\d{{1}})(?![Ee]\\d{{1,2}})
+rx2=(?P<name>.+?)(series|season).\\d{{1,2}}
+
+[prune]
+enabled = true
+max_days = 14
+rx1=(?P<name>.+?)\\.\\d{{4}}.\\d{{2}}\\.\\d{{2}}.+HDTV
+
+[TV]
+source = {source}
+dest = {dest}
+sorted = true
+sort_seasons = false
+rx1=(?P<name>.+?).S\\d{{1,2}}E\\d{{1,2}}
+rx2=(?P<name>.+?).\\d{{1,2}}X\\d{{2}}
+"""
+
+def write_config(root):
+    """ Write a config with a TV section sorting the generated tree in place
+
+    :param root: Root the tree was generated in
+    :type root: str
+    :return: Config file path
+    :rtype: str
+    """
+    path = join(root, 'msort.conf')
+    with open(path, 'w') as fp:
+        fp.write(CONFIG.format(source=join(root, 'TV'), dest=join(root, 'TV')))
+    return path
+
+def _touch(path, size=0):
+    with open(path, 'w') as fp:
+        if size:
+            # Sparse, only the apparent size matters to the checks
+            fp.truncate(size)
+
+def _release(show, season, episode, i):
+    return '{0}.S{1:02d}E{2:02d}.{3}-{4}'.format(show, season, episode, TAGS[i % len(TAGS)], GROUPS[i % len(GROUPS)])
+
+def generate_tree(root, entries, seed=0):
+    """ Generate a source tree of entries top level entries under root/TV
+
+    :param root: Directory to generate the tree in
+    :type root: str
+    :param entries: Number of top level entries
+    :type entries: int
+    :param seed: Random seed, the same seed always generates the same tree
+    :type seed: int
+    :return: Source directory of the tree
+    :rtype: str
+    """
+    rng = Random(seed)
+    now = time()
+    source = join(root, 'TV')
+    makedirs(source)
+    for i in range(entries):
+        # Every block of len(LAYOUT) entries belongs to one show, the position in the block
+        # and the block number make up unique season and episode numbers
+        block, position = divmod(i, len(LAYOUT))
+        show = SHOWS[block % len(SHOWS)]
+        run = block // len(SHOWS)
+        kind = LAYOUT[position]
+        # Most entries are past the minimum age, some are still new
+        age = rng.uniform(4, 10) * DAY if rng.random() < 0.8 else rng.uniform(0, 2) * DAY
+        if kind in ('episode', 'old_episode'):
+            path = join(source, _release(show, position + 1, run + 1, i))
+            makedirs(path)
+            _touch(join(path, basename(path).lower() + '.mkv'), rng.randint(100, 700) * 1024 ** 2)
+            _touch(join(path, 'release.nfo'), 4096)
+            if kind == 'old_episode':
+                age = rng.uniform(30, 365) * DAY
+        elif kind == 'season':
+            season = run % 99 + 1
+            path = join(source, '{0}.S{1:02d}.{2}-{3}'.format(show, season, 'DVDRip.XviD' if position % 2 else 'BDRip.x264',
+                                                              GROUPS[(run // 99) % len(GROUPS)]))
+            for episode in range(1, 5):
+                episode_path = join(path, _release(show, season, episode, i))
+                makedirs(episode_path)
+                _touch(join(episode_path, 'episode.avi'), rng.randint(200, 400) * 1024 ** 2)
+        elif kind == 'daily':
+            # Already sorted show folder holding a dated release old enough to be pruned
+            path = join(source, '{0}.Daily.{1}'.format(show, i))
+            release = join(path, '{0}.{1}.{2:02d}.{3:02d}.HDTV.XviD-W4F'.format(show, 2000 + i % 20, i % 12 + 1, i % 28 + 1))
+            makedirs(release)
+            _touch(join(release, 'daily.avi'), rng.randint(100, 300) * 1024 ** 2)
+            mtime = now - rng.uniform(15, 60) * DAY
+            utime(release, (mtime, mtime))
+        elif kind == 'loose':
+            path = join(source, _release(show, position + 1, run + 1, i) + '.mkv')
+            _touch(path, rng.randint(100, 700) * 1024 ** 2)
+        elif kind == 'empty_dir':
+            path = join(source, 'Empty.Folder.{0}'.format(i))
+            makedirs(path)
+        elif kind == 'empty_file':
+            path = join(source, 'empty.file.{0}.avi'.format(i))
+            _touch(path)
+        else:
+            path = join(source, 'Some Random Folder {0}'.format(i))
+            makedirs(path)
+            _touch(join(path, 'notes.txt'), 1024)
+        mtime = now - age
+        utime(path, (mtime, mtime))
+    return source
@@ -17,19 +17,34 @@ from logging import DEBUG, INFO
 from optparse import OptionParser
 
 from msort.conf import Config, ConfigError
-from msort.log import getLogger, setLevel
+from msort.log import getLogger, setLevel, flushLogs
 from msort.filesystem import DirectoryScanner, fmt_size
-from msort.operation import OperationManager, DeleteOperation
+from msort.operation import OperationManager, OperationError
+from msort.journal import OperationJournal, read_journal, load_pending
+from msort.index import ScanIndex, config_hash
+from msort.watch import Watcher
+from msort.trash import Reaper, find_trash_dirs
 from msort.check.empty import EmptyCheck
 from msort.check.release import ReleaseCheck
 from msort.check.inuse import InUseCheck
 from msort.check.prune import Pruner
+from msort.check.duplicate import DuplicateCheck
 from msort.check.age import AgeCheck
 
 # 3 doesnt have raw_input
 try:     get_input = raw_input
 except:  get_input = input
-confirm = lambda m: get_input('{0} [Y/n]: '.format(m)).lower() in ('y', '')
+
+def confirm(message):
+    """ Ask the user a yes/no question, once everything logged so far is written out
+
+    :param message: Question to ask
+    :type message: str
+    :return: Answered yes status
+    :rtype: bool
+    """
+    flushLogs()
+    return get_input('{0} [Y/n]: '.format(message)).lower() in ('y', '')
 
 def parse_cli(args=None):
     """ Parse command line arguments
@@ -46,7 +61,80 @@ def parse_cli(args=None):
         help="Answer yes for all question, autocommit changes found")
     parser.add_option('-c', '--config', dest="config_file", default="~/.msort.conf", metavar='CONFIG_FILE',
         help="Set an alternate config file path")
-    return parser.parse_args(args)
+    parser.add_option('-j', '--jobs', dest="jobs", type="int", default=1, metavar='JOBS',
+        help="Number of sections to scan at the same time")
+    parser.add_option('--mount-jobs', dest="mount_jobs", type="int", default=1, metavar='JOBS',
+        help="Number of sections sharing a mount to scan at the same time")
+    parser.add_option('-l', '--lanes', dest="lanes", type="int", default=1, metavar='LANES',
+        help="Number of operations to execute at the same time per device")
+    parser.add_option('--full-rescan', dest="full_rescan", action="store_true", default=False,
+        help="Ignore the scan index and check every entry again")
+    parser.add_option('-w', '--watch', dest="watch", action="store_true", default=False,
+        help="Keep running after the scan, sorting new entries as soon as they settle (requires --yes)")
+    parser.add_option('--settle', dest="settle", type="float", default=10, metavar='SECONDS',
+        help="Seconds a new entry must be left untouched before it is sorted in watch mode")
+    parser.add_option('--reap', dest="reap", action="store_true", default=False,
+        help="Only empty the trash left by delete_mode = trash and exit")
+    parser.add_option('--stream', dest="stream", action="store_true", default=False,
+        help="Execute operations as soon as they are found while the scan continues (requires --yes)")
+    parser.add_option('--stats', dest="stats", action="store_true", default=False,
+        help="Show the time spent in each checker and section once the scan is done")
+    parser.add_option('--resume', dest="resume", action="store_true", default=False,
+        help="Continue the operations of a interrupted run from the journal without scanning")
+    parser.add_option('--plan-out', dest="plan_out", metavar='PLAN_FILE',
+        help="Scan and save the operations found to a plan file without executing them")
+    parser.add_option('--plan-in', dest="plan_in", metavar='PLAN_FILE',
+        help="Execute the operations of a saved plan file without scanning")
+    options, args = parser.parse_args(args)
+    if options.watch and not options.autocommit:
+        parser.error('--watch requires --yes, changes can not be confirmed while watching')
+    if options.stream and not options.autocommit:
+        parser.error('--stream requires --yes, changes are executed before the scan is done')
+    if options.stream and (options.resume or options.plan_in or options.plan_out):
+        parser.error('--stream can not be used with --resume, --plan-in or --plan-out')
+    if options.resume and options.plan_in:
+        parser.error('--resume and --plan-in can not be used together')
+    if options.plan_out and (options.resume or options.plan_in or options.watch):
+        parser.error('--plan-out only scans, it can not be used with --resume, --plan-in or --watch')
+    return options, args
+
+def execute(log, operation_mgr, stream=None):
+    """ Execute the queued operations and report the outcome
+
+    :param log: Logger instance
+    :type log: Logger
+    :param operation_mgr: Operations to execute
+    :type operation_mgr: OperationManager
+    :param stream: Execute the (section, operation) tuples of the stream as they are
+    found instead of the queued operations
+    :type stream: iterable
+    """
+    success = operation_mgr.execute() if stream is None else operation_mgr.executeStream(stream)
+    if success:
+        log.info('Completed all operations successfully! [{0}]'.format(operation_mgr.cur_idx))
+    else:
+        operation_mgr.showErrors()
+        log.info('Errors were encountered, you should review them and make any changes deemed required.')
+    if operation_mgr.freed:
+        log.info('Total pruned size: {0} ({1} on disk)'.format(fmt_size(sum([f.size for f in operation_mgr.freed])),
+                                                           fmt_size(sum([f.blocks for f in operation_mgr.freed]) * 512)))
+
+def warn_unfinished(log, journal_path):
+    """ Warn about operations a earlier interrupted run left unfinished in the journal
+
+    :param log: Logger instance
+    :type log: Logger
+    :param journal_path: Journal file
+    :type journal_path: str
+    """
+    try:
+        unfinished = [entry for entry in read_journal(journal_path) if entry.state != 'done']
+    except (OperationError, ValueError, KeyError) as err:
+        log.warn('Could not read the journal {0}: {1}'.format(journal_path, err))
+        return
+    if unfinished:
+        log.warn('The last run left {0} operations unfinished, use --resume to continue it instead '
+                 'of scanning again'.format(len(unfinished)))
 
 def main():
     """ Parse command line arguments and run the sorter
@@ -62,33 +150,89 @@ def main():
     log_level = DEBUG if options.debug else INFO
     #basicConfig(level=log_level, format='%(message)s')
     ret_code = 0
+    index = None
+    reaper = None
+    journal = None
     try:
         # Initialize the config file
         conf = Config(options.config_file)
         setLevel(log_level)
+        if conf.general.delete_trash or options.reap:
+            # Finish off anything trashed by previous runs while this one scans
+            paths = []
+            for section in conf.filteredSections():
+                settings = conf.settings(section)
+                paths.extend([path for path in (settings.source, settings.dest) if path])
+            reaper = Reaper(find_trash_dirs(paths))
+            if options.reap:
+                log.info('Removed {0} trashed entries'.format(reaper.reapAll()))
+                return ret_code
+            reaper.start()
         # Setup the scanner and register checkers to use
-        scanner = DirectoryScanner(conf)
+        if conf.getBooleanSafe('general', 'scan_index'):
+            index = ScanIndex(conf.getIndexPath(), config_hash(conf), options.full_rescan)
+        scanner = DirectoryScanner(conf, index)
         scanner.registerChecker(AgeCheck(conf))
         scanner.registerChecker(InUseCheck(conf))
         scanner.registerChecker(EmptyCheck(conf))
         scanner.registerChecker(ReleaseCheck(conf))
+        pruner = None
         if conf.sectionEnabled('prune'):
-            scanner.registerChecker(Pruner(conf))
-        operation_mgr = OperationManager(conf.getboolean('general','error_continue'))
-        for section in conf.filteredSections():
-            operation_mgr[section] = scanner.find(section)
-        log.info('Found {0} total changes to be executed'.format(len(operation_mgr)))
-        if not len(operation_mgr):
-            total_deleted = sum([op.source.size for op in operation_mgr.getType(DeleteOperation)])
-            log.info('Total pruned size to be deleted: {0}'.format(fmt_size(total_deleted)))
-        if len(operation_mgr) == 0:
-            log.info('No operations were found, Bye!')
-        elif options.autocommit or confirm('Apply changes found ({0})?'.format(len(operation_mgr))):
-            if operation_mgr.execute():
-                log.info('Completed all operations successfully! [{0}]'.format(len(operation_mgr)))
-            else:
-                operation_mgr.showErrors()
-                log.info('Errors were encountered, you should review them and make any changes deemed required.')
+            pruner = Pruner(conf)
+            scanner.registerChecker(pruner)
+        if conf.has_section('duplicates') and conf.sectionEnabled('duplicates'):
+            scanner.registerChecker(DuplicateCheck(conf, pruner))
+        operation_mgr = OperationManager(conf.general.error_continue, options.lanes)
+        use_journal = conf.getBooleanSafe('general', 'journal', True)
+        journal_path = options.plan_in or conf.getJournalPath()
+        if options.resume or options.plan_in:
+            queued = load_pending(journal_path, operation_mgr)
+            log.info('Loaded {0} unfinished operations from {1}'.format(queued, journal_path))
+        elif options.stream:
+            if use_journal:
+                warn_unfinished(log, journal_path)
+                journal = OperationJournal(journal_path, truncate=True)
+                operation_mgr.journal = journal
+            execute(log, operation_mgr, scanner.iterAll(conf.filteredSections()))
+            if options.stats or options.debug:
+                for line in scanner.summary():
+                    log.info(line)
+        else:
+            if use_journal:
+                warn_unfinished(log, journal_path)
+            for section, operations in scanner.findAll(conf.filteredSections(), options.jobs, options.mount_jobs):
+                operation_mgr[section] = operations
+            operation_mgr.optimize()
+            if options.stats or options.debug:
+                for line in scanner.summary():
+                    log.info(line)
+            if options.plan_out:
+                plan = OperationJournal(options.plan_out, truncate=True)
+                plan.plan(operation_mgr)
+                plan.close()
+                log.info('Saved the plan of {0} operations to {1}'.format(len(operation_mgr), options.plan_out))
+                return ret_code
+        if not options.stream:
+            log.info('Found {0} total changes to be executed'.format(len(operation_mgr)))
+            if len(operation_mgr) == 0:
+                log.info('No operations were found, Bye!')
+            elif options.autocommit or confirm('Apply changes found ({0})?'.format(len(operation_mgr))):
+                if use_journal or options.plan_in:
+                    # A new scan starts a new journal, resumed plans keep appending to theirs
+                    journal = OperationJournal(journal_path, truncate=not (options.resume or options.plan_in))
+                    operation_mgr.journal = journal
+                execute(log, operation_mgr)
+        if options.watch:
+            def sort_settled(section, operations):
+                watch_mgr = OperationManager(conf.general.error_continue, options.lanes)
+                watch_mgr[section] = operations
+                try:
+                    watch_mgr.optimize()
+                    execute(log, watch_mgr)
+                except OperationError as err:
+                    # One bad batch never stops the watch
+                    log.error('Skipping the settled entries of {0}: {1}'.format(section, err))
+            Watcher(scanner, conf.filteredSections(), options.settle).run(sort_settled)
     except ConfigError as err:
         log.error('There was a configuration error:\n{0}'.format(err))
         ret_code = 3
@@ -99,6 +243,16 @@ def main():
         log.exception(err)
         log.error('Tis but a flesh wound.')
         ret_code = 1
+    finally:
+        if reaper and reaper.is_alive():
+            log.debug('Waiting for the trash to be emptied')
+            reaper.stop()
+            if reaper.reaped:
+                log.info('Freed {0} from the trash'.format(fmt_size(reaper.freed)))
+        if journal:
+            journal.close()
+        if index:
+            index.close()
     return ret_code
 
 if __name__ == "__main__":
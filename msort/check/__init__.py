@@ -13,7 +13,13 @@ class CheckSkip(CheckError):
 class BaseCheck(object):
     """
     Base instance to be overridden by a check plugin
+
+    Checks whose result only depends on the entry and the config, not on the time or the
+    state of other processes, can set cacheable so a ScanIndex may skip them for entries
+    which havent changed since they last found nothing.
     """
+    cacheable = False
+
     def __init__(self, config):
         """ Setup the logger and configuration values
 
@@ -23,6 +29,35 @@ class BaseCheck(object):
         self.log = getLogger(__name__)
         self.conf = config
 
+    def begin(self, sections):
+        """ Called by the scanner once at the start of a run, before any of its sections is
+        prepared. Can be overridden to reset the state shared by all the sections of a run.
+
+        :param sections: Section names the run scans
+        :type sections: list
+        """
+        pass
+
+    def prepare(self, section):
+        """ Called by the scanner once before the source of a section is scanned. Can be
+        overridden to build any per scan state the check needs up front.
+
+        :param section: Section name about to be scanned
+        :type section: str
+        """
+        pass
+
+    def refresh(self, section, paths):
+        """ Called by the scanner before only some entries of a section are checked again,
+        eg. the settled entries in watch mode. By default the section is prepared again.
+
+        :param section: Section name the entries belong to
+        :type section: str
+        :param paths: Top level entries about to be checked
+        :type paths: Path[]
+        """
+        self.prepare(section)
+
     def __call__(self, section, path):
         """ Base method that must be overridden
 
@@ -35,6 +70,26 @@ class BaseCheck(object):
         """
         raise NotImplemented('__call__ method must be overridden.')
 
+    def checkBatch(self, section, table):
+        """ Check a whole batch of entries at once. By default the check is called once per
+        entry, checks which can evaluate the batch with a few column operations override it.
+
+        :param section: Section name being used
+        :type section: str
+        :param table: Entries to check
+        :type table: EntryTable
+        :return: Result of each entry in row order: False, a operation or list of operations,
+        or the CheckError (or CheckSkip) raised for it
+        :rtype: list
+        """
+        results = []
+        for path in table.paths:
+            try:
+                results.append(self(section, path))
+            except CheckError as err:
+                results.append(err)
+        return results
+
     def __str__(self):
         return self.__class__.__name__
 
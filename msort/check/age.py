@@ -4,15 +4,27 @@ Module to scan for empty folders and directories
 from time import time
 
 from msort.check import BaseCheck, CheckSkip
+from msort.table import nonzero
 
 class AgeCheck(BaseCheck):
     """
     A simple checker which will validate a file or folders age.
     """
     def __call__(self, section, path):
-        if self.conf.getboolean('minimum_age', 'enabled'):
-            min_age = self.conf.getint('minimum_age', 'days') * 86400
+        general = self.conf.general
+        if general.min_age_enabled:
             file_age = time() - path.age
-            if file_age <= min_age:
+            if file_age <= general.min_age:
                 raise CheckSkip('Path does not meet minimum age requirements: {0}'.format(path))
 
+    def checkBatch(self, section, table):
+        general = self.conf.general
+        if not general.min_age_enabled:
+            return [False] * len(table)
+        young = table.mtime >= time() - general.min_age
+        results = table.results(young, lambda path: CheckSkip('Path does not meet minimum age requirements: {0}'.format(path)))
+        # A NaN mtime is never young, entries which cant be stat'd are skipped instead
+        for i in nonzero(~table.valid):
+            results[i] = CheckSkip('Could not stat path: {0}'.format(table.paths[i]))
+        return results
+
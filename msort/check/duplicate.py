@@ -0,0 +1,342 @@
+"""
+Module to find files duplicated across the sources and destinations of all the scanned sections
+"""
+import mmap
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from os import scandir as realscandir, lstat, sep
+from os.path import abspath, dirname
+from stat import S_ISDIR, S_ISREG
+from threading import Lock
+
+from msort.check import BaseCheck, CheckError
+from msort.filesystem import is_internal, parse_size
+from msort.index import HashCache
+from msort.operation import DuplicateOperation
+
+MiB = 1024 ** 2
+
+# Files larger than this are compared by their first and last MiB before being hashed in full
+PARTIAL_SPAN = 2 * MiB
+
+FileInfo = namedtuple('FileInfo', 'path device inode mtime size')
+
+def walk_files(root):
+    """ Yield every regular file under root, without following symbolic links or descending
+    into the trash and partial copies
+
+    :param root: Directory to walk
+    :type root: str
+    :rtype: FileInfo[]
+    """
+    stack = [root]
+    while stack:
+        try:
+            entries = list(realscandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if is_internal(entry.name):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    yield FileInfo(entry.path, st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+            except OSError:
+                continue
+
+def walk_entry(path):
+    """ Yield the regular files of a entry, the entry itself if it is one
+
+    :param path: File or directory
+    :type path: str
+    :rtype: FileInfo[]
+    """
+    try:
+        st = lstat(path)
+    except OSError:
+        return
+    if S_ISDIR(st.st_mode):
+        for info in walk_files(path):
+            yield info
+    elif S_ISREG(st.st_mode):
+        yield FileInfo(path, st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+
+def partial_hash(path):
+    """ Hash the first and last MiB of a file through a read only memory map
+
+    :param path: File to hash
+    :type path: str
+    :return: Hex digest
+    :rtype: str
+    """
+    digest = blake2b()
+    with open(path, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if len(data) <= PARTIAL_SPAN:
+                digest.update(data)
+            else:
+                digest.update(data[:MiB])
+                digest.update(data[-MiB:])
+    return digest.hexdigest()
+
+def full_hash(path, block_size=MiB):
+    """ Hash the whole contents of a file
+
+    :param path: File to hash
+    :type path: str
+    :param block_size: Bytes read at once
+    :type block_size: int
+    :return: Hex digest
+    :rtype: str
+    """
+    digest = blake2b()
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as fp:
+        while True:
+            read = fp.readinto(buf)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+class DuplicateCheck(BaseCheck):
+    """ Find identical files across the sources and destinations of all the scanned sections.
+
+    Files are narrowed down in stages, each only looking at what the last one left: files of
+    the same size, then those whose first and last MiB hash the same and finally those whose
+    full contents hash the same. Hashes are computed on a thread pool and cached by the
+    (inode, mtime, size) of the file. Hard links to the same inode are never duplicates.
+
+    Of every set of duplicates the copy outside the section sources, or else the oldest copy,
+    is kept. Copies the Pruner deletes are never kept. Only copies under a section source are
+    removed, or replaced by a hard link to the kept copy when it is on the same device.
+
+    The roots are searched once per run, see begin. Entries checked again in watch mode are
+    only compared to the files found by that search, see refresh.
+    """
+
+    def __init__(self, config, pruner=None):
+        """
+        :param config: Configuration Instance
+        :type config: Config
+        :param pruner: Registered Pruner, whose victims are never kept
+        :type pruner: Pruner
+        """
+        super(DuplicateCheck, self).__init__(config)
+        self.pruner = pruner
+        self.link = self.conf.getSafe('duplicates', 'action', 'delete') == 'link'
+        try:
+            self.min_size = max(1, parse_size(self.conf.getSafe('duplicates', 'min_size', '1M')))
+        except ValueError as err:
+            raise CheckError('Invalid duplicates min_size: {0}'.format(err))
+        self.threads = self.conf.getIntSafe('duplicates', 'threads', 4)
+        self.cache = HashCache(self.conf.getHashCachePath())
+        self._lock = Lock()
+        self._searched = False
+        # Files of the last search by size, and the paths and inodes seen by it
+        self._files = {}
+        self._seen = set()
+        self._inodes = set()
+        self._redundant = []
+        self._kept = {}
+        self._emitted = set()
+
+    def roots(self):
+        """ Get the distinct source and destination directories of the scanned sections,
+        leaving out any nested in another one
+
+        :return: (roots, sources)
+        :rtype: tuple
+        """
+        sources, paths = set(), set()
+        for section in self.conf.filteredSections():
+            settings = self.conf.settings(section)
+            if settings.source:
+                sources.add(abspath(settings.source))
+            paths.update([abspath(path) for path in (settings.source, settings.dest) if path])
+        roots = [path for path in paths
+                 if not any([path.startswith(other + sep) for other in paths if other != path])]
+        return sorted(roots), sorted(sources)
+
+    def begin(self, sections):
+        # Every section of a run shares the result of a single search
+        with self._lock:
+            self._searched = False
+
+    def prepare(self, section):
+        with self._lock:
+            if not self._searched:
+                self.findDuplicates()
+
+    def refresh(self, section, paths):
+        with self._lock:
+            if self._searched:
+                self.findNew(paths)
+            else:
+                self.findDuplicates()
+
+    def hashAll(self, files, kind):
+        """ Hash the files on the thread pool, using the cached hashes where possible
+
+        :param files: Files to hash
+        :type files: FileInfo[]
+        :param kind: partial or full
+        :type kind: str
+        :return: Files grouped by (size, hash), only groups with more than one file
+        :rtype: FileInfo[][]
+        """
+        func = partial_hash if kind == 'partial' else full_hash
+        def digest(info):
+            fprint = (info.inode, info.mtime, info.size)
+            cached = self.cache.get(info.path, fprint, kind)
+            if cached is not None:
+                return cached
+            try:
+                value = func(info.path)
+            except (OSError, ValueError) as err:
+                self.log.warning('Could not hash {0}: {1}'.format(info.path, err))
+                return None
+            self.cache.set(info.path, fprint, kind, value)
+            return value
+        groups = {}
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for info, value in zip(files, pool.map(digest, files)):
+                if value is not None:
+                    groups.setdefault((info.size, value), []).append(info)
+        return [group for group in groups.values() if len(group) > 1]
+
+    def compare(self, candidates):
+        """ Narrow files of the same size down to the sets of identical files
+
+        :param candidates: Files sharing their size with another one
+        :type candidates: FileInfo[]
+        :return: Sets of duplicates
+        :rtype: FileInfo[][]
+        """
+        groups = self.hashAll(candidates, 'partial')
+        # Small files were hashed whole already
+        duplicates = [group for group in groups if group[0].size <= PARTIAL_SPAN]
+        large = [info for group in groups if group[0].size > PARTIAL_SPAN for info in group]
+        duplicates.extend(self.hashAll(large, 'full'))
+        return duplicates
+
+    def select(self, duplicates):
+        """ Pick the copy to keep of every set of duplicates, marking the other copies under the
+        section sources redundant
+
+        :param duplicates: Sets of duplicates
+        :type duplicates: FileInfo[][]
+        """
+        _, sources = self.roots()
+        in_source = lambda info: any([info.path.startswith(source + sep) for source in sources])
+        pruned = self.pruner.scheduled() if self.pruner and duplicates else set()
+        def is_pruned(info):
+            path = info.path
+            while path != dirname(path):
+                if path in pruned:
+                    return True
+                path = dirname(path)
+            return False
+        for group in duplicates:
+            group = [info for info in group if not is_pruned(info)]
+            # A copy is only removed while another one is left
+            if len(group) < 2:
+                continue
+            group.sort(key=lambda info: (in_source(info), info.mtime, info.path))
+            for info in group[1:]:
+                if in_source(info) and info.path not in self._kept:
+                    self._redundant.append(info.path)
+                    self._kept[info.path] = (info, group[0])
+        self._redundant.sort()
+
+    def _index(self, info):
+        if info.size < self.min_size or (info.device, info.inode) in self._inodes:
+            return False
+        self._inodes.add((info.device, info.inode))
+        self._files.setdefault(info.size, []).append(info)
+        return True
+
+    def findDuplicates(self):
+        """ Search all the roots for duplicate files """
+        roots, _ = self.roots()
+        self.cache.load()
+        self._files, self._seen, self._inodes = {}, set(), set()
+        for root in roots:
+            for info in walk_files(root):
+                self._seen.add(info.path)
+                self._index(info)
+        candidates = [info for group in self._files.values() if len(group) > 1 for info in group]
+        duplicates = self.compare(candidates)
+        self.cache.commit(self._seen)
+        self._redundant, self._kept, self._emitted = [], {}, set()
+        self.select(duplicates)
+        self._searched = True
+        self.log.info('Found {0} redundant copies in {1} sets of duplicates'.format(
+            len(self._redundant), len(duplicates)))
+
+    def findNew(self, paths):
+        """ Compare only the files of some entries to the files of the same size found by the
+        last search, instead of walking every root again
+
+        :param paths: Entries to look for duplicates of
+        :type paths: str[]
+        """
+        new = []
+        for path in paths:
+            for info in walk_entry(abspath(path)):
+                self._seen.add(info.path)
+                if self._index(info):
+                    new.append(info)
+        added = set([info.path for info in new])
+        candidates = {}
+        for size in set([info.size for info in new]):
+            group = []
+            for other in self._files[size]:
+                # Files found by the last search may have changed or be gone since
+                current = other if other.path in added else next(walk_entry(other.path), None)
+                if current is not None and current.size == size:
+                    group.append(current)
+            if len(group) > 1:
+                candidates[size] = group
+        duplicates = [group for group in self.compare([info for group in candidates.values() for info in group])
+                      if any([info.path in added for info in group])]
+        self.cache.commit(self._seen)
+        self.select(duplicates)
+        self.log.debug('Found {0} sets of duplicates of {1} new files'.format(len(duplicates), len(new)))
+
+    def operation(self, path):
+        """ Get the operation removing a redundant copy
+
+        :param path: Redundant file
+        :type path: str
+        :rtype: BaseOperation
+        """
+        info, original = self._kept[path]
+        link = self.link
+        if link and original.device != info.device:
+            self.log.debug('Cannot link across devices, deleting: {0}'.format(path))
+            link = False
+        fprint = (original.device, original.inode, original.size, original.mtime)
+        return DuplicateOperation(path, original.path, fprint, link, self.conf.general.delete_trash)
+
+    def __call__(self, section, path):
+        path = abspath(path)
+        prefix = path + sep
+        found = []
+        with self._lock:
+            start = bisect_left(self._redundant, path)
+            for redundant in self._redundant[start:]:
+                if redundant != path and not redundant.startswith(prefix):
+                    if redundant > prefix:
+                        break
+                    continue
+                if redundant not in self._emitted:
+                    self._emitted.add(redundant)
+                    found.append(redundant)
+        return [self.operation(redundant) for redundant in found]
@@ -1,19 +1,27 @@
 """
 Module to scan for empty folders and directories
 """
-from os.path import isdir, isfile, getsize
-
 from msort.check import BaseCheck, CheckError
-from msort.filesystem import dir_size
 from msort.operation import DeleteOperation
 
 class EmptyCheck(BaseCheck):
+    """ Check for empty files and directories, marking them for deletion. Not cacheable, the
+    mtime of a directory doesnt change when something deeper inside it is removed.
+    """
+
     def __call__(self, section, path):
-        if isdir(path):
-             empty = dir_size(path) == 0
-        elif isfile(path):
-            empty = getsize(path) == 0
+        if path.isdir or path.isfile:
+            empty = path.size == 0
         else:
             raise CheckError('Invalid file type, must be file or directory')
         if empty:
-            return DeleteOperation(path)
\ No newline at end of file
+            return DeleteOperation(path, self.conf.general.delete_trash)
+
+    def checkBatch(self, section, table):
+        valid = table.is_dir | table.is_file
+        results = table.results(~valid, lambda path: CheckError('Invalid file type, must be file or directory'))
+        for i, oper in enumerate(table.results(valid & (table.size == 0),
+                                               lambda path: DeleteOperation(path, self.conf.general.delete_trash))):
+            if oper:
+                results[i] = oper
+        return results
\ No newline at end of file
@@ -1,14 +1,32 @@
 """
-Provides a simple check based on lsof output to see if a path is in use by another process
+Provides a check to see if a path is in use by another process. On systems with a /proc
+filesystem the open files are read natively, otherwise the lsof output is used.
 """
+from os.path import basename
 from time import time
+from threading import Lock
 
 from msort.log import getLogger
 from msort.check import BaseCheck, CheckSkip
-from msort.system import call_output
+from msort.filesystem import Path
+from msort.system import call_output, has_proc, OpenFileIndex
 
 class InUseCheck(BaseCheck):
-    """ Check if the file being scanned is in use """
+    """ Check if the file being scanned is in use.
+
+    With the proc backend the open files of every process are read once per scanned section,
+    limited to the sections source root, into a OpenFileIndex. Checks made outside of a
+    prepared section scan use a index of all open files refreshed every cache_ttl seconds.
+    The lsof backend keeps the whole lsof output and does a substring search of it.
+
+    Before asking the backend two cheap tiers are tried using data the scanner already has:
+
+    - general->lock_pattern is matched against the name of the path and, for directories,
+      the names of its children. A match means the path is still in use.
+    - The newest mtime of the path and its direct children is compared to
+      general->inuse_active_seconds, anything modified more recently is in use, and
+      general->inuse_settled_seconds, anything untouched for longer is not.
+    """
     lsof_cache = ""
     cache_update = 0
     cache_ttl = 1
@@ -16,13 +34,94 @@ class InUseCheck(BaseCheck):
     def __init__(self, config):
         super(InUseCheck, self).__init__(config)
         self.log = getLogger(__name__)
+        self._lock = Lock()
+        self._indexes = {}
+        self._index = None
+        backend = self.conf.general.inuse_backend if self.conf else 'auto'
+        self.use_proc = backend == 'proc' or (backend == 'auto' and has_proc())
+
+    def prepare(self, section):
+        if self.use_proc:
+            index = OpenFileIndex(self.conf.getSourcePath(section))
+            with self._lock:
+                self._indexes[section] = index
+            self.log.debug('Indexed {0} open files under {1}'.format(len(index), index.root))
 
     def __call__(self, section, path):
-        t = time()
-        if t - self.cache_update > self.cache_ttl:
-            self.lsof_cache = str(call_output('lsof'))
-            self.cache_update = time()
-        if path in self.lsof_cache:
+        general = self.conf.general if self.conf else None
+        if general and (general.lock_rx or general.inuse_active_seconds or general.inuse_settled_seconds):
+            if not isinstance(path, Path):
+                path = Path(path)
+            if general.lock_rx and self.isLocked(path, general.lock_rx):
+                raise CheckSkip('Detected lock file, Skipping: {0}'.format(path))
+            active, settled = general.inuse_active_seconds, general.inuse_settled_seconds
+            if active or settled:
+                idle = time() - self.newestChange(path)
+                if active and idle < active:
+                    raise CheckSkip('Detected recently modified path, Skipping: {0}'.format(path))
+                if settled and idle >= settled:
+                    return False
+        if self.use_proc:
+            index = self._indexes.get(section)
+            in_use = path in (index if index is not None else self._currentIndex())
+        else:
+            in_use = path in self._currentLsof()
+        if in_use:
             raise CheckSkip('Detected In-Use path, Skipping: {0}'.format(path))
         return False
 
+    def isLocked(self, path, lock_rx):
+        """ Check if the path is a lock file or a directory holding one
+
+        :param path: Path to check
+        :type path: Path
+        :param lock_rx: Compiled lock file pattern
+        :type lock_rx: SRE_Pattern
+        :return: Locked status
+        :rtype: bool
+        """
+        if lock_rx.search(basename(path)):
+            return True
+        return any([lock_rx.search(basename(child)) for child in path.listing])
+
+    def newestChange(self, path):
+        """ Get the newest mtime of the path and its direct children
+
+        :param path: Path to check
+        :type path: Path
+        :return: Newest modification time
+        :rtype: float
+        """
+        newest = path.age
+        for child in path.listing:
+            try:
+                newest = max(newest, child.age)
+            except OSError:
+                # Removed while checking, which means the directory is still changing
+                return time()
+        return newest
+
+    def _currentIndex(self):
+        """ Get the index of all open files, refreshing it if its older than the cache_ttl
+
+        :return: Open file index
+        :rtype: OpenFileIndex
+        """
+        with self._lock:
+            # Only one scanning thread refreshes the shared cache at a time
+            if self._index is None or time() - self.cache_update > self.cache_ttl:
+                self._index = OpenFileIndex()
+                self.cache_update = time()
+            return self._index
+
+    def _currentLsof(self):
+        """ Get the lsof output, refreshing it if its older than the cache_ttl
+
+        :return: lsof output
+        :rtype: str
+        """
+        with self._lock:
+            if time() - self.cache_update > self.cache_ttl:
+                self.lsof_cache = str(call_output('lsof'))
+                self.cache_update = time()
+            return self.lsof_cache
@@ -1,39 +1,345 @@
 """
-A module used to archive or remove old directories
+Prunes releases matching the prune rules once they pass max_days, or oldest first until a
+free space target is met.
 """
-import re
+import json
+from bisect import insort
+from hashlib import sha1
+from heapq import merge
+from os import rename, getpid
+from os.path import join, dirname, basename, abspath
+from threading import Lock
 from time import time
-from os.path import join, isdir
 
-from msort.filesystem import listdir, Path
+from msort.filesystem import scandir, is_internal, disk_usage, dir_size, device_of, parse_size, fmt_size, Path
 from msort.operation import DeleteOperation
-from msort.check import BaseCheck
+from msort.trash import trash_size
+from msort.check import BaseCheck, CheckError
+from msort.table import nonzero
 
 DAY = 3600*24
 
+INDEX_VERSION = 1
+
+class PruneIndex(object):
+    """ Age ordered index of the entries matching the prune rules, kept per folder as
+    [mtime, name] lists sorted oldest first. A sorted list is a valid heap, so the oldest
+    entries of many folders can be merged lazily without sorting the whole archive.
+
+    A folder is only listed again when its own mtime changes, which happens whenever a entry
+    is added, removed or renamed in it. Entry mtimes can still move forward without that, so
+    the stored mtime is a lower bound and candidates must be stat'd again before use.
+    """
+    def __init__(self, path=None, digest=''):
+        """
+        :param path: JSON file to persist the index in between runs, None to keep it in memory
+        :type path: str
+        :param digest: Digest of the prune rules, a index built with other rules is discarded
+        :type digest: str
+        """
+        self.path = path
+        self.digest = digest
+        self._lock = Lock()
+        self._dirty = False
+        self._sections = {}
+        if path:
+            self.load()
+
+    def load(self):
+        """ Load the persisted index, a missing, corrupt or outdated index is ignored """
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION and data.get('rules') == self.digest:
+            self._sections = data['sections']
+
+    def save(self):
+        """ Write the index if it changed, through a temporary file so a crash never leaves a
+        partially written index behind
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = '{0}.{1}.tmp'.format(self.path, getpid())
+            with open(tmp_path, 'w') as fp:
+                json.dump({'version': INDEX_VERSION, 'rules': self.digest, 'sections': self._sections}, fp)
+            rename(tmp_path, self.path)
+            self._dirty = False
+
+    def entries(self, section, folder, match, files_only=False):
+        """ Get the indexed entries of a folder, listing it again only if it changed
+
+        :param section: Section the folder belongs to
+        :type section: str
+        :param folder: Folder to get the entries of
+        :type folder: Path
+        :param match: Called with each entry path, only entries it returns True for are indexed
+        :type match: callable
+        :param files_only: Ignore the sub directories of the folder
+        :type files_only: bool
+        :return: [mtime, name] pairs, oldest first
+        :rtype: list[]
+        """
+        try:
+            mtime = folder.age
+        except OSError:
+            return []
+        with self._lock:
+            folders = self._sections.setdefault(section, {})
+            cached = folders.get(folder)
+        if cached is not None and cached['mtime'] == mtime:
+            return cached['entries']
+        entries = []
+        for path in scandir(folder):
+            if is_internal(path) or (files_only and path.isdir) or not match(path):
+                continue
+            try:
+                entries.append([path.age, basename(path)])
+            except OSError:
+                continue
+        entries.sort()
+        with self._lock:
+            folders[folder] = {'mtime': mtime, 'entries': entries}
+            self._dirty = True
+        return entries
+
+    def touch(self, section, folder, name, mtime):
+        """ Move a entry found to be newer than indexed to its place in the age order
+
+        :param section: Section the folder belongs to
+        :type section: str
+        :param folder: Folder of the entry
+        :type folder: str
+        :param name: Entry name
+        :type name: str
+        :param mtime: Current entry mtime
+        :type mtime: float
+        """
+        with self._lock:
+            entries = self._sections[section][folder]['entries']
+            for i, (_, entry_name) in enumerate(entries):
+                if entry_name == name:
+                    del entries[i]
+                    break
+            insort(entries, [mtime, name])
+            self._dirty = True
+
+    def retain(self, section, folders):
+        """ Drop the folders of a section which no longer exist
+
+        :param section: Section to clean up
+        :type section: str
+        :param folders: Folders still present
+        :type folders: str[]
+        """
+        with self._lock:
+            indexed = self._sections.get(section, {})
+            for folder in set(indexed) - set(folders):
+                del indexed[folder]
+                self._dirty = True
+
+def _oldest(section, folder, entries):
+    return ((mtime, join(folder, name), section) for mtime, name in entries)
+
 class Pruner(BaseCheck):
     def __init__(self, config):
         super(Pruner, self).__init__(config)
-        self.rules = [re.compile(pat, re.I) for _, pat in self.conf.getRuleList('prune')]
+        self.rules = self.conf.settings('prune').rules
         self.ttl = self.conf.getint('prune', 'max_days') * DAY
+        free_target = self.conf.getSafe('prune', 'free_target', None)
+        try:
+            self.free_target = parse_size(free_target) if free_target else 0
+        except ValueError as err:
+            raise CheckError('Invalid prune free_target: {0}'.format(err))
+        digest = sha1(json.dumps(sorted(self.conf.getRuleList('prune'))).encode('utf-8')).hexdigest()
+        index_path = self.conf.getPruneIndexPath() if self.conf.getBooleanSafe('prune', 'index') else None
+        self.index = PruneIndex(index_path, digest)
+        self._lock = Lock()
+        self._victims = {}
+        # Extra paths selected to meet the free_target, per source device, see overTarget
+        self._target_lock = Lock()
+        self._selected = {}
+
+    def match(self, path):
+        return any([rule.match(path) for rule in self.rules])
+
+    def begin(self, sections):
+        # The free space target is met once per filesystem per run
+        with self._target_lock:
+            self._selected = {}
+
+    def refresh(self, section, paths):
+        self.begin([section])
+        self.prepare(section)
+
+    def folders(self, section):
+        """ Get the indexed entries of the folders of a section
+
+        :param section: Section name
+        :type section: str
+        :return: (folder, entries) pairs
+        :rtype: list[]
+        """
+        settings = self.conf.settings(section)
+        source = Path(self.conf.getSourcePath(section))
+        folders = [(source, self.index.entries(section, source, self.match, settings.sorted))]
+        if settings.sorted:
+            for path in scandir(source):
+                if path.isdir and not is_internal(path):
+                    folders.append((path, self.index.entries(section, path, self.match)))
+        self.index.retain(section, [folder for folder, _ in folders])
+        return folders
+
+    def prepare(self, section):
+        """ Find the entries to prune in a section. Only the indexed entries older than the
+        cutoff are looked at, unless the free space target has to be met.
+
+        :param section: Section about to be scanned
+        :type section: str
+        """
+        cutoff = time() - self.ttl
+        victims = []
+        for folder, entries in self.folders(section):
+            victims.extend(self.expired(section, folder, entries, cutoff))
+        if self.free_target:
+            victims.extend(self.overTarget(section).get(section, []))
+        self.index.save()
+        grouped = {}
+        for path in victims:
+            grouped.setdefault(dirname(path), set()).add(path)
+        with self._lock:
+            self._victims[section] = grouped
+
+    def expired(self, section, folder, entries, cutoff):
+        """ Get the entries of a folder older than the cutoff
+
+        :return: Expired paths
+        :rtype: Path[]
+        """
+        victims = []
+        # The index may be updated while walking it
+        for mtime, name in list(entries):
+            if mtime >= cutoff:
+                break
+            path = Path(join(folder, name))
+            try:
+                age = path.age
+            except OSError:
+                continue
+            if age < cutoff:
+                victims.append(path)
+            elif age != mtime:
+                self.index.touch(section, folder, name, age)
+        return victims
+
+    def overTarget(self, section):
+        """ Select the oldest entries across all the sections whose source is on the same
+        filesystem as the source of section, until deleting them along with their expired
+        entries frees enough space to reach the free_target. The trash of the filesystem is
+        counted as free, it is freed by the Reaper. The selection is only made once per
+        filesystem per run, see begin.
+
+        :param section: Section name
+        :type section: str
+        :return: Extra paths to delete by section
+        :rtype: dict
+        """
+        source = self.conf.getSourcePath(section)
+        device = device_of(source)
+        with self._target_lock:
+            selected = self._selected.get(device)
+            if selected is not None:
+                return selected
+            sections = [section]
+            for other in self.conf.filteredSections():
+                other_source = self.conf.settings(other).source
+                try:
+                    if other != section and other_source and device_of(other_source) == device:
+                        sections.append(other)
+                except OSError:
+                    continue
+            selected = self._selected[device] = dict([(other, []) for other in sections])
+            # Trashed entries still use their space until the Reaper removes them
+            deficit = self.free_target - disk_usage(source).free - trash_size(source)
+            if deficit <= 0:
+                return selected
+            cutoff = time() - self.ttl
+            chosen, oldest = set(), []
+            for other in sections:
+                try:
+                    folders = self.folders(other)
+                except OSError as err:
+                    self.log.warning('Could not list the source of {0}: {1}'.format(other, err))
+                    continue
+                for folder, entries in folders:
+                    chosen.update(self.expired(other, folder, entries, cutoff))
+                    oldest.append(_oldest(other, folder, entries))
+            deficit -= sum([dir_size(path) for path in chosen])
+            extra = 0
+            for _, path, other in merge(*oldest):
+                if deficit <= 0:
+                    break
+                if path in chosen:
+                    continue
+                path = Path(path)
+                try:
+                    deficit -= dir_size(path)
+                except OSError:
+                    continue
+                selected[other].append(path)
+                extra += 1
+            self.log.info('Pruning {0} extra paths of {1} to reach the free space target of {2} on {3}'.format(
+                extra, ', '.join(sections), fmt_size(self.free_target), source))
+            return selected
+
+    def victims(self, section):
+        """ Get the paths to prune in a section, grouped by their parent directory
+
+        :param section: Section name
+        :type section: str
+        :rtype: dict
+        """
+        with self._lock:
+            victims = self._victims.get(section)
+        if victims is None:
+            self.prepare(section)
+            victims = self._victims[section]
+        return victims
+
+    def scheduled(self):
+        """ Get every path pruned in the scanned sections, preparing the sections not prepared
+        yet. Anything under one of them is deleted along with it.
+
+        :return: Absolute paths
+        :rtype: set
+        """
+        scheduled = set()
+        for section in self.conf.filteredSections():
+            for paths in self.victims(section).values():
+                scheduled.update([abspath(path) for path in paths])
+        return scheduled
 
     def __call__(self, section, path):
-        if isdir(path) and self.conf.isSorted(section):
-            results = []
-            for sub_dir in listdir(path):
-                res = self.checkAge(Path.join(path, sub_dir))
-                if res:
-                    results.append(res)
-            return results
-        else:
-            return self.checkAge(path)
-
-
-
-    def checkAge(self, path):
-        age_diff = int(time() - path.age)
-        if age_diff > self.ttl:
-            if any([rule.match(path) for rule in self.rules]):
-                return DeleteOperation(path)
+        victims = self.victims(section)
+        if path.isdir and self.conf.settings(section).sorted:
+            return [DeleteOperation(victim, self.conf.general.delete_trash)
+                    for victim in sorted(victims.get(path, ()))]
+        if path in victims.get(dirname(path), ()):
+            return DeleteOperation(path, self.conf.general.delete_trash)
         return False
 
+    def checkBatch(self, section, table):
+        victims = self.victims(section)
+        trash = self.conf.general.delete_trash
+        pruned = table.isin(set().union(*victims.values()))
+        if not self.conf.settings(section).sorted:
+            return table.results(pruned, lambda path: DeleteOperation(path, trash))
+        is_dir = table.is_dir
+        results = table.results(~is_dir & pruned, lambda path: DeleteOperation(path, trash))
+        for i in nonzero(is_dir & table.isin(set(victims))):
+            results[i] = [DeleteOperation(victim, trash) for victim in sorted(victims[table.paths[i]])]
+        return results
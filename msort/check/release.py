@@ -1,10 +1,11 @@
 """
 Module help filter based on release/folder/file names
 """
-import re
-from os.path import basename, join, isfile
+from os.path import basename, join
+from threading import Lock
 
 from msort.check import BaseCheck
+from msort.destination import DestinationIndex
 from msort.operation import MoveOperation, MoveContentsOperation
 from msort.transform import cleanup
 
@@ -12,16 +13,45 @@ class ReleaseCheck(BaseCheck):
     """
     This check will do matching against release names folders and the regex rules
     defined in the config.
+
+    The rules of each section, and the season rules, are compiled into a single RuleMatcher
+    by the config snapshot and only read while scanning, so a single instance can be shared
+    between concurrently scanned sections.
+
+    Sorted sections resolve the cleaned up show name against a DestinationIndex of the
+    destination, built once per scan, so releases land in the existing show folder even when
+    it is cased or punctuated differently.
     """
-    _rules = {}
-    _seasons = []
+    cacheable = True
 
     def __init__(self, config):
         super(ReleaseCheck, self).__init__(config)
-        for section in self.conf.filteredSections():
-            self._rules[section] = [re.compile(pat, re.I) for _, pat in self.conf.getRuleList(section)]
-        if not self._seasons:
-            self._seasons = [re.compile(pat, re.I) for _, pat in self.conf.getRuleList('seasons')]
+        self._lock = Lock()
+        self._indexes = {}
+
+    def prepare(self, section):
+        settings = self.conf.settings(section)
+        if settings.dest is not None and (settings.sorted or settings.sort_seasons):
+            index = DestinationIndex(settings.dest)
+            with self._lock:
+                self._indexes[section] = index
+            self.log.debug('Indexed {0} folders in {1}'.format(len(index), settings.dest))
+
+    def getFolder(self, section, name):
+        """ Get the destination folder of a cleaned up name
+
+        :param section: Section name
+        :type section: str
+        :param name: Cleaned up folder name
+        :type name: str
+        :return: Full destination folder path
+        :rtype: str
+        """
+        with self._lock:
+            index = self._indexes.get(section)
+        if index is None:
+            return self.conf.getDestPath(section, name)
+        return index.resolve(name)
 
     def __call__(self, section, path):
         for method in ('getSeasonMatch', 'getReleaseMatch'):
@@ -30,50 +60,47 @@ class ReleaseCheck(BaseCheck):
                 return oper
 
     def getSeasonMatch(self,section, path):
-        if not self.conf.getboolean(section, 'sort_seasons'):
+        if not self.conf.settings(section).sort_seasons:
             return False
         is_season = self.isSeason(path)
         if is_season:
             full_name = is_season.groupdict()['name']
             parsed_name = cleanup(basename(full_name))
-            dest = self.conf.getDestPath(section, parsed_name)
+            dest = self.getFolder(section, parsed_name)
             oper = MoveContentsOperation(path, dest)
             return oper
 
     def getReleaseMatch(self, section, path):
-        for pattern in self._rules[section]:
-            match = pattern.search(path)
-            if match:
-                try:
-                    if self.conf.isSorted(section):
-                        full_name = match.groupdict()['name']
-                        parsed_name = cleanup(basename(full_name))
-                        dest = self.conf.getDestPath(section, parsed_name)
-                        full_dest = join(dest, basename(path))
-                        return MoveOperation(path, full_dest)
-                    else:
-                        dest = self.conf.getDestPath(section)
-                        if join(dest, basename(path)) == path:
-                            # Make sure the final destination isnt the same as the given path
-                            return False
-                    return MoveOperation(path, dest)
-                except KeyError:
-                    self.log.warn('Pattern matched, but no "name" group was found')
+        settings = self.conf.settings(section)
+        match = settings.matcher.search(path)
+        while match:
+            try:
+                if settings.sorted:
+                    full_name = match.groupdict()['name']
+                    parsed_name = cleanup(basename(full_name))
+                    dest = self.getFolder(section, parsed_name)
+                    full_dest = join(dest, basename(path))
+                    return MoveOperation(path, full_dest)
+                else:
+                    dest = self.conf.getDestPath(section)
+                    if join(dest, basename(path)) == path:
+                        # Make sure the final destination isnt the same as the given path
+                        return False
+                return MoveOperation(path, dest)
+            except KeyError:
+                self.log.warn('Pattern matched, but no "name" group was found')
+                match = settings.matcher.search(path, match.index + 1)
         return False
 
     def isSeason(self, path):
         """ Check if the path it a season folder
 
-        :param path:
-        :type path:
-        :return:
-        :rtype:
+        :param path: Path to check
+        :type path: str
+        :return: Match of the first season rule matched, if any
+        :rtype: RuleMatch
         """
-        match = False
-        for pattern in self._seasons:
-            match = pattern.search(path)
-            if match:
-                self.log.debug('Matched a season!')
-                break
+        match = self.conf.settings('seasons').matcher.search(path)
+        if match:
+            self.log.debug('Matched a season!')
         return match
-
@@ -3,10 +3,12 @@ try:
     from configparser import ConfigParser, NoOptionError, NoSectionError
 except ImportError:
     from ConfigParser import SafeConfigParser as ConfigParser, NoOptionError, NoSectionError
-from os.path import expanduser, join, exists
-from re import IGNORECASE, compile as rxcompile
+from collections import namedtuple
+from os.path import expanduser, join, exists, dirname
+from re import compile as rxcompile, error as RegexError
 
 from msort.log import getLogger
+from msort.matcher import RuleMatcher
 
 class ConfigError(Exception):
     """
@@ -14,13 +16,28 @@ class ConfigError(Exception):
     """
     pass
 
+# Frozen, typed snapshots of the config used by the checkers while scanning
+GeneralSettings = namedtuple('GeneralSettings', 'scan_sections error_continue lock_rx inuse_backend '
+                                                'inuse_active_seconds inuse_settled_seconds '
+                                                'min_age_enabled min_age delete_trash scan_order scan_chunk '
+                                                'scan_batch')
+SectionSettings = namedtuple('SectionSettings', 'name source dest enabled sorted sort_seasons rules matcher')
+
 class Config(ConfigParser):
     """Simple configuration class based on RawConfigParser which will
     load the config file and create one if it doesnt exist.
 
     It will also parse out the regex values into proper compiled regex
-    instances."""
+    instances.
+
+    A frozen snapshot of the general settings and of every section, with the booleans and
+    ints parsed and the rules compiled, is built once at load time. Lookups on the scanning
+    hot path should go through general and settings() instead of the ConfigParser
+    accessors. Changing the config through set() and friends rebuilds the snapshot.
+    """
     skip = ('general', 'ignored', 'logging', 'cleanup')
+    _general = None
+    _settings = None
 
     def __init__(self, config_path="~/.msort.conf"):
         """ Initialize the configuration. If a existing one doesnt exit a new one will be created
@@ -33,12 +50,122 @@ class Config(ConfigParser):
         ConfigParser.__init__(self)
         self.log = getLogger(__name__)
         config_path = expanduser(config_path)
+        self.path = config_path
         if not exists(config_path):
             raise ConfigError('Invalid config file, doesnt exist: {0}'.format(config_path))
         self.log.debug('Reading config: {0}'.format(config_path))
         self.read(config_path)
+        self.compile()
         self._rules = self.parseRules()
 
+    def compile(self):
+        """ Build the frozen snapshots of the general settings and all the sections
+
+        :raises: ConfigError
+        """
+        settings = {}
+        for section in self.sections():
+            patterns = []
+            for option in self.options(section):
+                if option.startswith('rx'):
+                    patterns.append(self.get(section, option))
+                    try:
+                        rxcompile(patterns[-1])
+                    except RegexError as err:
+                        raise ConfigError('Invalid regex in section {0} option {1}: {2}'.format(section, option, err))
+            try:
+                matcher = RuleMatcher(patterns)
+            except RegexError as err:
+                raise ConfigError('Invalid regex in section {0}: {1}'.format(section, err))
+            settings[section] = SectionSettings(
+                name=section,
+                source=self.getSafe(section, 'source', None),
+                dest=self.getSafe(section, 'dest', None),
+                enabled=self.getBooleanSafe(section, 'enabled', True),
+                sorted=self.getBooleanSafe(section, 'sorted'),
+                sort_seasons=self.getBooleanSafe(section, 'sort_seasons'),
+                rules=tuple(matcher),
+                matcher=matcher
+            )
+        lock_rx = None
+        if self.getBooleanSafe('general', 'lock_enabled'):
+            try:
+                lock_rx = rxcompile(self.get('general', 'lock_pattern'))
+            except (NoSectionError, NoOptionError):
+                raise ConfigError('Missing option lock_pattern in section general, required by lock_enabled')
+            except RegexError as err:
+                raise ConfigError('Invalid regex in section general option lock_pattern: {0}'.format(err))
+        scan_sections = self.getSafe('general', 'scan_sections', None)
+        scan_order = self.getSafe('general', 'scan_order', 'sorted')
+        if scan_order not in ('sorted', 'unordered'):
+            raise ConfigError('Invalid scan_order, must be sorted or unordered: {0}'.format(scan_order))
+        general = GeneralSettings(
+            scan_sections=frozenset(scan_sections.split(',')) if scan_sections is not None else None,
+            error_continue=self.getBooleanSafe('general', 'error_continue'),
+            lock_rx=lock_rx,
+            inuse_backend=self.getSafe('general', 'inuse_backend', 'auto'),
+            inuse_active_seconds=self.getIntSafe('general', 'inuse_active_seconds'),
+            inuse_settled_seconds=self.getIntSafe('general', 'inuse_settled_seconds'),
+            min_age_enabled=self.getBooleanSafe('minimum_age', 'enabled'),
+            min_age=self.getIntSafe('minimum_age', 'days') * 86400,
+            delete_trash=self.getSafe('general', 'delete_mode', 'inline') == 'trash',
+            scan_order=scan_order,
+            scan_chunk=self.getIntSafe('general', 'scan_chunk'),
+            scan_batch=self.getIntSafe('general', 'scan_batch')
+        )
+        self._settings, self._general = settings, general
+
+    @property
+    def general(self):
+        """ Get the snapshot of the general settings
+
+        :return: General settings
+        :rtype: GeneralSettings
+        """
+        if self._general is None:
+            self.compile()
+        return self._general
+
+    def settings(self, section):
+        """ Get the snapshot of a section
+
+        :param section: Config section name
+        :type section: str
+        :return: Section settings
+        :rtype: SectionSettings
+        :raises: NoSectionError
+        """
+        if self._settings is None:
+            self.compile()
+        try:
+            return self._settings[section]
+        except KeyError:
+            raise NoSectionError(section)
+
+    def _invalidate(self):
+        """ Drop the snapshots, they are rebuilt on the next lookup """
+        self._general = self._settings = None
+
+    def read(self, *args, **kwargs):
+        self._invalidate()
+        return ConfigParser.read(self, *args, **kwargs)
+
+    def set(self, section, option, value=None):
+        ConfigParser.set(self, section, option, value)
+        self._invalidate()
+
+    def remove_option(self, section, option):
+        self._invalidate()
+        return ConfigParser.remove_option(self, section, option)
+
+    def add_section(self, section):
+        ConfigParser.add_section(self, section)
+        self._invalidate()
+
+    def remove_section(self, section):
+        self._invalidate()
+        return ConfigParser.remove_section(self, section)
+
     def getRules(self):
         """Return the loaded ruleset
 
@@ -77,11 +204,9 @@ class Config(ConfigParser):
         :return: List of regular expressions
         :rtype: list
         """
-        regexList = []
         if self.has_section(section):
-            for item, value in self._rxFilter(self.items(section)):
-                regexList.append(rxcompile(value, IGNORECASE))
-        return regexList
+            return list(self.settings(section).rules)
+        return []
 
     def _rxFilter(self, iter):
         """ Filter to only regex items
@@ -98,8 +223,10 @@ class Config(ConfigParser):
         :return: Filtered sections
         :rtype: check
         """
-        return filter(lambda s: s in self.get('general', 'scan_sections').split(',')
-            and self.sectionEnabled(s), self.sections())
+        scan_sections = self.general.scan_sections
+        if scan_sections is None:
+            raise NoOptionError('scan_sections', 'general')
+        return filter(lambda s: s in scan_sections and self.settings(s).enabled, self.sections())
 
     def sectionEnabled(self, section):
         """ Fetch and return the "enabled" status of the supplied section.
@@ -110,8 +237,8 @@ class Config(ConfigParser):
         :rtype: bool
         """
         try:
-            return self.getboolean(section, 'enabled')
-        except Exception as err:
+            return self.settings(section).enabled
+        except NoSectionError:
             return True
 
     def getNextRxId(self, section, find_id=1):
@@ -141,6 +268,38 @@ class Config(ConfigParser):
             return self.get(section, option)
         return default
 
+    def getBooleanSafe(self, section, option, default=False):
+        """ Get a boolean config value providing a default value if it doesnt exist or
+        cant be parsed
+
+        :param section: Config section name
+        :type section: string
+        :param option: Config option name
+        :param default: bool
+        :return: config value
+        :rtype: bool
+        """
+        try:
+            return self.getboolean(section, option)
+        except (NoSectionError, NoOptionError, ValueError):
+            return default
+
+    def getIntSafe(self, section, option, default=0):
+        """ Get a integer config value providing a default value if it doesnt exist or
+        cant be parsed
+
+        :param section: Config section name
+        :type section: string
+        :param option: Config option name
+        :param default: int
+        :return: config value
+        :rtype: int
+        """
+        try:
+            return self.getint(section, option)
+        except (NoSectionError, NoOptionError, ValueError):
+            return default
+
     def addRule(self, section, rule):
         """ Add a new regex rule to the configuration of a given section
 
@@ -157,16 +316,54 @@ class Config(ConfigParser):
     def getRuleList(self, section):
         return self._rxFilter(self.items(section))
 
+    def getIndexPath(self):
+        """ Get the location of the persistent scan index, by default next to the config file
+
+        :return: Index database path
+        :rtype: str
+        """
+        return expanduser(self.getSafe('general', 'scan_index_path', join(dirname(self.path), '.msort.index')))
+
+    def getJournalPath(self):
+        """ Get the location of the operation journal, by default next to the config file
+
+        :return: Journal path
+        :rtype: str
+        """
+        return expanduser(self.getSafe('general', 'journal_path', join(dirname(self.path), '.msort.journal')))
+
+    def getPruneIndexPath(self):
+        """ Get the location of the prune index, by default next to the config file
+
+        :return: Prune index path
+        :rtype: str
+        """
+        return expanduser(self.getSafe('prune', 'index_path', join(dirname(self.path), '.msort.prune')))
+
+    def getHashCachePath(self):
+        """ Get the location of the duplicate check hash cache, by default next to the config file
+
+        :return: Hash cache database path
+        :rtype: str
+        """
+        return expanduser(self.getSafe('duplicates', 'cache_path', join(dirname(self.path), '.msort.hashes')))
+
     def getSourcePath(self, section):
-        return self.get(section, 'source')
+        source = self.settings(section).source
+        if source is None:
+            raise NoOptionError('source', section)
+        return source
 
     def getDestPath(self, section, filename=None):
-        return join(self.get(section, 'dest'), filename if filename else '')
+        dest = self.settings(section).dest
+        if dest is None:
+            raise NoOptionError('dest', section)
+        return join(dest, filename if filename else '')
 
     def isSorted(self, section, default=False):
         try:
-            return self.getboolean(section, 'sorted')
-        except Exception:
+            return self.settings(section).sorted
+        except NoSectionError:
             return default
 
 DEFAULT_CONF_FILE = """[general]
@@ -176,17 +373,62 @@ lock_enabled = true
 lock_pattern = ^\.(incomplete|lock|locked)
 new_pattern  = ^(.+?\.){2,}.+?-(.*)$
 error_continue=false
+# In-use detection backend: auto, proc or lsof
+inuse_backend = auto
+# Paths modified within this many seconds are treated as in use without asking the backend
+inuse_active_seconds = 0
+# Paths untouched for this many seconds are treated as settled without asking the backend
+inuse_settled_seconds = 0
+# Remember entries checks found nothing for, skipping them until they change
+scan_index = false
+# inline removes deleted paths right away, trash renames them into a .msort-trash directory
+# at the root of their filesystem and removes them in the background at idle I/O priority
+delete_mode = inline
+# sorted checks the entries of a source in reverse name order, unordered checks them in directory
+# order without holding the listing in memory
+scan_order = sorted
+# Sort at most this many entries in memory at once, spilling the rest to temporary files, 0 for no limit
+scan_chunk = 0
+# Check the entries in batches of this many, letting checks compare whole columns of entry attributes
+# at once, 0 to check them one at a time. A batch is checked against the state from before the
+# operations --stream executes for it
+scan_batch = 0
+# Record the operations and their progress so a interrupted run can be continued with --resume
+journal = true
 
 [cleanup]
 enable = true
 delete_empty = true
 rx1=(\.avi|\.mkv)$
 
+[prune]
+enabled = false
+max_days = 14
+# Keep the age ordered index of the prunable entries between runs, at index_path or next to this file
+index = true
+# Also prune the oldest matching entries until this much space is free, eg. 50G, unset to disable
+#free_target = 50G
+rx1=(?P<name>.+?)\.\d{4}.\d{2}\.\d{2}.+HDTV
+
+[duplicates]
+# Find files duplicated across the sources and destinations of the scanned sections
+enabled = false
+# delete removes the redundant copies, link replaces them with hard links to the kept copy
+action = delete
+# Files smaller than this are never compared
+min_size = 1M
+# Number of files hashed at the same time
+threads = 4
+
 [logging]
 enabled=true
 # NOTSET = 0 | DEBUG = 10 | INFO = 20 | WARN = 30 | ERROR = 40 | FATAL = 50
 level=10
 format="%(levelname)s %(message)s"
+# Log a summary of the skipped and matched entries every summary_interval seconds instead of a line
+# per entry, the per entry lines are still logged at debug level
+summarize = false
+summary_interval = 10
 
 [ignored]
 rx1=(.avi|.mkv)$
@@ -0,0 +1,67 @@
+"""
+Index of the folders of a section destination, used to sort releases into the folder which
+already exists for a show even when its name is cased or punctuated differently.
+"""
+import re
+from os.path import join
+from threading import Lock
+
+from msort.filesystem import scandir
+from msort.log import getLogger
+
+_non_alnum = re.compile(r'[\W_]+', re.UNICODE)
+
+def canonical(name):
+    """ Reduce a folder name to the key it is resolved by, ignoring case and punctuation,
+    so Top.Gear, Top.gear and Top Gear all share a key
+
+    :param name: Folder name
+    :type name: str
+    :return: Lower case name without any punctuation or whitespace
+    :rtype: str
+    """
+    return _non_alnum.sub('', name.lower())
+
+class DestinationIndex(object):
+    """ The folders of a destination keyed by their canonical name, built from a single listing.
+    Names resolved to a folder which doesnt exist yet are remembered, so every release of a new
+    show resolves to the same folder too.
+    """
+    def __init__(self, dest):
+        """
+        :param dest: Destination directory to index
+        :type dest: str
+        """
+        self.log = getLogger(__name__)
+        self.dest = dest
+        self._lock = Lock()
+        self._folders = {}
+        try:
+            for path in sorted(scandir(dest)):
+                if path.isdir:
+                    name = path[len(join(dest, '')):]
+                    key = canonical(name)
+                    if key in self._folders:
+                        self.log.warning('Folders {0} and {1} in {2} only differ by case or punctuation'.format(
+                            self._folders[key], name, dest))
+                    else:
+                        self._folders[key] = name
+        except OSError as err:
+            self.log.debug('Could not list destination {0}: {1}'.format(dest, err))
+
+    def __len__(self):
+        return len(self._folders)
+
+    def resolve(self, name):
+        """ Get the full path of the folder a cleaned up name should be sorted into
+
+        :param name: Cleaned up folder name
+        :type name: str
+        :return: Path of the existing folder sharing the canonical name, if any, else of name
+        :rtype: str
+        """
+        key = canonical(name)
+        if not key:
+            return join(self.dest, name)
+        with self._lock:
+            return join(self.dest, self._folders.setdefault(key, name))
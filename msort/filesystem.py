@@ -2,20 +2,99 @@
 Provied capabilities related to the filesystem
 """
 from collections import namedtuple
-from os import statvfs, listdir as reallistdir, stat
-from os.path import join, getsize, isdir, isfile
+from heapq import merge
+from tempfile import TemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from errno import EEXIST, ENOSYS, EXDEV, EINVAL, EOPNOTSUPP, EBADF
+from os import statvfs, listdir as reallistdir, stat, lstat, rename, remove, mkdir, symlink, readlink, sep, fsencode, fsdecode
+try:
+    from os import scandir as realscandir
+except ImportError:
+    from scandir import scandir as realscandir
+from os.path import join, isdir, abspath, dirname, exists, basename
+from shutil import copyfileobj, copystat, rmtree
+from stat import S_ISDIR, S_ISREG, S_ISLNK
+try:
+    from os import fwalk, unlink, rmdir
+except ImportError:
+    fwalk = None
+try:
+    from os import copy_file_range
+except ImportError:
+    copy_file_range = None
+try:
+    from os import sendfile
+except ImportError:
+    sendfile = None
 
-from msort.log import getLogger
+from msort.log import getLogger, LogSummary
 from msort.check import BaseCheck, CheckError, CheckSkip
+from msort.index import fingerprint
+from msort.table import EntryTable
+
+class CheckerStats(object):
+    """ Timing and outcome counters of a single registered checker """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.matches = 0
+        self.skips = 0
+        self.errors = 0
+        # Calls avoided thanks to the scan index
+        self.cached = 0
+
+    def record(self, elapsed, calls=1):
+        """ Record the wall time of a call, a batch counts as one call per entry but as a
+        single call for max_time
+
+        :param elapsed: Seconds the call took
+        :type elapsed: float
+        :param calls: Number of entries checked by the call
+        :type calls: int
+        """
+        self.calls += calls
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+class SectionStats(object):
+    """ Timing of the scan of a single section """
+
+    def __init__(self):
+        self.entries = 0
+        # Time spent listing and sorting the source
+        self.enumerate_time = 0.0
+        self.total_time = 0.0
 
 class DirectoryScanner(object):
     """
     High-Level Class used to scan and check paths using the registered checkers
+
+    The scanner keeps per checker and per section counters, see checkerStats, sectionStats
+    and summary. They cost a clock read per checker call and are always on.
     """
-    def __init__(self, config):
+    def __init__(self, config, index=None):
+        """ Setup the scanner
+
+        :param config: Configuration instance
+        :type config: Config
+        :param index: Optional persistent index used to skip unchanged entries
+        :type index: ScanIndex
+        """
         self.log = getLogger(__name__)
         self._checks = []
         self.conf = config
+        self.index = index
+        self.checkerStats = {}
+        self.sectionStats = {}
+        self._stats_lock = Lock()
+        self.summary_log = None
+        if config is not None and config.getBooleanSafe('logging', 'summarize'):
+            self.summary_log = LogSummary(self.log, config.getIntSafe('logging', 'summary_interval', 10), 'Entries')
 
     def registerChecker(self, checker):
         """ Register a new checker instance to be used when scanning directories.
@@ -27,9 +106,10 @@ class DirectoryScanner(object):
         if not isinstance(checker, BaseCheck):
             raise TypeError('Checker passed must be a instance of BaseCheck')
         if checker.__class__.__name__ in [c.__class__.__name__ for c in self._checks]:
-            self.log.warn('Check already loaded, skipping: {0}'.format(checker.__class__.__name__))
+            self.log.warning('Check already loaded, skipping: %s', checker.__class__.__name__)
         self._checks.append(checker)
-        self.log.info('Registered check instance: {0}'.format(checker.__class__.__name__))
+        self.checkerStats.setdefault(str(checker), CheckerStats())
+        self.log.info('Registered check instance: %s', checker.__class__.__name__)
 
     def find(self, section):
         """ Scan the source directory of the supplied section. For each node found
@@ -42,34 +122,309 @@ class DirectoryScanner(object):
         :return: list of BaseOperations to be executed upon users discretion
         :rtype: list
         """
+        return list(self.iterFind(section))
+
+    def iterAll(self, sections):
+        """ Scan the supplied sections one after the other, yielding the operations as
+        they are found, see iterFind.
+
+        :param sections: Section names to scan
+        :type sections: list
+        :return: generator of (section, operation) tuples
+        :rtype: generator
+        """
+        sections = list(sections)
+        self.begin(sections)
+        for section in sections:
+            for oper in self.iterFind(section):
+                yield section, oper
+
+    def begin(self, sections):
+        """ Start a new run over the supplied sections, see BaseCheck.begin. Called by iterAll
+        and findAll, a caller scanning sections with find or iterFind calls it itself.
+
+        :param sections: Section names the run scans
+        :type sections: list
+        """
+        for checker in self._checks:
+            checker.begin(sections)
+
+    def iterFind(self, section):
+        """ Scan the source directory of the supplied section like find, yielding each
+        operation as soon as it is found instead of collecting them. Entries are only
+        checked when the next operation is asked for, so a consumer executing operations
+        as they come lets the checks see the state left by the earlier operations. With
+        general->scan_batch set the entries are checked that many at a time, see checkTable,
+        so the entries of a batch only see the state left by the operations of earlier batches.
+
+        :param section: Section name to get the scan directory from
+        :type section: str
+        :return: generator of BaseOperations
+        :rtype: generator
+        """
         path = self.conf.getSourcePath(section)
+        self.log.warning('Starting scan of section %s: %s', section, path)
+        started = perf_counter()
+        for checker in self._checks:
+            checker.prepare(section)
+        if self.index:
+            self.index.load(section)
+        general = self.conf.general
+        entries = iter_entries(path, general.scan_order, general.scan_chunk)
+        enumerate_time = 0.0
+        count = 0
+        batch = []
+        while True:
+            # Entries stream in while checking, only the time spent listing is counted
+            listed = perf_counter()
+            try:
+                file_name = next(entries)
+            except StopIteration:
+                enumerate_time += perf_counter() - listed
+                break
+            enumerate_time += perf_counter() - listed
+            if is_internal(file_name):
+                continue
+            count += 1
+            if general.scan_batch:
+                batch.append(file_name)
+                if len(batch) >= general.scan_batch:
+                    for oper in self.checkTable(section, EntryTable(batch)):
+                        yield oper
+                    batch = []
+            else:
+                for oper in self.checkPath(section, file_name):
+                    yield oper
+        if batch:
+            for oper in self.checkTable(section, EntryTable(batch)):
+                yield oper
+        if self.index:
+            self.index.commit(section)
+        if self.summary_log:
+            self.summary_log.flush()
+        with self._stats_lock:
+            stats = self.sectionStats.setdefault(section, SectionStats())
+            stats.entries += count
+            stats.enumerate_time += enumerate_time
+            stats.total_time += perf_counter() - started
+
+    def findPaths(self, section, paths):
+        """ Run the registered checkers against only the given top level entries of a section,
+        used when the changed entries are already known, eg. from filesystem events. Entries
+        which no longer exist are ignored.
+
+        :param section: Section name the paths belong to
+        :type section: str
+        :param paths: Top level entries of the sections source
+        :type paths: Path[]
+        :return: list of BaseOperations to be executed upon users discretion
+        :rtype: list
+        """
         found = []
-        self.log.warn('Starting scan of section {0}: {1}'.format(section, path))
-        for file_name in reversed(sorted([Path(join(path, f)) for f in listdir(path)])):
-            self.log.debug('Scanning file: {0}'.format(file_name))
-            for checker in self._checks:
-                try:
-                    check_result = checker(section, file_name)
-                except CheckSkip as err:
-                    # Skip raised, stop checking this path and move on to the next
-                    self.log.warn(err)
-                    break
-                except CheckError as err:
-                    # Raise the error unless the general->error_continue config setting is true
-                    if not self.conf.getboolean('general', 'error_continue'):
-                        raise err
-                    self.log.error(err)
+        paths = [file_name for file_name in paths if exists(file_name) and not is_internal(file_name)]
+        for checker in self._checks:
+            checker.refresh(section, paths)
+        for file_name in paths:
+            found.extend(self.checkPath(section, file_name))
+        return found
+
+    def checkPath(self, section, file_name):
+        """ Run the registered checkers against a single path until one of them matches
+        or raises a skip. Cacheable checkers which found nothing for the same unchanged
+        entry on a previous run are skipped when a index is in use.
+
+        :param section: Section name the path belongs to
+        :type section: str
+        :param file_name: Path to check
+        :type file_name: Path
+        :return: list of BaseOperations found for the path
+        :rtype: list
+        """
+        found = []
+        fprint = None
+        self.log.debug('Scanning file: %s', file_name)
+        for checker in self._checks:
+            stats = self.checkerStats[str(checker)]
+            if self.index and checker.cacheable:
+                if fprint is None:
+                    fprint = fingerprint(file_name)
+                if fprint and self.index.isClean(section, file_name, checker, fprint):
+                    with self._stats_lock:
+                        stats.cached += 1
                     continue
+            started = perf_counter()
+            try:
+                check_result = checker(section, file_name)
+            except CheckSkip as err:
+                with self._stats_lock:
+                    stats.record(perf_counter() - started)
+                    stats.skips += 1
+                # Skip raised, stop checking this path and move on to the next
+                if self.summary_log:
+                    self.log.debug(err)
+                    self.summary_log.add('skipped by {0}'.format(checker))
                 else:
+                    self.log.warning(err)
+                break
+            except CheckError as err:
+                with self._stats_lock:
+                    stats.record(perf_counter() - started)
+                    stats.errors += 1
+                # Raise the error unless the general->error_continue config setting is true
+                if not self.conf.general.error_continue:
+                    raise err
+                self.log.error(err)
+                continue
+            else:
+                with self._stats_lock:
+                    stats.record(perf_counter() - started)
                     if check_result:
-                        if not type(check_result) == list:
-                            check_result = [check_result]
-                        for result in check_result:
-                            self.log.info('Check matched: {0}'.format(result))
-                            found.append(result)
-                        break
+                        stats.matches += 1
+                if check_result:
+                    if not type(check_result) == list:
+                        check_result = [check_result]
+                    for result in check_result:
+                        if self.summary_log:
+                            self.log.debug('Check matched: %s', result)
+                            self.summary_log.add('matched by {0}'.format(checker))
+                        else:
+                            self.log.info('Check matched: %s', result)
+                        found.append(result)
+                    break
+                elif self.index and checker.cacheable and fprint:
+                    self.index.markClean(section, file_name, checker, fprint)
         return found
 
+    def checkTable(self, section, table):
+        """ Run the registered checkers against a batch of entries, like checkPath does for
+        a single one. Each checker gets the entries no earlier checker matched or skipped in
+        a single checkBatch call.
+
+        :param section: Section name the entries belong to
+        :type section: str
+        :param table: Entries to check
+        :type table: EntryTable
+        :return: list of BaseOperations found for the entries, in entry order
+        :rtype: list
+        """
+        found = [None] * len(table)
+        pending = list(range(len(table)))
+        fprints = {}
+        for checker in self._checks:
+            if not pending:
+                break
+            stats = self.checkerStats[str(checker)]
+            rows = pending
+            if self.index and checker.cacheable:
+                rows = []
+                for row in pending:
+                    if row not in fprints:
+                        fprints[row] = fingerprint(table.paths[row])
+                    if fprints[row] and self.index.isClean(section, table.paths[row], checker, fprints[row]):
+                        continue
+                    rows.append(row)
+                with self._stats_lock:
+                    stats.cached += len(pending) - len(rows)
+                if not rows:
+                    continue
+            started = perf_counter()
+            results = checker.checkBatch(section, table.take(rows) if len(rows) < len(table) else table)
+            with self._stats_lock:
+                stats.record(perf_counter() - started, len(rows))
+            done = set()
+            for row, result in zip(rows, results):
+                file_name = table.paths[row]
+                if isinstance(result, CheckSkip):
+                    with self._stats_lock:
+                        stats.skips += 1
+                    if self.summary_log:
+                        self.log.debug(result)
+                        self.summary_log.add('skipped by {0}'.format(checker))
+                    else:
+                        self.log.warning(result)
+                    done.add(row)
+                elif isinstance(result, CheckError):
+                    with self._stats_lock:
+                        stats.errors += 1
+                    if not self.conf.general.error_continue:
+                        raise result
+                    self.log.error(result)
+                elif result:
+                    with self._stats_lock:
+                        stats.matches += 1
+                    if not type(result) == list:
+                        result = [result]
+                    for oper in result:
+                        if self.summary_log:
+                            self.log.debug('Check matched: %s', oper)
+                            self.summary_log.add('matched by {0}'.format(checker))
+                        else:
+                            self.log.info('Check matched: %s', oper)
+                    found[row] = result
+                    done.add(row)
+                elif self.index and checker.cacheable and fprints.get(row):
+                    self.index.markClean(section, file_name, checker, fprints[row])
+            pending = [row for row in pending if row not in done]
+        return [oper for result in found if result for oper in result]
+
+    def findAll(self, sections, threads=1, mount_threads=1):
+        """ Scan all of the supplied sections, optionally at the same time on a bounded
+        thread pool. Sections whose source lives on the same device share a semaphore so
+        no more than mount_threads scans hit a single mount at once. The results are always
+        returned in the order of the sections given, regardless of which scan finished first.
+
+        Registered checkers are shared between the scanning threads and must be thread safe.
+
+        :param sections: Section names to scan
+        :type sections: list
+        :param threads: Maximum number of sections scanned at once
+        :type threads: int
+        :param mount_threads: Maximum number of sections scanned at once per source device
+        :type mount_threads: int
+        :return: list of (section, operations) tuples in section order
+        :rtype: list
+        """
+        sections = list(sections)
+        self.begin(sections)
+        if threads <= 1 or len(sections) <= 1:
+            return [(section, self.find(section)) for section in sections]
+        mount_locks = {}
+        section_locks = {}
+        for section in sections:
+            try:
+                device = stat(self.conf.getSourcePath(section)).st_dev
+            except OSError:
+                # Let find raise the error for the missing source
+                device = None
+            section_locks[section] = mount_locks.setdefault(device, BoundedSemaphore(mount_threads))
+
+        def scan(section):
+            with section_locks[section]:
+                return self.find(section)
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [(section, pool.submit(scan, section)) for section in sections]
+            return [(section, future.result()) for section, future in futures]
+
+    def summary(self):
+        """ Format the checker and section counters as a table
+
+        :return: Lines of the table
+        :rtype: str[]
+        """
+        lines = ['{0:<16} {1:>8} {2:>10} {3:>10} {4:>10} {5:>8} {6:>8} {7:>8} {8:>8}'.format(
+            'Checker', 'Calls', 'Total', 'Mean', 'Max', 'Matches', 'Skips', 'Errors', 'Cached')]
+        for name, stats in self.checkerStats.items():
+            mean = stats.total_time / stats.calls if stats.calls else 0
+            lines.append('{0:<16} {1:>8} {2:>9.3f}s {3:>9.5f}s {4:>9.5f}s {5:>8} {6:>8} {7:>8} {8:>8}'.format(
+                name, stats.calls, stats.total_time, mean, stats.max_time, stats.matches, stats.skips,
+                stats.errors, stats.cached))
+        lines.append('{0:<16} {1:>8} {2:>10} {3:>10}'.format('Section', 'Entries', 'Listing', 'Total'))
+        for section, stats in self.sectionStats.items():
+            lines.append('{0:<16} {1:>8} {2:>9.3f}s {3:>9.3f}s'.format(
+                section, stats.entries, stats.enumerate_time, stats.total_time))
+        return lines
+
 _ntuple_diskusage = namedtuple('usage', 'total used free')
 
 def disk_usage(path):
@@ -89,6 +444,222 @@ def disk_usage(path):
     used = (st.f_blocks - st.f_bfree) * st.f_frsize
     return _ntuple_diskusage(total, used, free)
 
+def is_internal(path):
+    """ Check if a path is one of the trash directories or partial copies msort creates itself
+
+    :param path: Path to check
+    :type path: str
+    :rtype: bool
+    """
+    name = basename(path)
+    return name == TRASH_DIR or name.endswith(PARTIAL_SUFFIX)
+
+def mount_point(path):
+    """ Find the mount point of the filesystem the path lives on
+
+    :param path: Existing path
+    :type path: str
+    :return: Mount point directory
+    :rtype: str
+    """
+    path = abspath(path)
+    device = stat(path).st_dev
+    while True:
+        parent = dirname(path)
+        if parent == path or stat(parent).st_dev != device:
+            return path
+        path = parent
+
+def device_of(path):
+    """ Return the st_dev of the path, or of its closest existing parent directory when
+    the path does not exist yet, eg. a move destination.
+
+    :param path: Path to get the device of
+    :type path: str
+    :return: Device id
+    :rtype: int
+    """
+    path = abspath(path)
+    while True:
+        try:
+            return stat(path).st_dev
+        except OSError:
+            parent = dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+# Bytes handed to the kernel per copy_file_range/sendfile call
+COPY_CHUNK = 64 * 1024 * 1024
+
+# Suffix of a cross device copy in progress, renamed into place once complete
+PARTIAL_SUFFIX = '.msort-part'
+# Name of the trash directory created at the root of each filesystem
+TRASH_DIR = '.msort-trash'
+
+# Errors meaning the in kernel copy method isnt supported for the pair of files
+_copy_unsupported = (ENOSYS, EXDEV, EINVAL, EOPNOTSUPP, EBADF)
+
+def _copy_fd(infd, outfd, chunk=COPY_CHUNK):
+    """ Copy the contents of one file descriptor to another, using copy_file_range when
+    possible, which can clone or copy server side, then sendfile and finally a plain
+    userspace loop with a large buffer.
+
+    :param infd: Source file descriptor, at offset 0
+    :type infd: int
+    :param outfd: Destination file descriptor, at offset 0
+    :type outfd: int
+    :param chunk: Bytes per call
+    :type chunk: int
+    :return: Bytes copied
+    :rtype: int
+    """
+    copied = 0
+    for method in (copy_file_range, sendfile):
+        if method is None:
+            continue
+        try:
+            while True:
+                if method is sendfile:
+                    sent = sendfile(outfd, infd, None, chunk)
+                else:
+                    sent = copy_file_range(infd, outfd, chunk)
+                if not sent:
+                    return copied
+                copied += sent
+        except OSError as err:
+            if copied or err.errno not in _copy_unsupported:
+                raise
+    with open(infd, 'rb', closefd=False) as fsrc:
+        with open(outfd, 'wb', closefd=False) as fdst:
+            copyfileobj(fsrc, fdst, 1024 * 1024)
+            return fdst.tell()
+
+def copy_file(source, destination):
+    """ Copy a file, preserving its metadata like shutil.copy2, with the data copied in
+    the kernel where possible.
+
+    :param source: File to copy
+    :type source: str
+    :param destination: File to create
+    :type destination: str
+    :return: Bytes copied
+    :rtype: int
+    """
+    with open(source, 'rb') as fsrc:
+        with open(destination, 'wb') as fdst:
+            copied = _copy_fd(fsrc.fileno(), fdst.fileno())
+    copystat(source, destination)
+    return copied
+
+def copy_tree(source, destination):
+    """ Recursively copy a file or directory with its metadata, keeping symlinks as links
+
+    :param source: Path to copy
+    :type source: str
+    :param destination: Path to create
+    :type destination: str
+    :return: Bytes copied
+    :rtype: int
+    """
+    st = lstat(source)
+    if S_ISLNK(st.st_mode):
+        symlink(readlink(source), destination)
+        return 0
+    if not S_ISDIR(st.st_mode):
+        return copy_file(source, destination)
+    mkdir(destination)
+    copied = 0
+    for entry in realscandir(source):
+        copied += copy_tree(entry.path, join(destination, entry.name))
+    copystat(source, destination)
+    return copied
+
+def move_path(source, destination, copied=None):
+    """ Move a file or directory with the same semantics as shutil.move. On the same
+    device this is a single rename. Across devices the source is copied to a partial
+    path next to the destination, renamed into place once complete and only then is the
+    source removed, so a interrupted move never leaves a half copied destination.
+
+    :param source: Path to move
+    :type source: str
+    :param destination: Path to move to, or existing directory to move into
+    :type destination: str
+    :param copied: Called with the final destination path of a move across devices once it
+    is complete, before the source is removed
+    :type copied: callable
+    :return: Final destination path
+    :rtype: str
+    :raises: OSError
+    """
+    if isdir(destination):
+        destination = join(destination, basename(source.rstrip(sep)))
+        if exists(destination):
+            raise OSError(EEXIST, 'Destination path already exists', destination)
+    source_st = lstat(source)
+    if source_st.st_dev == device_of(dirname(abspath(destination))):
+        rename(source, destination)
+        return destination
+    partial = destination + PARTIAL_SUFFIX
+    if exists(partial):
+        # Left over from a interrupted move
+        rmtree(partial) if isdir(partial) else remove(partial)
+    try:
+        copy_tree(source, partial)
+        rename(partial, destination)
+    except Exception:
+        if exists(partial):
+            rmtree(partial, ignore_errors=True) if isdir(partial) else remove(partial)
+        raise
+    if copied:
+        copied(destination)
+    remove_tree(source)
+    return destination
+
+Freed = namedtuple('Freed', 'size blocks')
+
+def _raise(err):
+    raise err
+
+def remove_tree(path):
+    """ Remove a file or directory tree in a single pass, adding up the sizes of what was
+    removed as it goes. Directories are walked with os.fwalk and their entries unlinked
+    relative to the directory fd, so no full path is resolved per node. Symbolic links are
+    removed, never followed.
+
+    :param path: File or directory to remove
+    :type path: str
+    :return: Apparent size and 512 byte blocks freed
+    :rtype: Freed
+    :raises: OSError
+    """
+    st = lstat(path)
+    if not S_ISDIR(st.st_mode):
+        remove(path)
+        return Freed(st.st_size, st.st_blocks)
+    if fwalk is None:
+        size = dir_size(path)
+        rmtree(path)
+        return Freed(size, 0)
+    size, blocks = st.st_size, st.st_blocks
+    for _, dirs, files, root_fd in fwalk(path, topdown=False, onerror=_raise):
+        for name in files:
+            st = stat(name, dir_fd=root_fd, follow_symlinks=False)
+            unlink(name, dir_fd=root_fd)
+            size += st.st_size
+            blocks += st.st_blocks
+        for name in dirs:
+            st = stat(name, dir_fd=root_fd, follow_symlinks=False)
+            if S_ISLNK(st.st_mode):
+                # Links to directories are listed as directories but never descended into
+                unlink(name, dir_fd=root_fd)
+            else:
+                rmdir(name, dir_fd=root_fd)
+            size += st.st_size
+            blocks += st.st_blocks
+    rmdir(path)
+    return Freed(size, blocks)
+
 def fmt_size(num_bytes):
     """ Return a human readable version of the number of bytes supplied.
 
@@ -103,25 +674,107 @@ def fmt_size(num_bytes):
         num_bytes /= 1024.0
     return "%3.1f%s" % (num_bytes, 'TB')
 
+_size_units = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_size(value):
+    """ Parse a human readable size, the reverse of fmt_size. Units are powers of 1024 and the
+    trailing B is optional, so 50G, 50GB and 53687091200 are all the same size.
+
+    :param value: Size string
+    :type value: str
+    :return: Size in bytes
+    :rtype: int
+    :raises: ValueError
+    """
+    value = value.strip().upper()
+    if value.endswith('B') and len(value) > 1 and not value[-2].isdigit():
+        value = value[:-1]
+    unit = value[-1:] if value[-1:].isalpha() else ''
+    if unit not in _size_units:
+        raise ValueError('Invalid size unit: {0}'.format(value))
+    return int(float(value[:len(value) - len(unit)]) * _size_units[unit])
+
+class SizeIndex(object):
+    """ Memoized index of recursive path sizes.
+
+    Directory totals are keyed on the (st_dev, st_ino, st_mtime) of the directory so a
+    subtree is only walked once no matter how many checks or operations ask for its size.
+    A directory mtime does not change when something deeper in its tree changes, so the
+    index is only meant to live for the length of a single scan, call clear() between runs.
+    """
+    def __init__(self):
+        # Single dict get/set calls are atomic, so the index can be shared between scanning
+        # threads. Two threads racing on the same subtree will at worst both walk it.
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def clear(self):
+        """ Forget all the cached directory sizes """
+        self._sizes.clear()
+
+    def peek(self, path):
+        """ Get the size of the path if it is already known, never walking the tree
+
+        :param path: Path to get the size of
+        :type path: str
+        :return: Total number of bytes or None if the directory was not walked yet or the
+        path is gone
+        :rtype: int
+        """
+        try:
+            st = path.stat() if isinstance(path, Path) else stat(path)
+        except OSError:
+            return None
+        if not S_ISDIR(st.st_mode):
+            return st.st_size if S_ISREG(st.st_mode) else 0
+        return self._sizes.get((st.st_dev, st.st_ino, st.st_mtime))
+
+    def size(self, path, st=None):
+        """ Return the recursive size of the path, walking it only if it has not been seen
+
+        :param path: Path to get the size of
+        :type path: str
+        :param st: Optional already fetched stat result of the path
+        :type st: posix.stat_result
+        :return: Total number of bytes counted
+        :rtype: int
+        """
+        if st is None:
+            st = stat(path)
+        if not S_ISDIR(st.st_mode):
+            return st.st_size if S_ISREG(st.st_mode) else 0
+        key = (st.st_dev, st.st_ino, st.st_mtime)
+        try:
+            return self._sizes[key]
+        except KeyError:
+            pass
+        total_size = 0
+        for item in reallistdir(path):
+            try:
+                total_size += self.size(join(path, item))
+            except OSError:
+                # Broken links and files removed mid walk are not counted
+                continue
+        self._sizes[key] = total_size
+        return total_size
+
+# Scan wide size index shared by every caller of dir_size
+size_index = SizeIndex()
+
 def dir_size(folder):
     """ Recursively calculate the size of a path.
 
-    This can be a directory or file
+    This can be a directory or file. Directory totals are memoized in the module
+    wide size_index so repeated calls do not walk the same tree again.
 
     :param folder: Path to get the size of
     :type folder: str
     :return: Total number of bytes counted
     :rtype: int
     """
-    if isfile(folder): return getsize(folder)
-    total_size = 0
-    for item in listdir(folder):
-        item_path = join(folder, item)
-        if isfile(item_path):
-            total_size += getsize(item_path)
-        elif isdir(item_path):
-            total_size += dir_size(item_path)
-    return total_size
+    return size_index.size(folder, folder.stat() if isinstance(folder, Path) else None)
 
 def listdir(path):
     """ Wrapper around os.listdir which returns Path objects instead of plain str's
@@ -133,8 +786,168 @@ def listdir(path):
     """
     return (Path(p) for p in reallistdir(path)) if isdir(path) else [path]
 
+def scandir(path):
+    """ Wrapper around os.scandir which yields full Path objects carrying their DirEntry,
+    so the file type and stat result of each entry are fetched at most once.
+
+    :param path: path to scan
+    :type path: str
+    :return: Generator of paths
+    :rtype: Path[]
+    """
+    for entry in realscandir(path):
+        yield Path.fromEntry(entry)
+
+# Entry orders of iter_entries
+ORDER_SORTED = 'sorted'
+ORDER_UNORDERED = 'unordered'
+
+def iter_entries(path, order=ORDER_SORTED, chunk=0):
+    """ Stream the entries of a directory.
+
+    Unordered entries come straight from os.scandir without ever being held in memory.
+    Sorted entries come in reverse name order, the order the scanner always used. With a
+    chunk size the names are sorted in chunks of that many entries, spilled to temporary
+    files and merged back, so no more than chunk names are held in memory no matter how
+    large the directory. Without a chunk size the whole listing is sorted in memory.
+
+    :param path: Directory to list
+    :type path: str
+    :param order: ORDER_SORTED or ORDER_UNORDERED
+    :type order: str
+    :param chunk: Max entries held in memory while sorting, 0 for no limit
+    :type chunk: int
+    :return: Generator of paths
+    :rtype: Path[]
+    """
+    if order == ORDER_UNORDERED:
+        for entry in scandir(path):
+            yield entry
+        return
+    if chunk <= 0:
+        for entry in reversed(sorted(scandir(path))):
+            yield entry
+        return
+    runs = []
+    names = []
+    try:
+        for entry in realscandir(path):
+            names.append(entry.name)
+            if len(names) >= chunk:
+                runs.append(_spill(names))
+                names = []
+        names.sort(reverse=True)
+        for name in merge(*([_readRun(run) for run in runs] + [names]), reverse=True):
+            yield Path(join(path, name))
+    finally:
+        for run in runs:
+            run.close()
+
+def _spill(names):
+    """ Write a reverse sorted run of names to a temporary file
+
+    :param names: Names to write
+    :type names: str[]
+    :return: Temporary file positioned at the start of the run
+    :rtype: file
+    """
+    names.sort(reverse=True)
+    run = TemporaryFile()
+    # Names can hold anything but a null and a slash
+    run.write(b'\0'.join([fsencode(name) for name in names]) + b'\0')
+    run.seek(0)
+    return run
+
+def _readRun(run, block_size=64 * 1024):
+    """ Read back the names of a run written by _spill
+
+    :param run: Temporary file of the run
+    :type run: file
+    :param block_size: Bytes read at a time
+    :type block_size: int
+    :return: Generator of names
+    :rtype: str[]
+    """
+    pending = b''
+    while True:
+        block = run.read(block_size)
+        if not block:
+            return
+        records = (pending + block).split(b'\0')
+        pending = records.pop()
+        for record in records:
+            yield fsdecode(record)
+
 class Path(str):
-    """ Represents a filesystem path, adds a few helper properties """
+    """ Represents a filesystem path, adds a few helper properties.
+
+    The stat result is fetched lazily on first use and cached for the lifetime of the
+    instance. When created from a scandir DirEntry the file type comes for free from the
+    directory listing. A str subclass cannot define non-empty __slots__, so the cache lives
+    in the instance dict.
+    """
+    _entry = None
+    _stat = None
+    _listing = None
+
+    @classmethod
+    def fromEntry(cls, entry):
+        """ Create a Path instance from a os.scandir DirEntry
+
+        :param entry: Directory entry to wrap
+        :type entry: DirEntry
+        :return: Path instance of the entries full path
+        :rtype: Path
+        """
+        path = cls(entry.path)
+        path._entry = entry
+        return path
+
+    def stat(self):
+        """ Get the (cached) stat result of the path, following symlinks
+
+        :return: Stat result
+        :rtype: posix.stat_result
+        :raises: OSError
+        """
+        if self._stat is None:
+            self._stat = self._entry.stat() if self._entry is not None else stat(self)
+        return self._stat
+
+    @property
+    def isdir(self):
+        """ Check if the path is a directory
+
+        :return: Directory status
+        :rtype: bool
+        """
+        if self._entry is not None:
+            return self._entry.is_dir()
+        try: return S_ISDIR(self.stat().st_mode)
+        except OSError: return False
+
+    @property
+    def isfile(self):
+        """ Check if the path is a regular file
+
+        :return: File status
+        :rtype: bool
+        """
+        if self._entry is not None:
+            return self._entry.is_file()
+        try: return S_ISREG(self.stat().st_mode)
+        except OSError: return False
+
+    @property
+    def listing(self):
+        """ Get the (cached) child paths of a directory, empty for anything else
+
+        :return: Child paths
+        :rtype: Path[]
+        """
+        if self._listing is None:
+            self._listing = list(scandir(self)) if self.isdir else []
+        return self._listing
 
     @property
     def age(self):
@@ -143,7 +956,7 @@ class Path(str):
         :return: Age in seconds
         :rtype: int
         """
-        return stat(self).st_mtime
+        return self.stat().st_mtime
 
     @property
     def size(self):
@@ -166,6 +979,3 @@ class Path(str):
         :rtype: Path
         """
         return Path(join(*args))
-
-
-
@@ -0,0 +1,243 @@
+"""
+Persistent on disk index of scan results, used to skip re-checking entries which have not
+changed since the last run.
+"""
+import sqlite3
+from hashlib import sha1
+from threading import Lock
+
+from msort.log import getLogger
+
+# Verdict stored for a checker which found nothing to do with a entry
+VERDICT_CLEAN = 0
+
+def config_hash(config):
+    """ Hash the raw contents of a config. Any change to the config invalidates all the
+    verdicts stored with the previous hash.
+
+    :param config: Configuration instance
+    :type config: Config
+    :return: Hex digest of the config
+    :rtype: str
+    """
+    digest = sha1()
+    for section in sorted(config.sections()):
+        for option, value in sorted(config.items(section, raw=True)):
+            digest.update('{0}\0{1}\0{2}\n'.format(section, option, value).encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+def fingerprint(path):
+    """ Get the (inode, mtime, size) fingerprint of a top level entry
+
+    :param path: Path to fingerprint
+    :type path: Path
+    :return: Fingerprint or None if the path cant be stat'd
+    :rtype: tuple
+    """
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime, st.st_size
+
+class ScanIndex(object):
+    """ Sqlite backed store of the checker verdicts of top level entries.
+
+    Only "no match" verdicts of checkers flagged as cacheable are stored, an entry which
+    matched will have been moved or deleted by the time of the next run anyway. The verdicts
+    of a section are loaded in one query when its scan starts and written back in one
+    transaction when it ends, dropping the rows of entries which no longer exist.
+    """
+    def __init__(self, path, config_digest, rescan=False):
+        """ Open, creating if required, the index database
+
+        :param path: Location of the sqlite database
+        :type path: str
+        :param config_digest: Hash of the config the verdicts are valid for
+        :type config_digest: str
+        :param rescan: Ignore the stored verdicts, still recording new ones
+        :type rescan: bool
+        """
+        self.log = getLogger(__name__)
+        self.path = path
+        self.config_digest = config_digest
+        self.rescan = rescan
+        self._lock = Lock()
+        self._known = {}
+        self._kept = {}
+        self._clean = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS verdicts ('
+                        'section TEXT, path TEXT, checker TEXT, inode INTEGER, mtime REAL, size INTEGER, '
+                        'config TEXT, verdict INTEGER, PRIMARY KEY (section, path, checker))')
+        self.db.commit()
+
+    def load(self, section):
+        """ Load the stored verdicts of a section before scanning it
+
+        :param section: Section name
+        :type section: str
+        """
+        known = {}
+        with self._lock:
+            rows = self.db.execute('SELECT path, checker, inode, mtime, size, config FROM verdicts '
+                                   'WHERE section = ?', (section,)).fetchall()
+        for path, checker, inode, mtime, size, digest in rows:
+            if digest == self.config_digest and not self.rescan:
+                known[(path, checker)] = (inode, mtime, size)
+            else:
+                known.setdefault((path, checker), None)
+        self._known[section] = known
+        self._kept[section] = set()
+        self._clean[section] = []
+        self.log.debug('Loaded {0} stored verdicts for section {1}'.format(len(known), section))
+
+    def isClean(self, section, path, checker, fprint):
+        """ Check if the checker found nothing for the entry last time and the entry
+        hasnt changed since.
+
+        :param section: Section name
+        :type section: str
+        :param path: Entry path
+        :type path: str
+        :param checker: Checker instance
+        :type checker: BaseCheck
+        :param fprint: Current fingerprint of the entry
+        :type fprint: tuple
+        :return: Unchanged clean status
+        :rtype: bool
+        """
+        key = (path, str(checker))
+        known = self._known.get(section, {}).get(key)
+        if known is not None and tuple(known) == fprint:
+            self._kept[section].add(key)
+            return True
+        return False
+
+    def markClean(self, section, path, checker, fprint):
+        """ Record the checker found nothing for the entry, ignored unless the section was
+        loaded for a full scan
+
+        :param section: Section name
+        :type section: str
+        :param path: Entry path
+        :type path: str
+        :param checker: Checker instance
+        :type checker: BaseCheck
+        :param fprint: Current fingerprint of the entry
+        :type fprint: tuple
+        """
+        if section in self._clean:
+            self._clean[section].append((section, path, str(checker)) + fprint + (self.config_digest, VERDICT_CLEAN))
+
+    def commit(self, section):
+        """ Write back the verdicts of a scanned section in a single transaction. Stored
+        verdicts which were neither still valid nor recorded again, eg. of entries which
+        are gone or now matched, are removed.
+
+        :param section: Section name
+        :type section: str
+        """
+        kept = self._kept.pop(section, set())
+        clean = self._clean.pop(section, [])
+        known = self._known.pop(section, {})
+        recorded = set([(row[1], row[2]) for row in clean])
+        stale = [(section, path, checker) for path, checker in set(known) - kept - recorded]
+        with self._lock:
+            with self.db:
+                self.db.executemany('DELETE FROM verdicts WHERE section = ? AND path = ? AND checker = ?', stale)
+                self.db.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?)', clean)
+
+    def close(self):
+        """ Close the database """
+        with self._lock:
+            self.db.close()
+
+class HashCache(object):
+    """ Sqlite backed store of the content hashes of files, keyed on the path and only valid
+    while the (inode, mtime, size) fingerprint of the file is unchanged. The whole cache is
+    loaded in one query and the new hashes written back in one transaction.
+    """
+    def __init__(self, path):
+        """ Open, creating if required, the cache database
+
+        :param path: Location of the sqlite database
+        :type path: str
+        """
+        self.log = getLogger(__name__)
+        self.path = path
+        self._lock = Lock()
+        self._hashes = {}
+        self._updated = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, inode INTEGER, mtime REAL, '
+                        'size INTEGER, partial TEXT, full TEXT)')
+        self.db.commit()
+
+    def load(self):
+        """ Load all the stored hashes """
+        with self._lock:
+            rows = self.db.execute('SELECT path, inode, mtime, size, partial, full FROM hashes').fetchall()
+            self._hashes = dict([(row[0], row[1:]) for row in rows])
+            self._updated = {}
+        self.log.debug('Loaded {0} stored hashes'.format(len(self._hashes)))
+
+    def get(self, path, fprint, kind):
+        """ Get a stored hash of a unchanged file
+
+        :param path: File path
+        :type path: str
+        :param fprint: Current (inode, mtime, size) fingerprint of the file
+        :type fprint: tuple
+        :param kind: partial or full
+        :type kind: str
+        :return: Hex digest or None
+        :rtype: str
+        """
+        with self._lock:
+            row = self._hashes.get(path)
+        if row is None or tuple(row[:3]) != fprint:
+            return None
+        return row[3] if kind == 'partial' else row[4]
+
+    def set(self, path, fprint, kind, digest):
+        """ Store the hash of a file, dropping the stored hashes of a older version of it
+
+        :param path: File path
+        :type path: str
+        :param fprint: Fingerprint of the file hashed
+        :type fprint: tuple
+        :param kind: partial or full
+        :type kind: str
+        :param digest: Hex digest
+        :type digest: str
+        """
+        with self._lock:
+            row = self._hashes.get(path)
+            partial, full = (row[3], row[4]) if row is not None and tuple(row[:3]) == fprint else (None, None)
+            if kind == 'partial':
+                partial = digest
+            else:
+                full = digest
+            self._hashes[path] = self._updated[path] = tuple(fprint) + (partial, full)
+
+    def commit(self, seen):
+        """ Write back the new hashes, dropping those of files which were not seen
+
+        :param seen: Paths of all the files still present
+        :type seen: set
+        """
+        with self._lock:
+            stale = [(path,) for path in set(self._hashes) - seen]
+            updated = [(path,) + row for path, row in self._updated.items()]
+            for path, in stale:
+                del self._hashes[path]
+            self._updated = {}
+            with self.db:
+                self.db.executemany('DELETE FROM hashes WHERE path = ?', stale)
+                self.db.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)', updated)
+
+    def close(self):
+        """ Close the database """
+        with self._lock:
+            self.db.close()
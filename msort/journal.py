@@ -0,0 +1,194 @@
+"""
+Append only journal of the operations planned and executed, used to resume a interrupted
+run or to execute a plan saved by an earlier scan.
+
+Every line is a JSON event. The plan is written as one "plan" event per operation, then
+"start", "done" and "error" events are appended as the operations run. Moves across devices
+also write a "copied" event once the destination is complete, before the source is removed.
+"""
+import json
+from collections import namedtuple, OrderedDict
+from os import fsync
+from os.path import exists
+from threading import Lock
+from time import time
+
+from msort.log import getLogger
+from msort.operation import operation_from_dict, OperationError
+
+JournalEntry = namedtuple('JournalEntry', 'id section operation state')
+
+class OperationJournal(object):
+    """ Writes the journal events. Writes are flushed right away but only fsync'd every
+    sync_every events or sync_interval seconds, the plan itself is always synced before
+    any operation starts.
+    """
+    def __init__(self, path, truncate=False, sync_every=64, sync_interval=1.0):
+        """
+        :param path: Journal file
+        :type path: str
+        :param truncate: Start a new journal instead of appending to a existing one
+        :type truncate: bool
+        :param sync_every: Number of events written between syncs
+        :type sync_every: int
+        :param sync_interval: Max seconds between syncs
+        :type sync_interval: float
+        """
+        self.log = getLogger(__name__)
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        if not truncate:
+            _drop_partial_line(path)
+        self._fp = open(path, 'w' if truncate else 'a')
+        self._lock = Lock()
+        self._unsynced = 0
+        self._last_sync = time()
+        self._next_id = 0
+        if not truncate:
+            self._next_id = max([entry.id for entry in read_journal(path)] + [-1]) + 1
+
+    def record(self, event, **fields):
+        """ Append a event to the journal
+
+        :param event: Event name
+        :type event: str
+        """
+        fields['event'] = event
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        fsync(self._fp.fileno())
+        self._unsynced = 0
+        self._last_sync = time()
+
+    def sync(self):
+        """ Force the written events to disk """
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def plan(self, operation_mgr):
+        """ Write the plan of every operation not already journaled, giving each of them
+        a journal id.
+
+        :param operation_mgr: Operations about to be executed
+        :type operation_mgr: OperationManager
+        """
+        for section, opers in operation_mgr.items():
+            for oper in opers:
+                if getattr(oper, 'journal_id', None) is None:
+                    self.planOperation(section, oper)
+        self.sync()
+
+    def planOperation(self, section, oper):
+        """ Write the plan of a single operation, giving it a journal id. Used when
+        operations are executed as they are found.
+
+        :param section: Section the operation belongs to
+        :type section: str
+        :param oper: Operation about to be executed
+        :type oper: BaseOperation
+        """
+        with self._lock:
+            oper.journal_id = self._next_id
+            self._next_id += 1
+        self.record('plan', id=oper.journal_id, section=section, op=oper.toDict())
+
+    def started(self, oper):
+        self.record('start', id=oper.journal_id)
+
+    def copied(self, oper):
+        """ Record a move whose destination is complete, synced right away as the source is
+        removed next
+
+        :param oper: Move copied to oper.copied
+        :type oper: MoveOperation
+        """
+        self.record('copied', id=oper.journal_id, path=oper.copied)
+        self.sync()
+
+    def finished(self, oper):
+        self.record('done', id=oper.journal_id)
+
+    def failed(self, oper, err):
+        self.record('error', id=oper.journal_id, error=str(err))
+
+    def close(self):
+        """ Sync and close the journal """
+        with self._lock:
+            self._sync()
+            self._fp.close()
+
+def _drop_partial_line(path):
+    """ Cut off a partially written last line, left by a crash mid write, so appended
+    events start on a line of their own.
+
+    :param path: Journal file
+    :type path: str
+    """
+    if not exists(path):
+        return
+    with open(path, 'rb+') as fp:
+        data = fp.read()
+        if data and not data.endswith(b'\n'):
+            fp.truncate(data.rfind(b'\n') + 1)
+
+def read_journal(path):
+    """ Read the planned operations of a journal along with the last state recorded for
+    each of them. A truncated last line, from a crash mid write, is ignored.
+
+    :param path: Journal file
+    :type path: str
+    :return: Entries in plan order
+    :rtype: JournalEntry[]
+    :raises: OperationError
+    """
+    entries = OrderedDict()
+    if not exists(path):
+        return []
+    with open(path) as fp:
+        lines = fp.readlines()
+    for i, line in enumerate(lines):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            if i == len(lines) - 1:
+                break
+            raise OperationError('Corrupt journal {0} at line {1}'.format(path, i + 1))
+        if event['event'] == 'plan':
+            entries[event['id']] = JournalEntry(event['id'], event['section'],
+                                                operation_from_dict(event['op']), 'planned')
+        elif event['id'] in entries:
+            if event['event'] == 'copied':
+                entries[event['id']].operation.copied = event['path']
+            entries[event['id']] = entries[event['id']]._replace(state=event['event'])
+    return list(entries.values())
+
+def load_pending(path, operation_mgr):
+    """ Queue the operations of a journal which still have to run into a operation manager.
+    Operations which started but whose source is already gone completed before the run
+    was interrupted and are skipped as well. Moves interrupted after they were copied are
+    queued to only remove their source.
+
+    :param path: Journal file
+    :type path: str
+    :param operation_mgr: Manager to queue the operations into
+    :type operation_mgr: OperationManager
+    :return: Number of operations queued
+    :rtype: int
+    """
+    queued = 0
+    for entry in read_journal(path):
+        if entry.state == 'done' or entry.operation.completed():
+            continue
+        entry.operation.journal_id = entry.id
+        operation_mgr.setdefault(entry.section, []).append(entry.operation)
+        queued += 1
+    return queued
@@ -1,12 +1,34 @@
 """
 Module logging facilities. If the colorama module is found, colourized output will be used
+
+Loggers only put their records on a queue. A background listener thread formats and
+writes them, flushing the stream once the queue runs dry or every flush_every records,
+so logging never blocks the caller on terminal or disk I/O. Log with lazy %-style
+arguments, records are only formatted if they are written.
 """
+import atexit
+from collections import Counter
 from logging import StreamHandler, getLogger as realGetLogger, Formatter, INFO
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Empty
+from threading import Lock
+from time import time
+
+class BufferedStreamHandler(StreamHandler):
+    """ A StreamHandler which leaves flushing the stream to the queue listener """
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
 
 try:
     from colorama import Fore, Back, init, Style
 
-    class ColourStreamHandler(StreamHandler):
+    class ColourStreamHandler(BufferedStreamHandler):
         """ A colorized output SteamHandler """
 
         # Some basic colour scheme defaults
@@ -20,19 +42,24 @@ try:
             'CRITICAL' : Back.RED + Fore.WHITE
         }
 
+        _is_tty = None
+
         @property
         def is_tty(self):
             """ Check if we are using a "real" TTY. If we are not using a TTY it means that
-            the colour output should be disabled.
+            the colour output should be disabled. Checked once per handler.
 
             :return: Using a TTY status
             :rtype: bool
             """
-            try: return getattr(self.stream, 'isatty', None)()
-            except: return False
+            if self._is_tty is None:
+                try: self._is_tty = bool(getattr(self.stream, 'isatty', None)())
+                except: self._is_tty = False
+            return self._is_tty
 
         def emit(self, record):
-            """ Write out a multi coloured log record based on the log level.
+            """ Write out a multi coloured log record based on the log level. The stream is
+            not flushed, that is left to the queue listener.
 
             :param record: unformatted log message
             :type record: LogRecord
@@ -45,7 +72,6 @@ try:
                 else:
                     self.stream.write(self.colours[record.levelname] + message + Style.RESET_ALL)
                 self.stream.write(getattr(self, 'terminator', '\n'))
-                self.flush()
             except (KeyboardInterrupt, SystemExit):
                 raise
             except:
@@ -55,9 +81,45 @@ try:
 except:
     has_colour = False
 
+class LazyQueueHandler(QueueHandler):
+    """ Queues records as they are, leaving the formatting to the listener thread """
+
+    def prepare(self, record):
+        return record
+
+class BatchingQueueListener(QueueListener):
+    """ Queue listener flushing its handlers once the queue is drained or after
+    flush_every records, instead of after every record.
+    """
+    flush_every = 256
+
+    def __init__(self, queue, *handlers):
+        QueueListener.__init__(self, queue, *handlers)
+        self._unflushed = 0
+
+    def dequeue(self, block):
+        try:
+            record = self.queue.get_nowait()
+        except Empty:
+            self._flush()
+            return self.queue.get(block)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._flush()
+        return record
+
+    def _flush(self):
+        for handler in self.handlers:
+            handler.flush()
+        self._unflushed = 0
+
 # Logging instance cache
 loggers = {}
 
+# Message format -> (queue, listener) of the running logging pipelines
+pipelines = {}
+_pipeline_lock = Lock()
+
 # Application wide log level
 log_level = INFO
 
@@ -78,13 +140,45 @@ def getLogger(name=None, fmt='%(message)s'):
     except KeyError:
         logger = realGetLogger(name)
         logger.setLevel(log_level)
-        # Only enable colour if support was loaded properly
-        handler = ColourStreamHandler() if has_colour else StreamHandler()
-        handler.setFormatter(Formatter(fmt))
-        logger.addHandler(handler)
+        logger.addHandler(LazyQueueHandler(_pipeline(fmt)))
         loggers[name] = logger
         return logger
 
+def _pipeline(fmt):
+    """ Get the queue of the logging pipeline writing records in the given format, starting
+    the pipeline if required.
+
+    :param fmt: Message format
+    :type fmt: str
+    :return: Queue to put the records on
+    :rtype: Queue
+    """
+    with _pipeline_lock:
+        try: return pipelines[fmt][0]
+        except KeyError: pass
+        # Only enable colour if support was loaded properly
+        handler = ColourStreamHandler() if has_colour else BufferedStreamHandler()
+        handler.setFormatter(Formatter(fmt))
+        queue = Queue()
+        listener = BatchingQueueListener(queue, handler)
+        listener.start()
+        pipelines[fmt] = (queue, listener)
+        return queue
+
+def flushLogs():
+    """ Block until every queued record was written out, eg. before prompting the user """
+    for queue, listener in list(pipelines.values()):
+        queue.join()
+        listener._flush()
+
+@atexit.register
+def stopLogging():
+    """ Write out the queued records and stop the listener threads """
+    with _pipeline_lock:
+        for queue, listener in pipelines.values():
+            listener.stop()
+        pipelines.clear()
+
 def setLevel(level):
     """ Set the global log level
 
@@ -94,4 +188,45 @@ def setLevel(level):
     global log_level, loggers
 
     [logger.setLevel(level) for logger in loggers.values()]
-    log_level = level
\ No newline at end of file
+    log_level = level
+
+class LogSummary(object):
+    """ Collapses repetitive per path messages into a periodic summary line. Messages are
+    counted by key and logged as a single line with the counts every interval seconds, or
+    when flush() is called.
+    """
+    def __init__(self, logger, interval=10, prefix='Summary'):
+        """
+        :param logger: Logger the summary lines are written to
+        :type logger: Logger
+        :param interval: Seconds between summary lines
+        :type interval: float
+        :param prefix: Text the summary lines start with
+        :type prefix: str
+        """
+        self.log = logger
+        self.interval = interval
+        self.prefix = prefix
+        self.counts = Counter()
+        self._last = time()
+        self._lock = Lock()
+
+    def add(self, key):
+        """ Count a message
+
+        :param key: Kind of message, eg. "skipped by AgeCheck"
+        :type key: str
+        """
+        with self._lock:
+            self.counts[key] += 1
+            due = time() - self._last >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """ Log the counted messages, if any, and start counting again """
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+            self._last = time()
+        if counts:
+            self.log.info('%s: %s', self.prefix, ', '.join(['%s %d' % (key, count) for key, count in sorted(counts.items())]))
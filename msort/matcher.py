@@ -0,0 +1,170 @@
+"""
+Matches a path against a ordered list of regex rules in a single pass of the regex engine.
+"""
+import re
+# The literal prefilter relies on the private regex parser, it is skipped when unavailable
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    try:
+        import sre_parse
+    except ImportError:
+        sre_parse = None
+
+# Rules using numbered group references or conditionals can not be safely merged since
+# their group numbers shift once combined. They are matched one by one instead.
+_unmergeable = re.compile(r'\\[1-9]|\(\?\(')
+_group_name = re.compile(r'\(\?P<(\w+)>')
+_group_ref = re.compile(r'\(\?P=(\w+)\)')
+
+class RuleMatch(object):
+    """ The result of a RuleMatcher search, exposing the same group accessors as a re match """
+
+    def __init__(self, index, text, groups):
+        """
+        :param index: Index of the rule that matched
+        :type index: int
+        :param text: Text matched by the rule
+        :type text: str
+        :param groups: Named groups of the rule
+        :type groups: dict
+        """
+        self.index = index
+        self.text = text
+        self._groups = groups
+
+    def groupdict(self):
+        return dict(self._groups)
+
+    def group(self, name=0):
+        return self.text if name == 0 else self._groups[name]
+
+class RuleMatcher(object):
+    """ Compile a ordered list of rules into one combined regex. Each rule becomes a lookahead
+    alternative anchored at the start of the text, so the engine tries the rules in order and
+    the first rule matching anywhere in the text wins, exactly like searching them one by one.
+
+    A literal prefilter holds the longest run of literal characters every match of each rule
+    must contain. Text containing none of them can not match any rule and is rejected without
+    running the regex engine at all. The prefilter is only a shortcut, if the regex parser is
+    missing or doesnt parse the rules as expected the combined regex is used on its own.
+    """
+    def __init__(self, patterns, flags=re.IGNORECASE):
+        """
+        :param patterns: Ordered regex rules
+        :type patterns: str[]
+        :param flags: Regex flags used for every rule
+        :type flags: int
+        """
+        self.patterns = [re.compile(pattern, flags) for pattern in patterns]
+        self.literals = self._buildLiterals(patterns, flags)
+        self.combined = None
+        self._names = []
+        if self.patterns:
+            self.combined = self._buildCombined(patterns, flags)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def _buildCombined(self, patterns, flags):
+        """ Merge the rules into a single regex, renaming the named groups of each rule so
+        they dont collide.
+
+        :return: Compiled combined regex or None if the rules cant be merged
+        :rtype: SRE_Pattern
+        """
+        alternatives = []
+        for i, pattern in enumerate(patterns):
+            if _unmergeable.search(pattern):
+                return None
+            self._names.append([(name, '_{0}_{1}'.format(i, name)) for name in self.patterns[i].groupindex])
+            pattern = _group_name.sub(lambda m: '(?P<_{0}_{1}>'.format(i, m.group(1)), pattern)
+            pattern = _group_ref.sub(lambda m: '(?P=_{0}_{1})'.format(i, m.group(1)), pattern)
+            alternatives.append('(?=[\\s\\S]*?(?P<_{0}>{1}))'.format(i, pattern))
+        try:
+            combined = re.compile('|'.join(alternatives), flags)
+        except (re.error, AssertionError, OverflowError):
+            return None
+        # Make sure the rewrite didnt change the groups, eg. a escaped "(?P<" in a literal
+        if len(combined.groupindex) != len(patterns) + sum([len(names) for names in self._names]):
+            return None
+        return combined
+
+    def _buildLiterals(self, patterns, flags):
+        """ Find the longest required literal of every rule, lower cased
+
+        :return: Set of literals or None if any rule has no usable literal
+        :rtype: set
+        """
+        if sre_parse is None:
+            return None
+        literals = set()
+        for pattern in patterns:
+            try:
+                runs = _literalRuns(sre_parse.parse(pattern, flags))
+            except Exception:
+                # The parser is private and changes between versions, go without the prefilter
+                return None
+            longest = max(runs, key=len) if runs else ''
+            if not longest:
+                return None
+            literals.add(longest.lower())
+        return literals or None
+
+    def search(self, text, start=0):
+        """ Find the first rule, starting at the rule index given, matching the text
+
+        :param text: Text to match against the rules
+        :type text: str
+        :param start: Index of the first rule to try
+        :type start: int
+        :return: Match of the first rule matched or None
+        :rtype: RuleMatch
+        """
+        if self.literals and text.isascii():
+            lowered = text.lower()
+            if not any([literal in lowered for literal in self.literals]):
+                return None
+        if self.combined is None or start:
+            for index, pattern in enumerate(self.patterns[start:], start):
+                match = pattern.search(text)
+                if match:
+                    return RuleMatch(index, match.group(0), match.groupdict())
+            return None
+        match = self.combined.match(text)
+        if not match:
+            return None
+        index = int(match.lastgroup[1:])
+        groups = dict([(name, match.group(combined_name)) for name, combined_name in self._names[index]])
+        return RuleMatch(index, match.group(match.lastgroup), groups)
+
+def _literalRuns(parsed):
+    """ Collect the runs of literal characters which every match of the parsed regex must
+    contain. Anything but plain literals and groups ends the current run.
+
+    :param parsed: Parsed regex
+    :type parsed: SubPattern
+    :return: Literal runs
+    :rtype: str[]
+    """
+    runs = []
+    current = []
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL and av < 128:
+                current.append(chr(av))
+            elif op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            else:
+                runs.append(''.join(current))
+                del current[:]
+                if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                    # The repeated item must appear at least once
+                    runs.extend(_literalRuns(av[2]))
+    walk(parsed)
+    runs.append(''.join(current))
+    return [run for run in runs if run]
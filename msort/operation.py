@@ -1,13 +1,17 @@
 """
 Provides classes to perform actions against triggered files and folders
 """
-from os import remove, makedirs, listdir
-from os.path import isfile, isdir, exists, join, dirname, basename
-from shutil import move, rmtree
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, listdir, link, rename, remove, rmdir, stat, sep
+from os.path import isfile, isdir, islink, exists, join, dirname, basename, samestat, abspath
+from queue import Queue
+from threading import BoundedSemaphore, Event, Lock, Thread
 
 from msort import MSortError
 from msort.log import getLogger
-from msort.filesystem import dir_size, fmt_size
+from msort.filesystem import size_index, fmt_size, device_of, move_path, remove_tree, PARTIAL_SUFFIX
+from msort.trash import move_to_trash
 
 class OperationError(MSortError):
     """ Thrown on a error during a operantion """
@@ -18,6 +22,8 @@ class BaseOperation(object):
 
     def __init__(self):
         self.log = getLogger(__name__)
+        # Set once the operation is written to a OperationJournal
+        self.journal_id = None
 
     def __call__(self):
         raise NotImplementedError('__call__ not implemented in {0}'.format(self.__str__()))
@@ -25,36 +31,134 @@ class BaseOperation(object):
     def __str__(self):
         return self.__class__.__name__
 
+    def devices(self):
+        """ Get the devices touched by the operation, used to schedule operations into
+        per device execution lanes.
+
+        :return: (source device, destination device)
+        :rtype: tuple
+        """
+        return None, None
+
+    def completed(self):
+        """ Check if the operation has nothing left to do, eg. it finished before a
+        interrupted run was killed.
+
+        :rtype: bool
+        """
+        return False
+
+    def toDict(self):
+        """ Serialize the operation for a OperationJournal
+
+        :rtype: dict
+        """
+        return {'type': self.__class__.__name__}
+
+    @classmethod
+    def fromDict(cls, data):
+        """ Create a operation serialized with toDict
+
+        :param data: Serialized operation
+        :type data: dict
+        :rtype: BaseOperation
+        """
+        return cls()
+
 class MoveOperation(BaseOperation):
-    """ Used to move files from one directory to another"""
+    """ Used to move files from one directory to another. Moves on the same device are
+    a single rename, moves across devices are copied in the kernel, see move_path.
+    """
 
     def __init__(self, source, destination, create_dest=True):
         BaseOperation.__init__(self)
         self.source = source
         self.destination = destination
         self.create_dest = create_dest
+        # Final path once a move across devices is copied, only the source is left to remove
+        self.copied = None
+        # Called with the operation once it is copied, see OperationJournal.copied
+        self.on_copied = None
 
     def __call__(self):
         try:
+            if self.copied and exists(self.copied) and (exists(self.source) or islink(self.source)):
+                # Interrupted after the copy was renamed into place but before the source was gone
+                remove_tree(self.source)
+                return
             dest_dir = dirname(self.destination)
             if self.create_dest and not exists(dest_dir):
                 makedirs(dest_dir)
-            move(self.source, self.destination)
+            move_path(self.source, self.destination, self._copied)
         except Exception as err:
             raise OperationError(err)
 
+    def _copied(self, path):
+        self.copied = path
+        if self.on_copied:
+            self.on_copied(self)
+
     def __str__(self):
         return '{0} {1} {2}'.format(self.__class__.__name__, self.source, self.destination)
 
+    def devices(self):
+        return device_of(self.source), device_of(self.destination)
+
+    def targets(self):
+        """ Get the paths the move will create. A destination which is a existing directory,
+        or ends in a separator, is moved into like move_path does.
+
+        :return: Absolute target paths
+        :rtype: str[]
+        """
+        destination = self.destination
+        if destination.endswith(sep) or isdir(destination):
+            destination = join(destination, basename(self.source.rstrip(sep)))
+        return [abspath(destination)]
+
+    def completed(self):
+        return not exists(self.source) and not islink(self.source)
+
+    def toDict(self):
+        data = BaseOperation.toDict(self)
+        data.update(source=self.source, destination=self.destination, create_dest=self.create_dest)
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['source'], data['destination'], data['create_dest'])
+
 class MoveContentsOperation(MoveOperation):
     def __init__(self, source, destination, create_dest=True):
         MoveOperation.__init__(self, source, destination, create_dest)
 
     def __call__(self):
         ops = self._findOperations()
+        if self.create_dest:
+            # Create every folder the moves need once, instead of each move checking for its own
+            moves = [oper for oper in ops if isinstance(oper, MoveOperation)]
+            try:
+                for dest_dir in sorted(set([dirname(oper.destination) for oper in moves])):
+                    makedirs(dest_dir, exist_ok=True)
+            except OSError as err:
+                raise OperationError(err)
+            for oper in moves:
+                oper.create_dest = False
         for oper in ops:
             oper()
 
+    def targets(self):
+        """ Get the files the moves of the contents will create, none if the source cant be listed
+
+        :return: Absolute target paths
+        :rtype: str[]
+        """
+        try:
+            ops = self._findOperations()
+        except OSError:
+            return []
+        return [target for oper in ops if isinstance(oper, MoveOperation) for target in oper.targets()]
+
     def _findOperations(self):
         ops = []
         path_list = listdir(self.source)
@@ -79,43 +183,239 @@ class MoveContentsOperation(MoveOperation):
 class DeleteOperation(BaseOperation):
     """ Used to delete a path from the filesystem """
 
-    def __init__(self, path):
+    def __init__(self, path, trash=False):
         """ Set the path to be deleted
 
         :param path: Path to delete
         :type path: str
+        :param trash: Rename the path into the trash of its filesystem, leaving the actual
+        removal to a Reaper, instead of removing it inline
+        :type trash: bool
         """
         BaseOperation.__init__(self)
         self.source = path
+        self.trash = trash
         self.size = None
+        # Freed by the delete itself, left None when trashed or not executed yet
+        self.freed = None
 
     def __call__(self):
         """ Perform the delete operation taking account for a directory or a folder
         being deleted
         """
-        if isdir(self.source):
-            rmtree(self.source)
-            self.log.debug('Removed directory: {0}'.format(self.source))
-        elif isfile(self.source):
-            remove(self.source)
-            self.log.debug('Removed file: {0}'.format(self.source))
+        if self.trash and exists(self.source):
+            try:
+                target = move_to_trash(self.source)
+            except OSError as err:
+                self.log.debug('Could not trash %s, removing inline: %s', self.source, err)
+            else:
+                self.log.debug('Trashed: %s -> %s', self.source, target)
+                return
+        if exists(self.source) or islink(self.source):
+            self.freed = remove_tree(self.source)
+            self.log.debug('Removed %d bytes: %s', self.freed.size, self.source)
 
     def __str__(self):
-        if self.size == None:
-            self.size = dir_size(self.source)
+        # Only sizes already known are shown, formatting never walks the tree
+        if self.freed is not None:
+            self.size = self.freed.size
+        elif self.size is None:
+            self.size = size_index.peek(self.source)
+        if self.size is None:
+            return 'Delete {0}'.format(self.source)
         return 'Delete ({0}) {1}'.format(fmt_size(self.size), self.source)
 
+    def devices(self):
+        device = device_of(self.source)
+        return device, device
+
+    def completed(self):
+        return not exists(self.source) and not islink(self.source)
+
+    def toDict(self):
+        data = BaseOperation.toDict(self)
+        data.update(source=self.source, trash=self.trash)
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['source'], data['trash'])
+
+class LinkOperation(BaseOperation):
+    """ Replaces a file with a hard link to a identical file on the same device. The link
+    is created next to the file and renamed over it, so the path never goes missing.
+    """
+
+    def __init__(self, source, target):
+        """
+        :param source: File to replace
+        :type source: str
+        :param target: Identical file to link to
+        :type target: str
+        """
+        BaseOperation.__init__(self)
+        self.source = source
+        self.target = target
+
+    def __call__(self):
+        tmp_path = '{0}{1}'.format(self.source, PARTIAL_SUFFIX)
+        try:
+            link(self.target, tmp_path)
+            rename(tmp_path, self.source)
+        except OSError as err:
+            if islink(tmp_path) or exists(tmp_path):
+                remove(tmp_path)
+            raise OperationError(err)
+
+    def __str__(self):
+        return '{0} {1} {2}'.format(self.__class__.__name__, self.source, self.target)
+
+    def devices(self):
+        device = device_of(self.source)
+        return device, device
+
+    def completed(self):
+        try:
+            return samestat(stat(self.source), stat(self.target))
+        except OSError:
+            return False
+
+    def toDict(self):
+        data = BaseOperation.toDict(self)
+        data.update(source=self.source, target=self.target)
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['source'], data['target'])
+
+class DuplicateOperation(BaseOperation):
+    """ Removes a redundant copy of a file, by deleting it or by replacing it with a hard link
+    to the kept copy. The plan may run long after the duplicates were found, so the kept copy
+    is checked again first and the operation fails, leaving the redundant copy alone, if it is
+    gone or changed since.
+    """
+
+    def __init__(self, source, target, fprint, link=False, trash=False):
+        """
+        :param source: Redundant copy to remove
+        :type source: str
+        :param target: Kept copy
+        :type target: str
+        :param fprint: (device, inode, size, mtime) of the kept copy when it was found
+        :type fprint: tuple
+        :param link: Replace the redundant copy with a hard link instead of deleting it
+        :type link: bool
+        :param trash: Delete into the trash, see DeleteOperation
+        :type trash: bool
+        """
+        BaseOperation.__init__(self)
+        self.source = source
+        self.target = target
+        self.fprint = tuple(fprint)
+        self.link = link
+        self.trash = trash
+        self.freed = None
+
+    def __call__(self):
+        try:
+            st = stat(self.target)
+        except OSError as err:
+            raise OperationError('Kept copy of {0} is gone, not removing it: {1}'.format(self.source, err))
+        if (st.st_dev, st.st_ino, st.st_size, st.st_mtime) != self.fprint:
+            raise OperationError('Kept copy {0} changed, not removing {1}'.format(self.target, self.source))
+        if self.link:
+            LinkOperation(self.source, self.target)()
+        else:
+            oper = DeleteOperation(self.source, self.trash)
+            oper()
+            self.freed = oper.freed
+
+    def __str__(self):
+        return '{0} {1} {2} {3}'.format(self.__class__.__name__, 'Link' if self.link else 'Delete',
+                                        self.source, self.target)
+
+    def devices(self):
+        device = device_of(self.source)
+        return device, device
+
+    def completed(self):
+        if self.link:
+            return LinkOperation(self.source, self.target).completed()
+        return not exists(self.source) and not islink(self.source)
+
+    def toDict(self):
+        data = BaseOperation.toDict(self)
+        data.update(source=self.source, target=self.target, fprint=list(self.fprint), link=self.link,
+                    trash=self.trash)
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['source'], data['target'], data['fprint'], data['link'], data['trash'])
+
 class OperationManager(dict):
     """
     Oversees executing queued up operations.
     """
-    def __init__(self, error_continue=False):
+    def __init__(self, error_continue=False, lanes=1, journal=None):
+        """ Setup the operation manager
+
+        :param error_continue: Keep going when a operation fails, collecting the errors
+        :type error_continue: bool
+        :param lanes: Number of operations allowed to run at once per device, 1 executes
+        everything sequentially in section order
+        :type lanes: int
+        :param journal: Optional journal the plan and progress are recorded to
+        :type journal: OperationJournal
+        """
         dict.__init__(self)
         self.log = getLogger(__name__)
         self.log.propagate = 1
         self.error_list = []
         self.error_continue = error_continue
+        self.lanes = lanes
+        self.journal = journal
+        # What each executed delete freed, see DeleteOperation.freed
+        self.freed = []
+        # Folders made by createDestinations, see removeUnused
+        self._created = []
         self.cur_idx = 0
+        self._streaming = False
+        self._lock = Lock()
+
+    def executeOperation(self, oper):
+        """ Perform a single operation, logging the progress and collecting the error
+        if error_continue is enabled.
+
+        :param oper: Operation to perform
+        :type oper: BaseOperation
+        :raises: OperationError
+        """
+        with self._lock:
+            self.cur_idx +=1
+            if self._streaming:
+                self.log.info('[%d] %s', self.cur_idx, oper)
+            else:
+                self.log.info('[%d/%d] %s', self.cur_idx, len(self), oper)
+        if self.journal:
+            self.journal.started(oper)
+            if isinstance(oper, MoveOperation):
+                oper.on_copied = self.journal.copied
+        try: oper()
+        except OperationError as err:
+            if self.journal:
+                self.journal.failed(oper, err)
+            if not self.error_continue:
+                raise
+            with self._lock:
+                self.error_list.append(err)
+        else:
+            if self.journal:
+                self.journal.finished(oper)
+            if getattr(oper, 'freed', None):
+                with self._lock:
+                    self.freed.append(oper.freed)
 
     def executeSection(self, section):
         """ Perform all the operations under the section key provided
@@ -126,25 +426,325 @@ class OperationManager(dict):
         :rtype: list
         """
         for oper in self[section]:
-            self.cur_idx +=1
-            self.log.info('[{1}/{2}] {0}'.format(str(oper), self.cur_idx, len(self)))
-            try: oper()
-            except OperationError as err:
-                if not self.error_continue:
-                    raise
-                self.error_list.append(err)
+            self.executeOperation(oper)
+        return self.error_list
+
+    def chains(self, sections):
+        """ Split the operations of the sections into chains which can run independently. Two
+        operations touching overlapping paths, one path being the other or a parent of it,
+        are put in the same chain, keeping their section order.
+
+        :param sections: list of sections to split
+        :type sections: list
+        :return: Chains of operations, in the order of their first operation
+        :rtype: deque[]
+        """
+        opers = [oper for section in sections for oper in self[section]]
+        chain_of = list(range(len(opers)))
+
+        def find(i):
+            while chain_of[i] != i:
+                chain_of[i] = chain_of[chain_of[i]]
+                i = chain_of[i]
+            return i
+
+        exact, below = {}, {}
+        for i, oper in enumerate(opers):
+            paths = [getattr(oper, name, None) for name in ('source', 'destination', 'target')]
+            for path in [abspath(path) for path in paths if path]:
+                # Operations on the path itself, on one of its parents or on a path under it
+                related = [exact[parent] for parent in _parents(path) if parent in exact]
+                if path in below:
+                    related.append(below[path])
+                for other in related:
+                    chain_of[find(other)] = find(i)
+                exact.setdefault(path, i)
+                for parent in _parents(path)[1:]:
+                    below.setdefault(parent, i)
+        chains = OrderedDict()
+        for i, oper in enumerate(opers):
+            chains.setdefault(find(i), deque()).append(oper)
+        return list(chains.values())
+
+    def executeLanes(self, sections):
+        """ Perform the operations of the sections provided in parallel. Operations touching
+        overlapping paths run one after the other in their section order, see chains. The
+        chains are grouped by the (source device, destination device) of their first
+        operation and each group is worked by up to self.lanes worker lanes. A device never
+        has more than self.lanes operations running against it at once, across all the groups
+        using it.
+
+        :param sections: list of sections to execute
+        :type sections: list
+        :return: list of errors that may have occured
+        :rtype: list
+        :raises: OperationError
+        """
+        keys, groups, device_slots = {}, {}, {}
+        for chain in self.chains(sections):
+            for oper in chain:
+                try:
+                    keys[id(oper)] = oper.devices()
+                except OSError:
+                    # Missing source, let the operation fail
+                    keys[id(oper)] = None, None
+                for device in keys[id(oper)]:
+                    device_slots.setdefault(device, BoundedSemaphore(self.lanes))
+            groups.setdefault(keys[id(chain[0])], deque()).append(chain)
+        abort = Event()
+
+        def lane(queue):
+            while not abort.is_set():
+                try:
+                    chain = queue.popleft()
+                except IndexError:
+                    return
+                for oper in chain:
+                    if abort.is_set():
+                        return
+                    # Always acquire the device slots in the same order to avoid deadlocks
+                    slots = [device_slots[device] for device in sorted(set(keys[id(oper)]), key=str)]
+                    for slot in slots: slot.acquire()
+                    try:
+                        self.executeOperation(oper)
+                    except Exception:
+                        abort.set()
+                        raise
+                    finally:
+                        for slot in reversed(slots): slot.release()
+
+        workers = sum([min(self.lanes, len(queue)) for queue in groups.values()])
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            futures = []
+            for queue in groups.values():
+                futures.extend([pool.submit(lane, queue) for _ in range(min(self.lanes, len(queue)))])
+        for future in futures:
+            future.result()
         return self.error_list
 
+    def optimize(self):
+        """ Plan the queued operations before anything executes. Every operation is indexed by
+        its source and destination path, in execution order, and:
+
+        - deletes nested inside another deleted path are dropped, the parent delete covers them
+        - operations whose source an earlier operation already moved or deleted are dropped
+        - deletes of a path a move creates, or of one of its parent directories, are dropped,
+          they would delete what was moved there or were only removing a folder which is
+          about to be filled again
+        - moves creating a path an earlier move already creates are collisions, raised as a
+          OperationError unless error_continue is set, in which case they are dropped and
+          added to the error list. Moves are compared by the paths they actually create, see
+          MoveOperation.targets
+
+        The operations left in each section are then reordered so same device moves, which are
+        a single rename, run first, then the deletes and the cross device copies last. Deletes
+        of a directory something is moved out of always run after the moves.
+
+        :return: Number of operations dropped, collisions included
+        :rtype: int
+        :raises: OperationError
+        """
+        opers = [(section, oper) for section, section_opers in self.items() for oper in section_opers]
+        deletes = set([abspath(oper.source) for _, oper in opers if isinstance(oper, DeleteOperation)])
+        targets = dict([(id(oper), oper.targets()) for _, oper in opers if isinstance(oper, MoveOperation)])
+        # Every path a move creates along with all of its parent directories
+        planned = set([parent for paths in targets.values() for path in paths for parent in _parents(path)])
+        removed, destinations, collisions = {}, {}, []
+        kept = dict([(section, []) for section in self])
+        for section, oper in opers:
+            source = abspath(oper.source)
+            if isinstance(oper, DeleteOperation):
+                if any([parent in deletes for parent in _parents(source)[1:]]):
+                    self.log.debug('Dropping %s, a parent directory is deleted', oper)
+                    continue
+                if source in planned:
+                    self.log.warning('Dropping %s, a move creates a path inside it', oper)
+                    continue
+            gone = [removed[parent] for parent in _parents(source) if parent in removed]
+            if gone:
+                self.log.debug('Dropping %s, its source is already gone after %s', oper, gone[0])
+                continue
+            if isinstance(oper, MoveOperation):
+                taken = [path for path in targets[id(oper)] if path in destinations]
+                if taken:
+                    collisions.append(OperationError('Destination collision, {0} and {1} both move to {2}'.format(
+                        destinations[taken[0]].source, oper.source, taken[0])))
+                    continue
+                for path in targets[id(oper)]:
+                    destinations[path] = oper
+            if not isinstance(oper, LinkOperation) and not getattr(oper, 'link', False):
+                removed[source] = oper
+            kept[section].append(oper)
+        if collisions:
+            if not self.error_continue:
+                raise OperationError('; '.join([str(err) for err in collisions]))
+            for err in collisions:
+                self.log.error(err)
+            self.error_list.extend(collisions)
+        # Directories something is moved out of
+        move_parents = set([parent for section_opers in kept.values() for oper in section_opers
+                            if isinstance(oper, MoveOperation) for parent in _parents(abspath(oper.source))[1:]])
+
+        def rank(oper):
+            if isinstance(oper, DeleteOperation):
+                return 3 if abspath(oper.source) in move_parents else 1
+            if isinstance(oper, MoveOperation):
+                try:
+                    source_device, dest_device = oper.devices()
+                except OSError:
+                    # Missing source, it fails the same wherever it runs
+                    return 0
+                return 0 if source_device == dest_device else 2
+            return 0
+
+        dropped = len(opers) - sum([len(section_opers) for section_opers in kept.values()])
+        for section, section_opers in kept.items():
+            section_opers.sort(key=rank)
+            self[section] = section_opers
+        if dropped:
+            self.log.info('Dropped {0} redundant or colliding operations from the plan'.format(dropped))
+        return dropped
+
+    def createDestinations(self, sections):
+        """ Create the missing destination folders of all the moves of the sections in one go,
+        each folder once, and stop the moves from checking for their own. Moves whose folder
+        could not be created are left to fail on their own. The folders created are remembered
+        so the ones no move used can be removed again, see removeUnused.
+
+        :param sections: Sections whose moves are about to be executed
+        :type sections: list
+        :return: Number of folders created
+        :rtype: int
+        """
+        moves = {}
+        for section in sections:
+            for oper in self[section]:
+                if isinstance(oper, MoveOperation) and oper.create_dest:
+                    dest_dir = oper.destination if isinstance(oper, MoveContentsOperation) else dirname(oper.destination)
+                    moves.setdefault(dest_dir, []).append(oper)
+        created = 0
+        for dest_dir in sorted(moves):
+            missing = [path for path in _parents(abspath(dest_dir)) if not exists(path)]
+            try:
+                makedirs(dest_dir)
+                created += 1
+                self._created.extend(missing)
+            except FileExistsError:
+                pass
+            except OSError as err:
+                self.log.debug('Could not create %s: %s', dest_dir, err)
+                continue
+            for oper in moves[dest_dir]:
+                # Folders nested below the destination are still created by the move itself
+                if not isinstance(oper, MoveContentsOperation):
+                    oper.create_dest = False
+        if created:
+            self.log.info('Created {0} destination folders'.format(created))
+        return created
+
+    def removeUnused(self):
+        """ Remove the folders created by createDestinations which are still empty, eg. when
+        the execution stopped before the moves into them ran, so they are not mistaken for
+        existing shows by the next run
+
+        :return: Number of folders removed
+        :rtype: int
+        """
+        removed = 0
+        # Deepest first, so a parent is only removed once its created children are gone
+        for path in sorted(set(self._created), key=lambda path: path.count(sep), reverse=True):
+            try:
+                rmdir(path)
+                removed += 1
+            except OSError:
+                continue
+        self._created = []
+        if removed:
+            self.log.info('Removed {0} unused destination folders'.format(removed))
+        return removed
+
     def execute(self, sections=None):
         """ Wrapper method to execute all the sections provided and return the overall
         execution status. If no sections are provided all the sections will be executed.
 
+        The missing destination folders are all created before anything executes, see
+        createDestinations, and those left empty are removed again once done. When more than one lane per device is configured the operations
+        are executed in parallel device lanes, see executeLanes.
+
         :param sections: optional list of sections to map
         :type sections: None, list
         :return: Execution has errors status
         :rtype: bool
         """
-        return not any(map(self.executeSection, sections if sections else self.keys()))
+        sections = sections if sections else list(self.keys())
+        if self.journal:
+            self.journal.plan(self)
+        self.createDestinations(sections)
+        try:
+            if self.lanes > 1:
+                return not self.executeLanes(sections)
+            return not any(map(self.executeSection, sections))
+        finally:
+            self.removeUnused()
+            if self.journal:
+                self.journal.sync()
+
+    def executeStream(self, stream, queue_size=64):
+        """ Execute operations while they are still being found. The stream is consumed
+        in the calling thread and the operations are handed over a bounded queue to a
+        executing thread, so scanning blocks once queue_size operations are waiting and
+        the operations are never all held in memory. Streamed operations are executed
+        one at a time in the order found and are not kept in the manager.
+
+        :param stream: Iterable of (section, operation) tuples, see DirectoryScanner.iterAll
+        :type stream: iterable
+        :param queue_size: Maximum number of found operations waiting to be executed
+        :type queue_size: int
+        :return: Execution has errors status
+        :rtype: bool
+        :raises: OperationError
+        """
+        work = Queue(queue_size)
+        abort = Event()
+        failure = []
+
+        def consume():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                if abort.is_set():
+                    # Keep draining so the producer never blocks on a full queue
+                    continue
+                try:
+                    self.executeOperation(item)
+                except Exception as err:
+                    failure.append(err)
+                    abort.set()
+
+        self._streaming = True
+        consumer = Thread(target=consume, name='msort-execute')
+        consumer.start()
+        try:
+            for section, oper in stream:
+                if abort.is_set():
+                    break
+                if self.journal:
+                    self.journal.planOperation(section, oper)
+                work.put(oper)
+        except BaseException:
+            # Interrupted or the scan failed, drop what is still queued instead of executing it
+            abort.set()
+            raise
+        finally:
+            work.put(None)
+            consumer.join()
+            self._streaming = False
+            if self.journal:
+                self.journal.sync()
+        if failure:
+            raise failure[0]
+        return not self.error_list
 
     def showErrors(self):
         """ Display all the error messages. """
@@ -172,6 +772,22 @@ class OperationManager(dict):
         [found.extend(filterType(opers, operation_type)) for opers in self.values()]
         return found
 
+def _parents(path):
+    """ Get a absolute path followed by all of its parent directories
+
+    :param path: Absolute path
+    :type path: str
+    :return: Path and its parents, closest first
+    :rtype: str[]
+    """
+    parents = [path]
+    while True:
+        parent = dirname(path)
+        if parent == path:
+            return parents
+        parents.append(parent)
+        path = parent
+
 def filterType(sequence, object_type):
     """ Get the sequence items matching the type supplied
 
@@ -182,4 +798,22 @@ def filterType(sequence, object_type):
     :return: filter instance of matched sequence items
     :rtype: filter
     """
-    return filter(lambda o: type(o) == object_type,  sequence)
\ No newline at end of file
+    return filter(lambda o: type(o) == object_type,  sequence)
+
+def operation_from_dict(data):
+    """ Create a operation of any type serialized with toDict
+
+    :param data: Serialized operation
+    :type data: dict
+    :return: Operation instance
+    :rtype: BaseOperation
+    :raises: OperationError
+    """
+    try:
+        return _operation_types[data['type']].fromDict(data)
+    except KeyError as err:
+        raise OperationError('Invalid serialized operation {0}: {1}'.format(data, err))
+
+_operation_types = dict([(cls.__name__, cls) for cls in
+                         (MoveOperation, MoveContentsOperation, DeleteOperation, LinkOperation,
+                          DuplicateOperation)])
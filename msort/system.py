@@ -1,8 +1,21 @@
 """
 Provides tools related to calling system applications
 """
+import ctypes
+import ctypes.util
+from os import listdir, readlink, sep
+from platform import machine
+from os.path import abspath, dirname, isdir, join, realpath
 from subprocess import Popen, PIPE
 
+PROC_ROOT = '/proc'
+
+# ioprio_set syscall numbers by architecture, there is no libc wrapper for it
+_ioprio_set_nr = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'armv7l': 314, 'ppc64le': 273}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
 def call_output(args):
     """ Call an application and return its output
 
@@ -12,3 +25,128 @@ def call_output(args):
     :rtype: str
     """
     return Popen(args, stdout=PIPE).communicate()[0].strip()
+
+
+def set_idle_io_priority():
+    """ Put the calling thread in the idle I/O scheduling class, so its disk access only
+    gets served when nothing else wants the disk. Best effort, only supported on linux.
+
+    :return: Priority changed status
+    :rtype: bool
+    """
+    nr = _ioprio_set_nr.get(machine())
+    if nr is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # A pid of 0 applies to the calling thread only
+        return libc.syscall(nr, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+    except (OSError, AttributeError):
+        return False
+
+def has_proc(proc_root=PROC_ROOT):
+    """ Check if a linux style /proc filesystem with per process fd listings is available
+
+    :param proc_root: Mount point of procfs
+    :type proc_root: str
+    :return: /proc availability
+    :rtype: bool
+    """
+    return isdir(join(proc_root, 'self', 'fd'))
+
+def proc_open_files(root=None, proc_root=PROC_ROOT):
+    """ Read the paths held open by every visible process from /proc/<pid>/fd,
+    /proc/<pid>/maps and /proc/<pid>/cwd. Processes which can not be inspected, eg. those
+    of other users when not running as root, are skipped just like lsof would.
+
+    :param root: Only return paths under this (real) directory
+    :type root: str
+    :param proc_root: Mount point of procfs
+    :type proc_root: str
+    :return: Generator of open paths
+    :rtype: str[]
+    """
+    prefix = root.rstrip(sep) + sep if root else sep
+    for pid in listdir(proc_root):
+        if not pid.isdigit():
+            continue
+        pid_root = join(proc_root, pid)
+        links = []
+        try:
+            fd_root = join(pid_root, 'fd')
+            links.extend([join(fd_root, fd) for fd in listdir(fd_root)])
+        except OSError:
+            pass
+        links.append(join(pid_root, 'cwd'))
+        for link in links:
+            try:
+                path = readlink(link)
+            except OSError:
+                continue
+            if path.startswith(prefix) or path == root:
+                yield path
+        try:
+            with open(join(pid_root, 'maps')) as maps:
+                for line in maps:
+                    fields = line.split(None, 5)
+                    if len(fields) == 6 and fields[5].startswith(prefix):
+                        yield fields[5].rstrip('\n')
+        except (IOError, OSError):
+            continue
+
+class OpenFileIndex(object):
+    """ A set of open paths plus a prefix index of all their parent directories. Checking if
+    a path, or anything under it, is open becomes a set lookup instead of a substring search
+    over the full lsof output.
+    """
+    def __init__(self, root=None, paths=None):
+        """ Build the index, reading the open files from /proc unless paths are given
+
+        :param root: Only index open paths under this directory
+        :type root: str
+        :param paths: Open paths to index instead of reading them from /proc
+        :type paths: str[]
+        """
+        self.root = abspath(root) if root else None
+        self.real_root = realpath(self.root) if root else None
+        self.files = set()
+        self.dirs = set()
+        for path in paths if paths is not None else proc_open_files(self.real_root):
+            self.add(path)
+
+    def add(self, path):
+        """ Add a open path and all its parent directories, up to the root, to the index
+
+        :param path: Open path
+        :type path: str
+        """
+        self.files.add(path)
+        parent = dirname(path)
+        while parent not in self.dirs and parent != path:
+            self.dirs.add(parent)
+            if parent == self.real_root:
+                break
+            path, parent = parent, dirname(parent)
+
+    def resolve(self, path):
+        """ Translate the path into the resolved form /proc reports paths in. Paths under
+        the index root only need the root prefix swapped.
+
+        :param path: Path to resolve
+        :type path: str
+        :return: Real path
+        :rtype: str
+        """
+        path = abspath(path)
+        if self.root is None:
+            return realpath(path)
+        if self.root != self.real_root and (path == self.root or path.startswith(self.root + sep)):
+            return self.real_root + path[len(self.root):]
+        return path
+
+    def __contains__(self, path):
+        path = self.resolve(path)
+        return path in self.files or path in self.dirs
+
+    def __len__(self):
+        return len(self.files)
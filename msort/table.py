@@ -0,0 +1,164 @@
+"""
+Columnar table of the entries of a directory, handed to BaseCheck.checkBatch so a check can
+evaluate a whole batch of entries with a few array operations instead of a call per entry.
+
+Columns are NumPy arrays when NumPy is installed and ListColumn's, which support the same
+element wise comparisons in pure python, when it is not. Every column is only built the
+first time a check asks for it.
+"""
+from math import isnan
+from os.path import basename
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ListColumn(list):
+    """ Pure python stand-in for a NumPy array, comparisons and the &, | and ~ operators
+    work element wise and return a new ListColumn
+    """
+    def _map(self, other, func):
+        if isinstance(other, list):
+            return ListColumn([func(a, b) for a, b in zip(self, other)])
+        return ListColumn([func(a, other) for a in self])
+
+    def __lt__(self, other): return self._map(other, lambda a, b: a < b)
+    def __le__(self, other): return self._map(other, lambda a, b: a <= b)
+    def __gt__(self, other): return self._map(other, lambda a, b: a > b)
+    def __ge__(self, other): return self._map(other, lambda a, b: a >= b)
+    def __eq__(self, other): return self._map(other, lambda a, b: a == b)
+    def __ne__(self, other): return self._map(other, lambda a, b: a != b)
+    def __and__(self, other): return self._map(other, lambda a, b: bool(a and b))
+    def __or__(self, other): return self._map(other, lambda a, b: bool(a or b))
+    def __invert__(self): return ListColumn([not a for a in self])
+    __hash__ = None
+
+def column(values, dtype):
+    """ Build a column from a sequence of values
+
+    :param values: Column values
+    :type values: list
+    :param dtype: NumPy type of the column, ignored without NumPy
+    :type dtype: str
+    :return: Column
+    :rtype: numpy.ndarray | ListColumn
+    """
+    if numpy is not None:
+        return numpy.fromiter(values, dtype=dtype, count=len(values))
+    return ListColumn(values)
+
+def nonzero(mask):
+    """ Get the row numbers of the true values of a mask
+
+    :param mask: Boolean column
+    :type mask: numpy.ndarray | ListColumn
+    :rtype: int[]
+    """
+    if numpy is not None and isinstance(mask, numpy.ndarray):
+        return numpy.flatnonzero(mask).tolist()
+    return [i for i, value in enumerate(mask) if value]
+
+def _stat(path, default):
+    try:
+        return path.stat()
+    except OSError:
+        return default
+
+class EntryTable(object):
+    """ The paths of a batch of entries along with their columns: mtime, size (recursive, like
+    Path.size), is_dir, is_file and device. Entries which cant be stat'd have a NaN mtime, a
+    size and device of -1 and are neither directories nor files.
+    """
+    def __init__(self, paths):
+        """
+        :param paths: Entries of the batch
+        :type paths: Path[]
+        """
+        self.paths = list(paths)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def names(self):
+        return [basename(path) for path in self.paths]
+
+    def _column(self, name, build, dtype):
+        values = self._columns.get(name)
+        if values is None:
+            values = self._columns[name] = column([build(path) for path in self.paths], dtype)
+        return values
+
+    @property
+    def mtime(self):
+        return self._column('mtime', lambda path: getattr(_stat(path, None), 'st_mtime', float('nan')), 'float64')
+
+    @property
+    def device(self):
+        return self._column('device', lambda path: getattr(_stat(path, None), 'st_dev', -1), 'int64')
+
+    @property
+    def is_dir(self):
+        return self._column('is_dir', lambda path: path.isdir, 'bool')
+
+    @property
+    def is_file(self):
+        return self._column('is_file', lambda path: path.isfile, 'bool')
+
+    @property
+    def size(self):
+        def size(path):
+            try:
+                return path.size
+            except OSError:
+                return -1
+        return self._column('size', size, 'int64')
+
+    @property
+    def valid(self):
+        """ Mask of the entries which could be stat'd """
+        if numpy is not None:
+            return ~numpy.isnan(self.mtime)
+        return ListColumn([not isnan(value) for value in self.mtime])
+
+    def isin(self, paths):
+        """ Get the mask of the entries whose path is in a set of paths
+
+        :param paths: Paths to look for
+        :type paths: set
+        :rtype: numpy.ndarray | ListColumn
+        """
+        return column([path in paths for path in self.paths], 'bool')
+
+    def take(self, rows):
+        """ Get a table of only some of the entries, carrying over the columns already built
+
+        :param rows: Row numbers to keep
+        :type rows: int[]
+        :return: New table
+        :rtype: EntryTable
+        """
+        table = EntryTable([self.paths[i] for i in rows])
+        for name, values in self._columns.items():
+            if numpy is not None and isinstance(values, numpy.ndarray):
+                table._columns[name] = values[numpy.asarray(rows, dtype='intp')]
+            else:
+                table._columns[name] = ListColumn([values[i] for i in rows])
+        return table
+
+    def results(self, mask, make):
+        """ Build the per entry results of a check from a mask, entries outside of it get False
+
+        :param mask: Entries the check matched
+        :type mask: numpy.ndarray | ListColumn
+        :param make: Called with a matched path, returns its result
+        :type make: callable
+        :return: Results in row order
+        :rtype: list
+        """
+        results = [False] * len(self.paths)
+        for i in nonzero(mask):
+            results[i] = make(self.paths[i])
+        return results
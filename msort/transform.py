@@ -2,9 +2,16 @@
 String transformations used to try and normalize different naming schemes.
 """
 import re
+from functools import lru_cache
 
 default_sep = '.'
-default_spacers = ('.', ' ', '_')
+default_spacers = frozenset(('.', ' ', '_'))
+
+# Number of distinct (word, sep) pairs cleanup remembers
+cleanup_cache_size = 4096
+
+# Compiled "collapse repeated separators" regexes, keyed by separator
+_sep_runs = {}
 
 def upperwords(word, sep=default_sep):
     """ Split a string by the seperator value and uppercase transform the first character
@@ -35,6 +42,13 @@ def cleanup(word, sep=default_sep):
 
      It currently does the following steps:
 
+     - Split the words on upper case letters and spacers, joining them with sep
+     - Remove quotes
+     - Replace whitespace and dashes with sep, collapsing repeated seperators
+     - Strip a trailing seperator and upper case the first letter of each word
+
+     Episodes of the same show clean to the same name over and over, so the results are
+     memoized in a bounded LRU cache keyed on (word, sep).
 
     :param word: String of words to clean
     :type word: str
@@ -43,9 +57,17 @@ def cleanup(word, sep=default_sep):
     :return: Cleaned and formatted string
     :rtype: str
     """
+    return _cleanup(str(word), sep)
+
+@lru_cache(maxsize=cleanup_cache_size)
+def _cleanup(word, sep):
     word = sep.join(split_uc_words(word))
     word = word.replace('\'', '')
-    w = re.sub('\{0}+'.format(sep), sep, sep.join(sep.join(word.split()).replace('-', sep).split(sep)))
+    try:
+        sep_runs = _sep_runs[sep]
+    except KeyError:
+        sep_runs = _sep_runs[sep] = re.compile('\\{0}+'.format(sep))
+    w = sep_runs.sub(sep, sep.join(word.split()).replace('-', sep))
     if w.endswith(sep):
         w = w[0:len(w)-1]
     return upperwords(w)
@@ -63,28 +85,25 @@ def split_uc_words(words):
     """
     size = len(words)-1
     new_words = []
-    tmp_word = ''
+    tmp_word = []
     for i, c in enumerate(words):
         if i == 0 or c.isupper():
             # Make sure the first character is capitalized
-            tmp_word += c.upper()
-        else:
-            if i+1 <= size:
-                if c in default_spacers:
-                    new_words.append(tmp_word)
-                    tmp_word = ''
-                elif words[i+1].isupper():
-                    # Next character is uppercase, so this is the end of the current word
-                    tmp_word += c
-                    new_words.append(tmp_word)
-                    tmp_word = ''
-                else:
-                    tmp_word += c
+            tmp_word.append(c.upper())
+        elif i < size:
+            if c in default_spacers:
+                new_words.append(''.join(tmp_word))
+                tmp_word = []
+            elif words[i+1].isupper():
+                # Next character is uppercase, so this is the end of the current word
+                tmp_word.append(c)
+                new_words.append(''.join(tmp_word))
+                tmp_word = []
             else:
-                tmp_word += c
-                new_words.append(tmp_word)
+                tmp_word.append(c)
+        else:
+            tmp_word.append(c)
+            new_words.append(''.join(tmp_word))
     if not new_words and tmp_word:
-        return [tmp_word]
+        return [''.join(tmp_word)]
     return new_words
-
-
@@ -0,0 +1,156 @@
+"""
+Deferred deletion. Paths are atomically renamed into a per filesystem trash directory and
+unlinked later by a background reaper running at idle I/O priority.
+"""
+from itertools import count
+from os import getpid, makedirs, rename
+from os.path import basename, exists, isdir, join
+from threading import Thread, Event
+from time import time
+
+from msort.log import getLogger
+from msort.filesystem import TRASH_DIR, dir_size, fmt_size, mount_point, remove_tree, scandir
+from msort.system import set_idle_io_priority
+
+_counter = count()
+
+def trash_dir(path):
+    """ Get the trash directory of the filesystem the path lives on
+
+    :param path: Existing path
+    :type path: str
+    :return: Trash directory
+    :rtype: str
+    """
+    return join(mount_point(path), TRASH_DIR)
+
+def move_to_trash(path):
+    """ Atomically move a path into the trash directory of its filesystem
+
+    :param path: Path to trash
+    :type path: str
+    :return: New location of the path in the trash
+    :rtype: str
+    :raises: OSError
+    """
+    trash = trash_dir(path)
+    if not exists(trash):
+        try:
+            makedirs(trash)
+        except OSError:
+            # Created by another thread or process in the meantime
+            if not isdir(trash):
+                raise
+    target = join(trash, '{0}.{1}.{2}.{3}'.format(int(time()), getpid(), next(_counter), basename(path)))
+    rename(path, target)
+    return target
+
+def trash_size(path):
+    """ Get the bytes trashed on the filesystem of a path which are still waiting to be reaped
+
+    :param path: Existing path
+    :type path: str
+    :return: Total size of the trash
+    :rtype: int
+    """
+    trash = trash_dir(path)
+    size = 0
+    if not isdir(trash):
+        return size
+    for entry in scandir(trash):
+        try:
+            size += dir_size(entry)
+        except OSError:
+            # Reaped in the meantime
+            continue
+    return size
+
+def reap(trash):
+    """ Unlink everything in a trash directory
+
+    :param trash: Trash directory
+    :type trash: str
+    :return: Number of entries removed and the bytes they freed
+    :rtype: tuple
+    """
+    reaped = freed = 0
+    if not isdir(trash):
+        return reaped, freed
+    for path in scandir(trash):
+        try:
+            freed += remove_tree(path).size
+        except OSError:
+            continue
+        reaped += 1
+    return reaped, freed
+
+class Reaper(Thread):
+    """ Background thread emptying the trash directories given. It keeps emptying them
+    until stop() is called, then makes a final pass and exits. Anything a previous, killed,
+    run left in the trash is finished by the first pass.
+    """
+    def __init__(self, trash_dirs, interval=1):
+        """
+        :param trash_dirs: Trash directories to empty
+        :type trash_dirs: list
+        :param interval: Seconds to wait between passes
+        :type interval: float
+        """
+        Thread.__init__(self, name='msort-reaper')
+        self.daemon = True
+        self.log = getLogger(__name__)
+        self.trash_dirs = sorted(set(trash_dirs))
+        self.interval = interval
+        self.reaped = 0
+        self.freed = 0
+        self._stop_event = Event()
+
+    def reapAll(self):
+        """ Make a single pass over all the trash directories
+
+        :return: Number of entries removed
+        :rtype: int
+        """
+        reaped = 0
+        for trash in self.trash_dirs:
+            count, freed = reap(trash)
+            reaped += count
+            self.freed += freed
+        self.reaped += reaped
+        return reaped
+
+    def run(self):
+        if not set_idle_io_priority():
+            self.log.debug('Could not lower the reaper I/O priority')
+        while not self._stop_event.is_set():
+            if not self.reapAll():
+                self._stop_event.wait(self.interval)
+        self.reapAll()
+        self.log.debug('Reaper removed {0} trashed entries, freeing {1}'.format(self.reaped, fmt_size(self.freed)))
+
+    def stop(self, wait=True):
+        """ Ask the reaper to make its final pass and exit
+
+        :param wait: Wait for the final pass to complete
+        :type wait: bool
+        """
+        self._stop_event.set()
+        if wait and self.is_alive():
+            self.join()
+
+def find_trash_dirs(paths):
+    """ Get the trash directories of the filesystems of the given paths, skipping paths
+    which dont exist.
+
+    :param paths: Paths to find the trash directories of
+    :type paths: list
+    :return: Trash directories
+    :rtype: set
+    """
+    found = set()
+    for path in paths:
+        try:
+            found.add(trash_dir(path))
+        except OSError:
+            continue
+    return found
@@ -0,0 +1,270 @@
+"""
+Event driven watching of the section sources using inotify, called through ctypes so no
+extra dependency is needed.
+"""
+import ctypes
+import ctypes.util
+from collections import namedtuple
+from errno import EINTR
+from os import read, close, fsencode, fsdecode
+from os.path import join
+from select import select
+from struct import calcsize, unpack_from
+from time import time
+
+from msort import MSortError
+from msort.log import getLogger
+from msort.filesystem import Path, scandir, size_index
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Events which mean a entry is still being written to or was just added
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MOVED_FROM | IN_DELETE
+
+_event_header = 'iIII'
+_event_size = calcsize(_event_header)
+
+InotifyEvent = namedtuple('InotifyEvent', 'wd mask cookie name')
+
+class InotifyError(MSortError):
+    """ Thrown when inotify is unavailable or a watch cant be added """
+    pass
+
+class Inotify(object):
+    """ Minimal ctypes wrapper around the linux inotify API """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as err:
+            raise InotifyError('inotify is not available: {0}'.format(err))
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyError('inotify_init1 failed: {0}'.format(ctypes.get_errno()))
+
+    def addWatch(self, path, mask=WATCH_MASK):
+        """ Watch a directory for the events in the mask
+
+        :param path: Directory to watch
+        :type path: str
+        :param mask: inotify event mask
+        :type mask: int
+        :return: Watch descriptor
+        :rtype: int
+        :raises: InotifyError
+        """
+        wd = self._libc.inotify_add_watch(self.fd, fsencode(path), mask)
+        if wd < 0:
+            raise InotifyError('Failed to watch {0}: {1}'.format(path, ctypes.get_errno()))
+        return wd
+
+    def removeWatch(self, wd):
+        """ Stop watching a watch descriptor
+
+        :param wd: Watch descriptor
+        :type wd: int
+        """
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """ Wait up to timeout seconds for events and return them
+
+        :param timeout: Seconds to wait, None to block
+        :type timeout: float
+        :return: Events read
+        :rtype: InotifyEvent[]
+        """
+        try:
+            ready, _, _ = select([self.fd], [], [], timeout)
+        except (OSError, IOError) as err:
+            if err.args[0] == EINTR:
+                return []
+            raise
+        if not ready:
+            return []
+        try:
+            data = read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _event_size <= len(data):
+            wd, mask, cookie, length = unpack_from(_event_header, data, offset)
+            offset += _event_size
+            name = fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        """ Close the inotify instance, removing all of its watches """
+        close(self.fd)
+
+class Watcher(object):
+    """ Watch the sources of the sections given for new or renamed entries.
+
+    Every top level directory entry is watched recursively so writes anywhere inside it
+    postpone it. Once a entry has had no events for settle seconds it is handed to the
+    DirectoryScanner, only running the registered checkers against the settled entries.
+    """
+    def __init__(self, scanner, sections, settle=10):
+        """
+        :param scanner: Scanner with the checkers to run registered
+        :type scanner: DirectoryScanner
+        :param sections: Section names to watch
+        :type sections: list
+        :param settle: Seconds a entry must go without events before being checked
+        :type settle: float
+        """
+        self.log = getLogger(__name__)
+        self.scanner = scanner
+        self.sections = list(sections)
+        self.settle = settle
+        self.inotify = Inotify()
+        # wd -> (section, watched directory, top level entry or None for a source root)
+        self.watches = {}
+        # (section, top level entry) -> time of the last event
+        self.pending = {}
+
+    def start(self):
+        """ Add the watches on the sources of all the sections """
+        for section in self.sections:
+            source = self.scanner.conf.getSourcePath(section)
+            self._watch(section, source, None)
+            self.log.info('Watching section {0}: {1}'.format(section, source))
+
+    def _watch(self, section, path, entry):
+        """ Watch a directory and, for directories inside a top level entry, its sub
+        directories as well.
+
+        :param section: Section name
+        :type section: str
+        :param path: Directory to watch
+        :type path: str
+        :param entry: Top level entry the directory belongs to, None for the source root
+        :type entry: str
+        """
+        try:
+            wd = self.inotify.addWatch(path)
+        except InotifyError as err:
+            # Removed before the watch could be added, the parent event covers it
+            self.log.debug(err)
+            return
+        self.watches[wd] = (section, path, entry)
+        if entry is not None:
+            try:
+                for child in scandir(path):
+                    if child.isdir:
+                        self._watch(section, child, entry)
+            except OSError:
+                pass
+
+    def _unwatch(self, entry):
+        """ Remove the watches of a top level entry which left the source. Watches follow
+        the inode, so they would otherwise keep reporting events from its new location.
+
+        :param entry: Top level entry
+        :type entry: str
+        """
+        for wd, (_, _, watched_entry) in list(self.watches.items()):
+            if watched_entry == entry:
+                self.inotify.removeWatch(wd)
+                del self.watches[wd]
+
+    def handleEvent(self, event, now=None):
+        """ Update the pending entries from a inotify event
+
+        :param event: Event read from inotify
+        :type event: InotifyEvent
+        :param now: Time of the event
+        :type now: float
+        """
+        now = time() if now is None else now
+        if event.mask & IN_Q_OVERFLOW:
+            self.log.warn('inotify queue overflowed, checking all entries again')
+            for section in self.sections:
+                for path in scandir(self.scanner.conf.getSourcePath(section)):
+                    self.pending[(section, str(path))] = now
+            return
+        try:
+            section, path, entry = self.watches[event.wd]
+        except KeyError:
+            return
+        if event.mask & IN_IGNORED:
+            del self.watches[event.wd]
+            return
+        if entry is None:
+            if not event.name:
+                return
+            entry = join(path, event.name)
+            if event.mask & (IN_MOVED_FROM | IN_DELETE):
+                self.pending.pop((section, entry), None)
+                self._unwatch(entry)
+                return
+            if event.mask & IN_ISDIR and event.mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch(section, entry, entry)
+        elif event.mask & IN_ISDIR and event.mask & (IN_CREATE | IN_MOVED_TO):
+            self._watch(section, join(path, event.name), entry)
+        self.pending[(section, entry)] = now
+
+    def poll(self, timeout=None):
+        """ Read and handle the available events
+
+        :param timeout: Seconds to wait for events
+        :type timeout: float
+        """
+        for event in self.inotify.read(timeout):
+            self.handleEvent(event)
+
+    def settled(self, now=None):
+        """ Pop the entries which have gone settle seconds without a event
+
+        :param now: Current time
+        :type now: float
+        :return: dict of section -> settled entry paths
+        :rtype: dict
+        """
+        now = time() if now is None else now
+        ready = {}
+        for key, last in list(self.pending.items()):
+            if now - last >= self.settle:
+                del self.pending[key]
+                ready.setdefault(key[0], []).append(key[1])
+        return ready
+
+    def run(self, callback):
+        """ Watch forever, calling callback(section, operations) with the operations found
+        for the settled entries of each section.
+
+        :param callback: Called with the section and the operations found
+        :type callback: callable
+        """
+        self.start()
+        try:
+            while True:
+                timeout = None
+                if self.pending:
+                    timeout = max(0, min(self.pending.values()) + self.settle - time())
+                self.poll(timeout)
+                for section, paths in self.settled().items():
+                    # Sizes indexed by earlier batches may be stale by now
+                    size_index.clear()
+                    operations = self.scanner.findPaths(section, [Path(p) for p in sorted(paths, reverse=True)])
+                    if operations:
+                        callback(section, operations)
+        finally:
+            self.inotify.close()
@@ -31,6 +31,34 @@ class TestCommand(Command):
         tests = TestLoader().loadTestsFromNames(testfiles)
         t = TextTestRunner(verbosity = 1)
         t.run(tests)
+
+class BenchCommand(Command):
+    description = 'run the scan and execute benchmarks'
+    user_options = [
+        ('sizes=', 's', 'comma separated numbers of top level entries to benchmark'),
+        ('output=', 'o', 'JSON file to write the results to'),
+        ('dir=', 'd', 'directory to generate the trees in, defaults to /dev/shm'),
+    ]
+
+    def initialize_options(self):
+        self.sizes = None
+        self.output = None
+        self.dir = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        """
+        Runs benchmarks/bench.py, see it for the results written.
+        """
+        from benchmarks import bench
+        args = []
+        for option, value in (('--sizes', self.sizes), ('--output', self.output), ('--dir', self.dir)):
+            if value:
+                args.extend([option, value])
+        bench.main(args)
+
 setup(
     name='msort',
     version='2.0',
@@ -40,7 +68,7 @@ setup(
     url='https://msort.cudd.li/',
     packages=['msort', 'msort.check'],
     scripts=['mediasort.py'],
-    cmdclass = { 'test': TestCommand },
+    cmdclass = { 'test': TestCommand, 'bench': BenchCommand },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',
@@ -4,6 +4,7 @@ from msort.filesystem import Path
 from msort.conf import Config
 from msort.check import CheckSkip
 from msort.check.age import AgeCheck
+from msort.table import EntryTable
 
 import unittest
 
@@ -32,6 +33,16 @@ class TestAgeScanner(unittest.TestCase):
         scanner(None, file_path)
         if exists(file_path):
             remove(file_path)
+    def test_batch_missing(self):
+        file_path = Path('open_file')
+        with open(file_path, 'w') as fp: fp.write('')
+        utime(file_path, (1000,1000))
+        try:
+            results = AgeCheck(self.config).checkBatch(None, EntryTable([file_path, Path('missing_file')]))
+        finally:
+            remove(file_path)
+        self.assertFalse(results[0])
+        self.assertTrue(isinstance(results[1], CheckSkip))
 
 if __name__ == '__main__':
     unittest.main()
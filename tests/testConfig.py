@@ -7,7 +7,7 @@ try:
     import unittest2 as unittest
 except ImportError:
     import unittest
-from msort.conf import Config, ConfigError
+from msort.conf import Config, ConfigError, NoSectionError
 
 class ConfigTest(unittest.TestCase):
 
@@ -58,5 +58,41 @@ class ConfigTest(unittest.TestCase):
         self.assertFalse(self.conf.has_option('BAD_TEST', 'sorted'))
         self.assertFalse(self.conf.isSorted('BAD_TEST'))
 
+    def testSettings(self):
+        tv = self.conf.settings('TV')
+        self.assertTrue(tv.sorted)
+        self.assertFalse(tv.sort_seasons)
+        self.assertTrue(tv.enabled)
+        self.assertEqual(2, len(tv.rules))
+        self.assertEqual('Top.Gear', tv.matcher.search('Top.Gear.17x06.HDTV.XviD-FoV').group('name'))
+        self.assertFalse(self.conf.settings('XVID').sorted)
+
+    def testGeneralSettings(self):
+        general = self.conf.general
+        self.assertEqual(frozenset(['TV', 'XVID', 'DVDR']), general.scan_sections)
+        self.assertFalse(general.error_continue)
+        self.assertTrue(general.lock_rx.search('.incomplete'))
+        self.assertEqual(3 * 86400, general.min_age)
+
+    def testSettingsRebuiltOnSet(self):
+        self.conf.set('TV', 'sort_seasons', 'true')
+        self.assertTrue(self.conf.settings('TV').sort_seasons)
+        self.conf.set('general', 'error_continue', 'true')
+        self.assertTrue(self.conf.general.error_continue)
+
+    def testSettingsMissingSection(self):
+        self.assertRaises(NoSectionError, self.conf.settings, 'FAIL_SECTION')
+
+    def testInvalidSettings(self):
+        self.conf.remove_option('general', 'lock_pattern')
+        self.assertRaises(ConfigError, self.conf.compile)
+        self.conf.set('general', 'lock_pattern', '(')
+        self.assertRaises(ConfigError, self.conf.compile)
+        self.conf.set('general', 'lock_pattern', 'lock')
+        self.conf.set('TV', 'rx9', '[')
+        with self.assertRaises(ConfigError) as ctx:
+            self.conf.compile()
+        self.assertTrue('rx9' in str(ctx.exception))
+
 
 if __name__ == '__main__': unittest.main()
\ No newline at end of file
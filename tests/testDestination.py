@@ -0,0 +1,43 @@
+from os import makedirs
+from os.path import exists, join, dirname
+from shutil import rmtree
+import unittest
+
+from msort.destination import DestinationIndex, canonical
+
+class TestDestinationIndex(unittest.TestCase):
+    def setUp(self):
+        self.dest = join(dirname(__file__), 'test_root')
+        if exists(self.dest):
+            rmtree(self.dest)
+        for name in ('Top.Gear', 'The Thick Of It', 'top_gear'):
+            makedirs(join(self.dest, name))
+        with open(join(self.dest, 'Regular.Show'), 'w') as fp:
+            fp.write('')
+
+    def tearDown(self):
+        rmtree(self.dest, ignore_errors=True)
+
+    def testCanonical(self):
+        self.assertEqual('topgear', canonical('Top.Gear'))
+        self.assertEqual(canonical('The.Thick.of.It'), canonical("The Thick Of It"))
+        self.assertEqual('', canonical('...'))
+
+    def testResolve(self):
+        index = DestinationIndex(self.dest)
+        self.assertEqual(2, len(index))
+        self.assertEqual(join(self.dest, 'Top.Gear'), index.resolve('Top.gear'))
+        self.assertEqual(join(self.dest, 'The Thick Of It'), index.resolve('The.Thick.Of.It'))
+        # Files are not folders to sort into
+        self.assertEqual(join(self.dest, 'Regular.show'), index.resolve('Regular.show'))
+        # New folders resolve to the first name seen
+        self.assertEqual(join(self.dest, 'Regular.show'), index.resolve('Regular.Show'))
+        self.assertEqual(join(self.dest, '...'), index.resolve('...'))
+
+    def testMissingDest(self):
+        index = DestinationIndex(join(self.dest, 'missing'))
+        self.assertEqual(0, len(index))
+        self.assertEqual(join(self.dest, 'missing', 'Show'), index.resolve('Show'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+from os import makedirs, link, stat, utime
+from os.path import exists, join, dirname, abspath
+from shutil import rmtree
+import unittest
+
+from init_test_config import conf
+
+from msort.check import duplicate
+from msort.check.duplicate import DuplicateCheck, partial_hash, full_hash
+from msort.check.prune import Pruner
+from msort.filesystem import Path
+from msort.operation import DuplicateOperation, OperationError, operation_from_dict
+
+MiB = 1024 ** 2
+
+class TestDuplicateCheck(unittest.TestCase):
+    def setUp(self):
+        self.root_path = abspath(join(dirname(__file__), 'test_root'))
+        if exists(self.root_path):
+            rmtree(self.root_path)
+        for d in ['TV', 'SRC_XVID/Movie.2011.DVDRip.XviD-A', 'SRC_XVID/Movie.2011.DVDRip.XviD-B',
+                  'XVID/Movie.2011.DVDRip.XviD-C', 'SRC_DVDR']:
+            makedirs(join(self.root_path, d))
+        big = b'a' * MiB + b'b' * MiB + b'c' * MiB
+        # Same first and last MiB as big, only a full hash tells them apart
+        self.write('SRC_XVID/Movie.2011.DVDRip.XviD-A/movie.avi', big, 100)
+        self.write('SRC_XVID/Movie.2011.DVDRip.XviD-B/movie.avi', big, 200)
+        self.write('XVID/Movie.2011.DVDRip.XviD-C/movie.avi', big, 300)
+        self.write('SRC_XVID/Movie.2011.DVDRip.XviD-B/other.avi', b'a' * MiB + b'x' * MiB + b'c' * MiB, 100)
+        self.write('SRC_DVDR/small.iso', b'd' * 2 * MiB, 100)
+        self.write('SRC_XVID/small.iso', b'd' * 2 * MiB, 200)
+        link(join(self.root_path, 'SRC_DVDR/small.iso'), join(self.root_path, 'SRC_DVDR/small.link.iso'))
+        self.cache_path = join(self.root_path, 'hashes')
+        conf.add_section('duplicates')
+        conf.set('duplicates', 'cache_path', self.cache_path)
+
+    def tearDown(self):
+        conf.remove_section('duplicates')
+        rmtree(self.root_path, ignore_errors=True)
+
+    def write(self, name, data, mtime):
+        path = join(self.root_path, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        utime(path, (mtime, mtime))
+
+    def find(self, checker):
+        found = {}
+        for section in ('TV', 'XVID', 'DVDR'):
+            checker.prepare(section)
+            source = conf.getSourcePath(section)
+            for name in sorted(Path(source).listing):
+                for oper in checker(section, Path(name)):
+                    found[oper.source[len(self.root_path) + 1:]] = oper
+        return found
+
+    def testHashes(self):
+        path = join(self.root_path, 'SRC_XVID/Movie.2011.DVDRip.XviD-A/movie.avi')
+        other = join(self.root_path, 'SRC_XVID/Movie.2011.DVDRip.XviD-B/other.avi')
+        self.assertEqual(partial_hash(path), partial_hash(other))
+        self.assertNotEqual(full_hash(path), full_hash(other))
+        small = join(self.root_path, 'SRC_DVDR/small.iso')
+        self.assertEqual(partial_hash(small), full_hash(small))
+
+    def testFindDuplicates(self):
+        checker = DuplicateCheck(conf)
+        found = self.find(checker)
+        # The copy in the XVID destination is kept, the oldest copy of small.iso is kept and
+        # the hard link to it is not a duplicate
+        self.assertEqual(['SRC_XVID/Movie.2011.DVDRip.XviD-A/movie.avi', 'SRC_XVID/Movie.2011.DVDRip.XviD-B/movie.avi',
+                          'SRC_XVID/small.iso'], sorted(found))
+        self.assertTrue(all([isinstance(oper, DuplicateOperation) and not oper.link for oper in found.values()]))
+        checker.cache.close()
+
+    def testCachedHashes(self):
+        checker = DuplicateCheck(conf)
+        self.find(checker)
+        checker.cache.close()
+        hashed = []
+        original = duplicate.partial_hash
+        duplicate.partial_hash = lambda path: hashed.append(path) or original(path)
+        try:
+            checker = DuplicateCheck(conf)
+            self.assertEqual(3, len(self.find(checker)))
+            checker.cache.close()
+        finally:
+            duplicate.partial_hash = original
+        self.assertEqual([], hashed)
+
+    def testRefresh(self):
+        checker = DuplicateCheck(conf)
+        checker.begin(['TV', 'XVID', 'DVDR'])
+        self.assertEqual(3, len(self.find(checker)))
+        self.write('SRC_XVID/small.copy.iso', b'd' * 2 * MiB, 300)
+        new = Path(join(self.root_path, 'SRC_XVID/small.copy.iso'))
+        walked = []
+        original = duplicate.walk_files
+        duplicate.walk_files = lambda root: walked.append(root) or original(root)
+        try:
+            # Only the new entry is looked at in watch mode, the roots are not walked again
+            checker.refresh('XVID', [new])
+            self.assertEqual([], walked)
+            self.assertEqual([new], [oper.source for oper in checker('XVID', new)])
+            # A new run searches the roots again
+            checker.begin(['XVID'])
+            checker.prepare('XVID')
+            self.assertNotEqual([], walked)
+        finally:
+            duplicate.walk_files = original
+        checker.cache.close()
+
+    def testPrunedNotKept(self):
+        makedirs(join(self.root_path, 'SRC_DVDR/Show.2011.01.01.HDTV.x264-A'))
+        self.write('SRC_DVDR/Show.2011.01.01.HDTV.x264-A/show.mkv', b'e' * 2 * MiB, 100)
+        utime(join(self.root_path, 'SRC_DVDR/Show.2011.01.01.HDTV.x264-A'), (100, 100))
+        self.write('SRC_XVID/show.copy.mkv', b'e' * 2 * MiB, 200)
+        checker = DuplicateCheck(conf)
+        self.assertTrue('SRC_XVID/show.copy.mkv' in self.find(checker))
+        checker.cache.close()
+        # The oldest copy is pruned, so the only copy left is not removed as well
+        checker = DuplicateCheck(conf, Pruner(conf))
+        found = self.find(checker)
+        checker.cache.close()
+        self.assertEqual(['SRC_XVID/Movie.2011.DVDRip.XviD-A/movie.avi', 'SRC_XVID/Movie.2011.DVDRip.XviD-B/movie.avi',
+                          'SRC_XVID/small.iso'], sorted(found))
+
+    def testKeptChanged(self):
+        checker = DuplicateCheck(conf)
+        found = self.find(checker)
+        checker.cache.close()
+        # The plan runs later, after the kept copy was replaced
+        oper = operation_from_dict(found['SRC_XVID/small.iso'].toDict())
+        self.write('SRC_DVDR/small.iso', b'd' * 2 * MiB, 400)
+        self.assertRaises(OperationError, oper)
+        self.assertTrue(exists(join(self.root_path, 'SRC_XVID/small.iso')))
+        oper = found['SRC_XVID/Movie.2011.DVDRip.XviD-A/movie.avi']
+        oper()
+        self.assertTrue(oper.completed())
+
+    def testLink(self):
+        conf.set('duplicates', 'action', 'link')
+        checker = DuplicateCheck(conf)
+        found = self.find(checker)
+        checker.cache.close()
+        oper = found['SRC_XVID/small.iso']
+        self.assertTrue(isinstance(oper, DuplicateOperation) and oper.link)
+        self.assertFalse(oper.completed())
+        oper()
+        self.assertTrue(oper.completed())
+        self.assertEqual(stat(join(self.root_path, 'SRC_DVDR/small.iso')).st_ino,
+                         stat(join(self.root_path, 'SRC_XVID/small.iso')).st_ino)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from os.path import join, dirname, exists
-from os import makedirs
+from os import makedirs, utime, stat, symlink, readlink, listdir
+from os.path import islink
 from shutil import rmtree
 from msort import filesystem
 from msort.check import CheckError, BaseCheck
@@ -71,6 +72,100 @@ class FilesystemTest(unittest.TestCase):
         size = filesystem.dir_size('./')
         self.assertTrue(size > 0)
 
+    def test_size_index(self):
+        index = filesystem.SizeIndex()
+        with open(join(self.folder, 'inner.avi'), 'w') as fp: fp.write('x'*500)
+        self.assertEqual(1500, index.size(self.dir_root))
+        self.assertEqual(2, len(index))
+        # Subtrees already indexed are not walked again during the same scan
+        with open(join(self.folder, 'inner.avi'), 'a') as fp: fp.write('x'*500)
+        self.assertEqual(1500, index.size(self.dir_root))
+        index.clear()
+        self.assertEqual(2000, index.size(self.dir_root))
+
+    def test_scandir(self):
+        paths = dict((p, p) for p in filesystem.scandir(self.dir_root))
+        self.assertEqual(set([self.folder, self.file]), set(paths))
+        folder, avi = paths[self.folder], paths[self.file]
+        self.assertTrue(folder.isdir)
+        self.assertFalse(folder.isfile)
+        self.assertTrue(avi.isfile)
+        self.assertEqual(1000, avi.size)
+        # The stat result is cached on the instance
+        self.assertTrue(avi.stat() is avi.stat())
+
+    def test_iter_entries(self):
+        names = ['entry.{0:03d}'.format(i) for i in range(50)] + ['new\nline', 'ünicode']
+        for name in names:
+            with open(join(self.folder, name), 'w') as fp: fp.write('x')
+        expected = [join(self.folder, name) for name in sorted(names, reverse=True)]
+        self.assertEqual(expected, list(filesystem.iter_entries(self.folder)))
+        for chunk in (1, 7, 52, 100):
+            entries = list(filesystem.iter_entries(self.folder, filesystem.ORDER_SORTED, chunk))
+            self.assertEqual(expected, entries)
+            self.assertTrue(all([isinstance(entry, filesystem.Path) for entry in entries]))
+        unordered = list(filesystem.iter_entries(self.folder, filesystem.ORDER_UNORDERED))
+        self.assertEqual(sorted(expected), sorted(unordered))
+
+    def test_path_stat(self):
+        path = filesystem.Path(self.file)
+        self.assertTrue(path.isfile)
+        self.assertEqual(path.stat().st_mtime, path.age)
+        self.assertFalse(filesystem.Path(join(self.dir_root, 'missing')).isdir)
+
+    def test_copy_tree(self):
+        utime(self.file, (1000, 1000))
+        symlink('test.file.avi', join(self.folder, 'link.avi'))
+        dest = join(dirname(__file__), 'test_root_copy')
+        try:
+            self.assertEqual(1000, filesystem.copy_tree(self.dir_root, dest))
+            self.assertEqual('x'*1000, open(join(dest, 'test.file.avi')).read())
+            self.assertEqual(1000, stat(join(dest, 'test.file.avi')).st_mtime)
+            self.assertTrue(islink(join(dest, 'test.folder', 'link.avi')))
+            self.assertEqual('test.file.avi', readlink(join(dest, 'test.folder', 'link.avi')))
+        finally:
+            rmtree(dest)
+
+    def test_move_path(self):
+        dest = filesystem.move_path(self.file, self.folder)
+        self.assertEqual(join(self.folder, 'test.file.avi'), dest)
+        self.assertFalse(exists(self.file))
+        self.assertRaises(OSError, filesystem.move_path, join(self.dir_root, 'missing'), self.folder)
+
+    @unittest.skipUnless(exists('/dev/shm'), 'No second filesystem to move across')
+    def test_move_path_cross_device(self):
+        if stat('/dev/shm').st_dev == stat(self.dir_root).st_dev:
+            self.skipTest('/dev/shm is on the same device')
+        dest = join('/dev/shm', 'msort.test.folder')
+        with open(join(self.folder, 'inner.avi'), 'w') as fp: fp.write('x'*500)
+        copied = []
+        try:
+            filesystem.move_path(self.folder, dest, copied.append)
+            self.assertEqual([dest], copied)
+            self.assertFalse(exists(self.folder))
+            self.assertEqual(['inner.avi'], listdir(dest))
+            self.assertFalse(exists(dest + filesystem.PARTIAL_SUFFIX))
+        finally:
+            if exists(dest):
+                rmtree(dest)
+
+    def test_remove_tree(self):
+        makedirs(join(self.folder, 'sub', 'deeper'))
+        with open(join(self.folder, 'sub', 'a.avi'), 'w') as fp: fp.write('x'*300)
+        with open(join(self.folder, 'sub', 'deeper', 'b.avi'), 'w') as fp: fp.write('x'*200)
+        outside = join(self.dir_root, 'outside')
+        makedirs(outside)
+        with open(join(outside, 'kept.avi'), 'w') as fp: fp.write('x'*100)
+        symlink(outside, join(self.folder, 'link'))
+        dirs_size = sum([stat(join(self.folder, *p)).st_size for p in [(), ('sub',), ('sub', 'deeper')]])
+        freed = filesystem.remove_tree(self.folder)
+        self.assertFalse(exists(self.folder))
+        self.assertTrue(exists(join(outside, 'kept.avi')))
+        self.assertEqual(500 + dirs_size + len(outside), freed.size)
+        self.assertTrue(freed.blocks > 0)
+        self.assertEqual(filesystem.Freed(100, stat(join(outside, 'kept.avi')).st_blocks),
+                         filesystem.remove_tree(join(outside, 'kept.avi')))
+
     def test_disk_usage(self):
         usage = filesystem.disk_usage('/')
         self.assertTrue(usage.total > 0 and usage.used > 0 and usage.free > 0)
@@ -83,4 +178,11 @@ class FilesystemTest(unittest.TestCase):
         self.assertEqual('1.0TB', filesystem.fmt_size(1024**4))
         self.assertEqual('1024.0TB', filesystem.fmt_size(1024**5))
 
+    def test_parse_size(self):
+        self.assertEqual(100, filesystem.parse_size('100'))
+        self.assertEqual(1536, filesystem.parse_size('1.5K'))
+        self.assertEqual(50 * 1024**3, filesystem.parse_size('50GB'))
+        self.assertEqual(2 * 1024**4, filesystem.parse_size('2 tb'))
+        self.assertRaises(ValueError, filesystem.parse_size, '5X')
+
 if __name__ == '__main__': unittest.main()
@@ -1,7 +1,11 @@
-from os import remove
-from os.path import exists
+from os import remove, getcwd, makedirs, utime
+from os.path import exists, join, dirname
+from shutil import rmtree
+from msort.conf import Config
 from msort.check import CheckSkip
+from msort.filesystem import Path
 from msort.check.inuse import InUseCheck
+from msort.system import OpenFileIndex
 
 import unittest
 
@@ -27,4 +31,66 @@ class TestInUseScanner(unittest.TestCase):
         if exists(file_path):
             remove(file_path)
 
+    def test_openfilescan_lsof(self):
+        file_path = 'open_file'
+        try:
+            with open(file_path, 'w') as fp: fp.write('')
+        except: pass
+        with open(file_path) as openfile:
+            scanner = InUseCheck(None)
+            scanner.use_proc = False
+            self.assertRaises(CheckSkip, scanner, None, file_path)
+        if exists(file_path):
+            remove(file_path)
+
+    def test_open_file_index(self):
+        index = OpenFileIndex('/mnt/storage', ['/mnt/storage/TV/Show.S01/show.s01e01.avi'])
+        self.assertTrue('/mnt/storage/TV/Show.S01/show.s01e01.avi' in index)
+        self.assertTrue('/mnt/storage/TV/Show.S01' in index)
+        self.assertTrue('/mnt/storage/TV' in index)
+        self.assertFalse('/mnt/storage/TV/Show.S02' in index)
+        self.assertFalse('/mnt/storage/TV/Show.S0' in index)
+
+    def test_proc_index(self):
+        file_path = join(getcwd(), 'open_file')
+        with open(file_path, 'w') as fp:
+            index = OpenFileIndex(getcwd())
+            self.assertTrue(file_path in index)
+        remove(file_path)
+
+class TestInUseTiers(unittest.TestCase):
+    def setUp(self):
+        self.conf = Config(join(dirname(__file__), 'msort_test.conf'))
+        self.dir_root = join(dirname(__file__), 'test_root')
+        self.release = join(self.dir_root, 'Show.S01E01.HDTV.XviD-GRP')
+        makedirs(self.release)
+        with open(join(self.release, 'show.avi'), 'w') as fp: fp.write('x'*1000)
+
+    def tearDown(self):
+        rmtree(self.dir_root)
+
+    def test_lock_file(self):
+        open(join(self.release, '.incomplete'), 'w').close()
+        scanner = InUseCheck(self.conf)
+        self.assertRaises(CheckSkip, scanner, None, Path(self.release))
+        self.assertRaises(CheckSkip, scanner, None, Path(join(self.release, '.incomplete')))
+
+    def test_lock_disabled(self):
+        open(join(self.release, '.incomplete'), 'w').close()
+        self.conf.set('general', 'lock_enabled', 'false')
+        self.assertFalse(InUseCheck(self.conf)(None, Path(self.release)))
+
+    def test_recently_modified(self):
+        self.conf.set('general', 'inuse_active_seconds', '3600')
+        self.assertRaises(CheckSkip, InUseCheck(self.conf), None, Path(self.release))
+
+    def test_settled(self):
+        self.conf.set('general', 'inuse_active_seconds', '3600')
+        self.conf.set('general', 'inuse_settled_seconds', '7200')
+        for path in (join(self.release, 'show.avi'), self.release):
+            utime(path, (1000, 1000))
+        with open(join(self.release, 'show.avi')):
+            # Settled paths are never checked against the open files
+            self.assertFalse(InUseCheck(self.conf)(None, Path(self.release)))
+
 if __name__ == '__main__': unittest.main()
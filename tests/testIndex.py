@@ -0,0 +1,82 @@
+import unittest
+from os import makedirs, remove, utime
+from os.path import join, dirname, exists
+from shutil import rmtree
+
+from init_test_config import conf
+
+from msort.check import BaseCheck
+from msort.check.empty import EmptyCheck
+from msort.filesystem import DirectoryScanner, size_index
+from msort.index import ScanIndex, config_hash
+
+class CountingCheck(BaseCheck):
+    cacheable = True
+
+    def __init__(self, config):
+        super(CountingCheck, self).__init__(config)
+        self.checked = []
+
+    def __call__(self, section, path):
+        self.checked.append(path)
+        return False
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = join(dirname(__file__), 'test_root')
+        self.index_path = join(self.root_path, 'index.db')
+        for d in ('TV/Crave.S01E01.HDTV.XviD-SYS', 'TV/Bridezillas.S08E12.DSR.XviD-OMiCRON'):
+            makedirs(join(self.root_path, d))
+        self.digest = config_hash(conf)
+
+    def tearDown(self):
+        if exists(self.root_path):
+            rmtree(self.root_path)
+
+    def scan(self, digest=None, rescan=False):
+        index = ScanIndex(self.index_path, digest or self.digest, rescan)
+        check = CountingCheck(conf)
+        scanner = DirectoryScanner(conf, index)
+        scanner.registerChecker(check)
+        scanner.find('TV')
+        index.close()
+        return check.checked
+
+    def testUnchangedSkipped(self):
+        self.assertEqual(2, len(self.scan()))
+        self.assertEqual(0, len(self.scan()))
+
+    def testChangedChecked(self):
+        self.scan()
+        utime(join(self.root_path, 'TV/Crave.S01E01.HDTV.XviD-SYS'), (1000, 1000))
+        self.assertEqual(['Crave.S01E01.HDTV.XviD-SYS'], [p.split('/')[-1] for p in self.scan()])
+        self.assertEqual(0, len(self.scan()))
+
+    def testConfigChanged(self):
+        self.scan()
+        self.assertEqual(2, len(self.scan('other')))
+        self.assertEqual(0, len(self.scan('other')))
+
+    def testFullRescan(self):
+        self.scan()
+        self.assertEqual(2, len(self.scan(rescan=True)))
+    def testEmptiedDeepInside(self):
+        nested = join(self.root_path, 'TV/Crave.S01E01.HDTV.XviD-SYS/Sample/Proof')
+        makedirs(nested)
+        with open(join(nested, 'proof.jpg'), 'w') as fp:
+            fp.write('x')
+        def scan():
+            index = ScanIndex(self.index_path, self.digest)
+            scanner = DirectoryScanner(conf, index)
+            scanner.registerChecker(EmptyCheck(conf))
+            found = scanner.find('TV')
+            index.close()
+            return [oper.source.split('/')[-1] for oper in found]
+        self.assertEqual(['Bridezillas.S08E12.DSR.XviD-OMiCRON'], scan())
+        # Doesnt change the mtime of the release folder
+        remove(join(nested, 'proof.jpg'))
+        # A new run starts without any memoized sizes
+        size_index.clear()
+        self.assertEqual(['Bridezillas.S08E12.DSR.XviD-OMiCRON', 'Crave.S01E01.HDTV.XviD-SYS'], sorted(scan()))
+
+if __name__ == '__main__': unittest.main()
@@ -0,0 +1,104 @@
+from os import makedirs, listdir
+from os.path import exists, join, dirname
+from shutil import rmtree
+import json
+import unittest
+
+from msort.journal import OperationJournal, read_journal, load_pending
+from msort.operation import MoveOperation, MoveContentsOperation, DeleteOperation, OperationManager, \
+    LinkOperation, DuplicateOperation, OperationError, operation_from_dict
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir_root = join(dirname(__file__), 'test_root')
+        if exists(self.dir_root):
+            rmtree(self.dir_root)
+        for d in ['src/a', 'src/b', 'src/c', 'dest']:
+            makedirs(join(self.dir_root, d))
+        self.journal_path = join(self.dir_root, 'journal')
+
+    def tearDown(self):
+        rmtree(self.dir_root, ignore_errors=True)
+
+    def _manager(self, journal=None):
+        opmgr = OperationManager(journal=journal)
+        opmgr['TV'] = [MoveOperation(join(self.dir_root, 'src', d), join(self.dir_root, 'dest', d)) for d in 'ab']
+        opmgr['prune'] = [DeleteOperation(join(self.dir_root, 'src', 'c'), True)]
+        return opmgr
+
+    def testSerialize(self):
+        for oper in [MoveOperation('a', 'b', False), MoveContentsOperation('a', 'b'), DeleteOperation('a', True),
+                     LinkOperation('a', 'b'), DuplicateOperation('a', 'b', (1, 2, 3, 4.5), True)]:
+            loaded = operation_from_dict(json.loads(json.dumps(oper.toDict())))
+            self.assertEqual(type(oper), type(loaded))
+            self.assertEqual(oper.toDict(), loaded.toDict())
+        self.assertRaises(OperationError, operation_from_dict, {'type': 'FormatOperation'})
+
+    def testJournaledExecute(self):
+        journal = OperationJournal(self.journal_path, truncate=True)
+        self.assertTrue(self._manager(journal).execute())
+        journal.close()
+        entries = read_journal(self.journal_path)
+        self.assertEqual([0, 1, 2], [entry.id for entry in entries])
+        self.assertEqual(['TV', 'TV', 'prune'], sorted([entry.section for entry in entries]))
+        self.assertEqual(['done'] * 3, [entry.state for entry in entries])
+        self.assertEqual(0, load_pending(self.journal_path, OperationManager()))
+
+    def testResume(self):
+        journal = OperationJournal(self.journal_path, truncate=True)
+        opmgr = self._manager(journal)
+        journal.plan(opmgr)
+        # Killed after the first move ran but before it was marked done
+        first = opmgr['TV'][0]
+        journal.started(first)
+        first()
+        journal.close()
+        # Truncated line from the crash
+        with open(self.journal_path, 'a') as fp:
+            fp.write('{"event": "sta')
+        resumed = OperationManager()
+        self.assertEqual(2, load_pending(self.journal_path, resumed))
+        self.assertEqual(['b'], [oper.source[-1] for oper in resumed['TV']])
+        resumed.journal = OperationJournal(self.journal_path)
+        self.assertTrue(resumed.execute())
+        resumed.journal.close()
+        self.assertEqual(['a', 'b'], sorted(listdir(join(self.dir_root, 'dest'))))
+        self.assertEqual(0, load_pending(self.journal_path, OperationManager()))
+
+    def testResumeCopied(self):
+        source = join(self.dir_root, 'src', 'a')
+        with open(join(source, 'a.avi'), 'w') as fp:
+            fp.write('x')
+        journal = OperationJournal(self.journal_path, truncate=True)
+        move = MoveOperation(source, join(self.dir_root, 'dest', 'a'))
+        opmgr = OperationManager(journal=journal)
+        opmgr['TV'] = [move]
+        journal.plan(opmgr)
+        # Killed across devices after the copy was renamed into place, while removing the source
+        journal.started(move)
+        makedirs(join(self.dir_root, 'dest', 'a'))
+        with open(join(self.dir_root, 'dest', 'a', 'a.avi'), 'w') as fp:
+            fp.write('x')
+        move.copied = join(self.dir_root, 'dest', 'a')
+        journal.copied(move)
+        journal.close()
+        resumed = OperationManager()
+        self.assertEqual(1, load_pending(self.journal_path, resumed))
+        self.assertEqual('copied', read_journal(self.journal_path)[0].state)
+        resumed.journal = OperationJournal(self.journal_path)
+        self.assertTrue(resumed.execute())
+        resumed.journal.close()
+        self.assertFalse(exists(source))
+        self.assertEqual(['a.avi'], listdir(join(self.dir_root, 'dest', 'a')))
+        self.assertEqual(0, load_pending(self.journal_path, OperationManager()))
+
+    def testErrorRecorded(self):
+        journal = OperationJournal(self.journal_path, truncate=True)
+        opmgr = OperationManager(True, journal=journal)
+        opmgr['TV'] = [MoveOperation(join(self.dir_root, 'missing'), join(self.dir_root, 'dest', 'x'))]
+        self.assertFalse(opmgr.execute())
+        journal.close()
+        self.assertEqual(['error'], [entry.state for entry in read_journal(self.journal_path)])
+
+if __name__ == '__main__':
+    unittest.main()
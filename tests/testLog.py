@@ -0,0 +1,66 @@
+from io import StringIO
+from logging import Formatter, getLogger as realGetLogger, INFO
+from queue import Queue
+import unittest
+
+from msort import log
+
+class RecordingLogger(object):
+    def __init__(self):
+        self.lines = []
+
+    def info(self, msg, *args):
+        self.lines.append(msg % args)
+
+class TestLog(unittest.TestCase):
+    def testListenerBatches(self):
+        stream = StringIO()
+        handler = log.BufferedStreamHandler(stream)
+        handler.setFormatter(Formatter('%(message)s'))
+        flushes = []
+        handler.flush = lambda: flushes.append(stream.getvalue().count('\n'))
+        queue = Queue()
+        listener = log.BatchingQueueListener(queue, handler)
+        logger = realGetLogger('msort.test.batching')
+        logger.propagate = False
+        logger.setLevel(INFO)
+        logger.addHandler(log.LazyQueueHandler(queue))
+        for i in range(600):
+            logger.info('record %d', i)
+        listener.start()
+        listener.stop()
+        self.assertEqual(600, stream.getvalue().count('\n'))
+        self.assertTrue(stream.getvalue().startswith('record 0\nrecord 1\n'))
+        # Flushed every flush_every records and once drained, not after every record
+        self.assertTrue(2 <= len(flushes) <= 4)
+
+    def testLazyFormatting(self):
+        class Expensive(object):
+            formatted = 0
+            def __str__(self):
+                Expensive.formatted += 1
+                return 'expensive'
+        logger = log.getLogger('msort.test.lazy')
+        logger.debug('%s', Expensive())
+        log.flushLogs()
+        self.assertEqual(0, Expensive.formatted)
+
+    def testSummary(self):
+        logger = RecordingLogger()
+        summary = log.LogSummary(logger, interval=3600, prefix='Entries')
+        for _ in range(3):
+            summary.add('skipped by AgeCheck')
+        summary.add('matched by ReleaseCheck')
+        self.assertEqual([], logger.lines)
+        summary.flush()
+        summary.flush()
+        self.assertEqual(['Entries: matched by ReleaseCheck 1, skipped by AgeCheck 3'], logger.lines)
+
+    def testSummaryInterval(self):
+        logger = RecordingLogger()
+        summary = log.LogSummary(logger, interval=0)
+        summary.add('a')
+        self.assertEqual(['Summary: a 1'], logger.lines)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from msort import matcher as matcher_module
+from msort.matcher import RuleMatcher
+
+class MatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = RuleMatcher([
+            '(?P<name>.+?).S\\d{1,2}E\\d{1,2}',
+            '(?P<name>.+?).\\d{1,2}X\\d{2}',
+            '.+?(PAL|NTSC).DVDR'
+        ])
+
+    def testFirstRuleWins(self):
+        # Both rules match, the second one earlier in the string
+        match = self.matcher.search('Top.Gear.17x06.Crave.S01E01.HDTV')
+        self.assertEqual(0, match.index)
+        self.assertEqual('Top.Gear.17x06.Crave', match.groupdict()['name'])
+
+    def testNameGroup(self):
+        match = self.matcher.search('Top.Gear.17x06.HDTV.XviD-FoV')
+        self.assertEqual(1, match.index)
+        self.assertEqual('Top.Gear', match.group('name'))
+
+    def testNoNameGroup(self):
+        match = self.matcher.search('Feed.The.Fish.LIMITED.R2.PAL.DVDR-TARGET')
+        self.assertEqual(2, match.index)
+        self.assertRaises(KeyError, lambda: match.groupdict()['name'])
+
+    def testStartIndex(self):
+        self.assertEqual(1, self.matcher.search('Crave.S01E01.17x06', 1).index)
+
+    def testNoMatch(self):
+        self.assertEqual(None, self.matcher.search('TrollHunter.2010.LiMiTED.BDRip.XviD-NODLABS'))
+
+    def testPrefilter(self):
+        matcher = RuleMatcher(['(?P<name>^.+?[12]\\d{3}).+?(dvd|bd)rip.+?Xvid'])
+        self.assertEqual(set(['xvid']), matcher.literals)
+        self.assertEqual(None, matcher.search('The.Terrorist.2010.720p.BluRay.x264-aAF'))
+        self.assertEqual('TrollHunter.2010', matcher.search('TrollHunter.2010.LiMiTED.BDRip.XviD-NODLABS').group('name'))
+
+    def testPrefilterFallback(self):
+        class BrokenParser(object):
+            @staticmethod
+            def parse(pattern, flags):
+                raise ValueError(pattern)
+
+        class ChangedParser(object):
+            LITERAL = matcher_module.sre_parse.LITERAL
+
+            @staticmethod
+            def parse(pattern, flags):
+                # A op the prefilter doesnt know about, with a differently shaped argument
+                return [(object(), None), (ChangedParser.LITERAL, 'x')]
+
+        original = matcher_module.sre_parse
+        try:
+            for parser in (None, BrokenParser, ChangedParser):
+                matcher_module.sre_parse = parser
+                matcher = RuleMatcher(['(?P<name>^.+?[12]\\d{3}).+?(dvd|bd)rip.+?Xvid', '^Top'])
+                self.assertEqual(None, matcher.literals)
+                self.assertNotEqual(None, matcher.combined)
+                self.assertEqual(None, matcher.search('The.Terrorist.2010.720p.BluRay.x264-aAF'))
+                self.assertEqual('TrollHunter.2010',
+                                 matcher.search('TrollHunter.2010.LiMiTED.BDRip.XviD-NODLABS').group('name'))
+                self.assertEqual(1, matcher.search('Top.Gear').index)
+        finally:
+            matcher_module.sre_parse = original
+
+    def testUnmergeable(self):
+        matcher = RuleMatcher(['(\\w)\\1x', '^Top'])
+        self.assertEqual(None, matcher.combined)
+        self.assertEqual(0, matcher.search('aax').index)
+        self.assertEqual(1, matcher.search('Top.Gear').index)
+
+if __name__ == '__main__': unittest.main()
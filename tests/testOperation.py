@@ -1,7 +1,10 @@
 from os import makedirs, listdir
 from os.path import exists, join, dirname
 from shutil import rmtree
+from threading import Event
+from time import sleep
 import unittest
+from msort.filesystem import size_index, dir_size
 from msort.operation import MoveOperation, DeleteOperation, BaseOperation, OperationError, MoveContentsOperation, OperationManager, filterType
 
 class TestOperations(unittest.TestCase):
@@ -58,6 +61,17 @@ class TestOperations(unittest.TestCase):
         do = DeleteOperation(self.dir_root)
         do()
         self.assertFalse(exists(self.dir_root))
+        # 5 episode files and the test file
+        self.assertTrue(do.freed.size >= 6000)
+
+    def testDeleteStringDoesntWalk(self):
+        size_index.clear()
+        do = DeleteOperation(self.dir_root)
+        self.assertEqual('Delete {0}'.format(self.dir_root), str(do))
+        self.assertEqual(0, len(size_index))
+        do = DeleteOperation(self.dir_root)
+        dir_size(self.dir_root)
+        self.assertEqual('Delete (5.9KB) {0}'.format(self.dir_root), str(do))
 
     def testMoveContents(self):
         src = join(self.dir_root,'TV','The.Old.Guys.S01.DVDRip.XviD-BTN')
@@ -109,6 +123,118 @@ class TestOperationsManager(unittest.TestCase):
         self.assertTrue(exists(dest))
         self.assertFalse(exists(src))
 
+    def testCreateDestinations(self):
+        dest = join(self.dir_root, 'dest')
+        moves = [MoveOperation(join(self.dir_root, 'a'), join(dest, 'Show', 'a')),
+                 MoveOperation(join(self.dir_root, 'b'), join(dest, 'Show', 'b')),
+                 MoveOperation(join(self.dir_root, 'c'), join(self.dir_root, 'cc'))]
+        self.opmgr[self.section] = moves
+        self.assertEqual(1, self.opmgr.createDestinations([self.section]))
+        self.assertEqual([False] * 3, [oper.create_dest for oper in moves])
+        self.assertTrue(self.opmgr.execute())
+        self.assertEqual(['a', 'b'], sorted(listdir(join(dest, 'Show'))))
+
+    def testUnusedDestinationsRemoved(self):
+        dest = join(self.dir_root, 'dest')
+        makedirs(join(dest, 'Used'))
+        self.opmgr[self.section] = [MoveOperation(join(self.dir_root, 'a'), join(dest, 'Used', 'a')),
+                                    MoveOperation(join(self.dir_root, 'missing'), join(dest, 'Show', 'x')),
+                                    MoveOperation(join(self.dir_root, 'b'), join(dest, 'Other', 'b'))]
+        self.assertRaises(OperationError, self.opmgr.execute)
+        # The run stopped before anything moved into the new folders
+        self.assertEqual(['Used'], listdir(dest))
+        self.assertEqual(['a'], listdir(join(dest, 'Used')))
+
+    def testOptimizeRedundant(self):
+        root = self.dir_root
+        move = MoveOperation(join(root, 'a'), join(root, 'dest', 'a'))
+        parent = DeleteOperation(join(root, 'b'))
+        self.opmgr[self.section] = [
+            move,
+            DeleteOperation(join(root, 'a')),
+            DeleteOperation(join(root, 'b', 'nested')),
+            parent,
+            DeleteOperation(join(root, 'b')),
+            MoveOperation(join(root, 'a', 'file'), join(root, 'dest', 'file'))
+        ]
+        self.assertEqual(4, self.opmgr.optimize())
+        self.assertEqual([move, parent], self.opmgr[self.section])
+        self.assertTrue(self.opmgr.execute())
+
+    def testOptimizeCollision(self):
+        for opmgr in (self.opmgr, self.opmgr_error_ok):
+            first = MoveOperation(join(self.dir_root, 'a'), join(self.dir_root, 'dest'))
+            opmgr[self.section] = [first, MoveOperation(join(self.dir_root, 'b'), join(self.dir_root, 'dest'))]
+            opmgr['XVID'] = [MoveOperation(join(self.dir_root, 'c'), join(self.dir_root, 'dest'))]
+        self.assertRaises(OperationError, self.opmgr.optimize)
+        self.assertEqual(3, len(self.opmgr))
+        self.assertEqual(2, self.opmgr_error_ok.optimize())
+        self.assertEqual(1, len(self.opmgr_error_ok))
+        self.assertEqual(2, len(self.opmgr_error_ok.error_list))
+        self.assertFalse(self.opmgr_error_ok.execute())
+        self.assertTrue(exists(join(self.dir_root, 'dest')))
+
+    def testOptimizeOrder(self):
+        root = self.dir_root
+        copy = MoveOperation(join(root, 'a', 'x'), join(root, 'copied'))
+        copy.devices = lambda: (1, 2)
+        rename = MoveOperation(join(root, 'b'), join(root, 'renamed'))
+        rename.devices = lambda: (1, 1)
+        delete = DeleteOperation(join(root, 'c'))
+        outer = DeleteOperation(join(root, 'a'))
+        self.opmgr[self.section] = [copy, outer, delete, rename]
+        self.assertEqual(0, self.opmgr.optimize())
+        self.assertEqual([rename, delete, copy, outer], self.opmgr[self.section])
+
+    def _touch(self, *parts):
+        path = join(self.dir_root, *parts)
+        if not exists(dirname(path)):
+            makedirs(dirname(path))
+        with open(path, 'w') as fp:
+            fp.write('x')
+        return path
+
+    def testOptimizeIntoDirectory(self):
+        # Unsorted releases all move into the existing section directory
+        root = self.dir_root
+        dest = join(root, 'XVID')
+        makedirs(dest)
+        first = MoveOperation(join(root, 'a'), dest)
+        second = MoveOperation(self._touch('c', 'file.avi'), dest)
+        self.opmgr['XVID'] = [first, second]
+        self.assertEqual(0, self.opmgr.optimize())
+        self.assertEqual([join(dest, 'file.avi')], second.targets())
+        self.opmgr_error_ok['XVID'] = [first, MoveOperation(join(root, 'b', 'a'), dest + '/')]
+        self.assertEqual(1, self.opmgr_error_ok.optimize())
+        self.assertEqual([first], self.opmgr_error_ok['XVID'])
+
+    def testOptimizeMoveContents(self):
+        # Season packs of a show move their files into the same show folder
+        self._touch('a', 'Show.S01E01', 'e1.avi')
+        self._touch('a', 'Show.S01E02', 'e2.avi')
+        self._touch('b', 'Show.S02E01', 'e1.avi')
+        show = join(self.dir_root, 'Show')
+        first = MoveContentsOperation(join(self.dir_root, 'a'), show)
+        second = MoveContentsOperation(join(self.dir_root, 'b'), show)
+        self.opmgr[self.section] = [first, second]
+        self.assertEqual(0, self.opmgr.optimize())
+        self.assertEqual([join(show, 'Show.S01E01', 'e1.avi'), join(show, 'Show.S01E02', 'e2.avi')], first.targets())
+        self._touch('c', 'Show.S01E02', 'e2.avi')
+        self.opmgr[self.section] = [first, MoveContentsOperation(join(self.dir_root, 'c'), show)]
+        self.assertRaises(OperationError, self.opmgr.optimize)
+
+    def testOptimizeDeleteDestination(self):
+        root = join(self.dir_root, 'TV')
+        release = join(root, 'Crave.S01E02.HDTV.x264-LOL')
+        makedirs(release)
+        delete = DeleteOperation(join(root, 'Crave'))
+        move = MoveOperation(release, join(root, 'Crave', 'Crave.S01E02.HDTV.x264-LOL'))
+        self.opmgr[self.section] = [delete, move]
+        self.assertEqual(1, self.opmgr.optimize())
+        self.assertEqual([move], self.opmgr[self.section])
+        self.assertTrue(self.opmgr.execute())
+        self.assertTrue(exists(join(root, 'Crave', 'Crave.S01E02.HDTV.x264-LOL')))
+
     def testExecuteErrorRaise(self):
         src = join(self.dir_root, 'bb')
         dest = join(self.dir_root, 'bbb')
@@ -123,5 +249,87 @@ class TestOperationsManager(unittest.TestCase):
         self.assertEqual(1, len(errors))
         self.opmgr_error_ok.showErrors()
 
+    def testExecuteLanes(self):
+        opmgr = OperationManager(lanes=2)
+        opmgr[self.section] = [MoveOperation(join(self.dir_root, d), join(self.dir_root, d*2)) for d in 'abc']
+        opmgr['other'] = [DeleteOperation(join(self.dir_root, 'cc'))]
+        self.assertTrue(opmgr.execute(['TV']))
+        self.assertEqual(3, opmgr.cur_idx)
+        self.assertEqual(['aa', 'bb', 'cc'], sorted(listdir(self.dir_root)))
+
+    def testExecuteLanesDependent(self):
+        class SlowMove(MoveOperation):
+            def __call__(self):
+                sleep(0.2)
+                MoveOperation.__call__(self)
+            def devices(self):
+                # A copy to another device
+                return 1, 2
+        with open(join(self.dir_root, 'a', 'x'), 'w') as fp:
+            fp.write('x')
+        move = SlowMove(join(self.dir_root, 'a', 'x'), join(self.dir_root, 'b', 'x'))
+        delete = DeleteOperation(join(self.dir_root, 'a'))
+        other = DeleteOperation(join(self.dir_root, 'c'))
+        opmgr = OperationManager(lanes=2)
+        opmgr[self.section] = [move, other, delete]
+        self.assertEqual([[move, delete], [other]], [list(chain) for chain in opmgr.chains([self.section])])
+        self.assertTrue(opmgr.execute())
+        self.assertEqual(['b'], listdir(self.dir_root))
+        self.assertEqual(['x'], listdir(join(self.dir_root, 'b')))
+
+    def testExecuteLanesErrorRaise(self):
+        opmgr = OperationManager(lanes=2)
+        opmgr[self.section] = [MoveOperation(join(self.dir_root, 'bb'), join(self.dir_root, 'bbb'))]
+        self.assertRaises(OperationError, opmgr.execute)
+
+    def testExecuteLanesErrorSkip(self):
+        opmgr = OperationManager(True, lanes=2)
+        opmgr[self.section] = [
+            MoveOperation(join(self.dir_root, 'bb'), join(self.dir_root, 'bbb')),
+            MoveOperation(join(self.dir_root, 'a'), join(self.dir_root, 'aa'))
+        ]
+        self.assertFalse(opmgr.execute())
+        self.assertEqual(1, len(opmgr.error_list))
+        self.assertTrue(exists(join(self.dir_root, 'aa')))
+
+    def testExecuteStream(self):
+        def stream():
+            for d in 'abc':
+                yield self.section, MoveOperation(join(self.dir_root, d), join(self.dir_root, d*2))
+            yield self.section, DeleteOperation(join(self.dir_root, 'cc'))
+        opmgr = OperationManager()
+        self.assertTrue(opmgr.executeStream(stream(), queue_size=1))
+        self.assertEqual(4, opmgr.cur_idx)
+        self.assertEqual(0, len(opmgr))
+        self.assertEqual(['aa', 'bb'], sorted(listdir(self.dir_root)))
+        self.assertEqual(1, len(opmgr.freed))
+
+    def testExecuteStreamErrorRaise(self):
+        def stream():
+            yield self.section, MoveOperation(join(self.dir_root, 'missing'), join(self.dir_root, 'x'))
+            for d in 'abc':
+                yield self.section, MoveOperation(join(self.dir_root, d), join(self.dir_root, d*2))
+        opmgr = OperationManager()
+        self.assertRaises(OperationError, opmgr.executeStream, stream(), 1)
+        self.assertTrue(exists(join(self.dir_root, 'c')))
+
+    def testExecuteStreamInterrupted(self):
+        started = Event()
+        class SlowMove(MoveOperation):
+            def __call__(self):
+                started.set()
+                sleep(0.2)
+                MoveOperation.__call__(self)
+        def stream():
+            yield self.section, SlowMove(join(self.dir_root, 'a'), join(self.dir_root, 'aa'))
+            started.wait()
+            for d in 'bc':
+                yield self.section, MoveOperation(join(self.dir_root, d), join(self.dir_root, d*2))
+            raise KeyboardInterrupt()
+        opmgr = OperationManager()
+        self.assertRaises(KeyboardInterrupt, opmgr.executeStream, stream())
+        # The running move finishes, the queued ones are dropped
+        self.assertEqual(['aa', 'b', 'c'], sorted(listdir(self.dir_root)))
+
 
 if __name__ == '__main__': unittest.main()
\ No newline at end of file
@@ -1,14 +1,18 @@
 from os import makedirs, link, unlink, utime
-from os.path import exists, join, dirname
+from os.path import exists, join, dirname, basename
 from shutil import rmtree
+from time import time
 import unittest
 
 from init_test_config import conf
 
-from msort.filesystem import DirectoryScanner
+from msort import filesystem
+from msort.filesystem import DirectoryScanner, Path
 from msort.check import DummyCheck
+from msort.check.age import AgeCheck
 from msort.check.empty import EmptyCheck
 from msort.check.release import ReleaseCheck
+from msort.check import prune
 from msort.check.prune import Pruner
 from msort.operation import filterType, MoveContentsOperation
 
@@ -112,6 +116,21 @@ class TestScanner(unittest.TestCase):
         self.assertEquals(len(changes['XVID']), 2)
         self.assertEquals(len(changes['TV']), 6)
 
+    def testReleaseCheckExistingFolder(self):
+        makedirs(join(self.root_path, 'TV/ENTOURAGE'))
+        makedirs(join(self.root_path, 'TV/Crave'))
+        checker = ReleaseCheck(conf)
+        checker.prepare('TV')
+        dests = dict([(basename(op.source), op.destination) for op in
+                      [checker('TV', Path(join(self.root_path, 'TV', name))) for name in
+                       ('Entourage.S08E06.HDTV.Custom.HebSub.XviD-Extinct', 'Crave.S01E01.HDTV.XviD-SYS',
+                        'Bridezillas.S08E12.DSR.XviD-OMiCRON')]])
+        self.assertEqual(join(self.root_path, 'TV/ENTOURAGE/Entourage.S08E06.HDTV.Custom.HebSub.XviD-Extinct'),
+                         dests['Entourage.S08E06.HDTV.Custom.HebSub.XviD-Extinct'])
+        self.assertEqual(join(self.root_path, 'TV/Crave/Crave.S01E01.HDTV.XviD-SYS'), dests['Crave.S01E01.HDTV.XviD-SYS'])
+        self.assertEqual(join(self.root_path, 'TV/Bridezillas/Bridezillas.S08E12.DSR.XviD-OMiCRON'),
+                         dests['Bridezillas.S08E12.DSR.XviD-OMiCRON'])
+
     def testEmptyCheck(self):
         scanner = DirectoryScanner(conf)
         scanner.registerChecker(EmptyCheck(conf))
@@ -134,6 +153,140 @@ class TestScanner(unittest.TestCase):
             changes.extend(scanner.find(section))
         self.assertEquals(len(changes), 1)
 
+    def testPruneIndex(self):
+        index_path = join(self.root_path, 'prune.index')
+        conf.set('prune', 'index', 'true')
+        conf.set('prune', 'index_path', index_path)
+        try:
+            pruner = Pruner(conf)
+            pruner.prepare('TV')
+            self.assertTrue(exists(index_path))
+            show = join(self.root_path, 'TV/History.of.ECW')
+            release = join(show, 'History.of.ECW.1997.11.04.HDTV.XviD-W4F')
+            self.assertEqual([[0, basename(release)]], pruner.index.entries('TV', Path(show), pruner.match))
+            # A newer release is only picked up once the show folder changes
+            makedirs(join(show, 'History.of.ECW.1997.11.05.HDTV.XviD-W4F'))
+            utime(show, (1, 1))
+            reloaded = Pruner(conf)
+            entries = reloaded.index.entries('TV', Path(show), reloaded.match)
+            self.assertEqual([0, basename(release)], entries[0])
+            self.assertEqual(2, len(entries))
+            self.assertEqual([release], [op.source for op in reloaded('TV', Path(show))])
+        finally:
+            conf.remove_option('prune', 'index')
+            conf.remove_option('prune', 'index_path')
+
+    def testPruneFreeTarget(self):
+        show = join(self.root_path, 'TV/History.of.ECW')
+        for i, day in enumerate(range(5, 8)):
+            path = join(show, 'History.of.ECW.1997.11.0{0}.HDTV.XviD-W4F'.format(day))
+            makedirs(path)
+            with open(join(path, 'release.avi'), 'w') as fp:
+                fp.write('x' * 1024**2)
+            mtime = time() - (5 - i) * 86400
+            utime(path, (mtime, mtime))
+        # Short of the target by one and a half releases after the expired one is gone, so the
+        # two oldest releases which have not expired yet go with it
+        conf.set('prune', 'free_target', str(filesystem.disk_usage(self.root_path).free + 1000 + 1536 * 1024))
+        try:
+            ops = Pruner(conf)('TV', Path(show))
+        finally:
+            conf.remove_option('prune', 'free_target')
+        self.assertEqual(['History.of.ECW.1997.11.04.HDTV.XviD-W4F', 'History.of.ECW.1997.11.05.HDTV.XviD-W4F',
+                          'History.of.ECW.1997.11.06.HDTV.XviD-W4F'], sorted([basename(op.source) for op in ops]))
+
+    def testPruneFreeTargetTrashed(self):
+        show = join(self.root_path, 'TV/History.of.ECW')
+        path = join(show, 'History.of.ECW.1997.11.05.HDTV.XviD-W4F')
+        makedirs(path)
+        mtime = time() - 86400
+        utime(path, (mtime, mtime))
+        conf.set('prune', 'free_target', str(filesystem.disk_usage(self.root_path).free + 1024**2))
+        original = prune.trash_size
+        # Earlier runs trashed enough to meet the target once the trash is reaped
+        prune.trash_size = lambda path: 2 * 1024**2
+        try:
+            ops = Pruner(conf)('TV', Path(show))
+        finally:
+            prune.trash_size = original
+            conf.remove_option('prune', 'free_target')
+        self.assertEqual(['History.of.ECW.1997.11.04.HDTV.XviD-W4F'], [basename(op.source) for op in ops])
+
+    def testPruneFreeTargetShared(self):
+        show = join(self.root_path, 'TV/History.of.ECW')
+        releases = [join(show, 'History.of.ECW.1997.11.0{0}.HDTV.XviD-W4F'.format(day)) for day in range(5, 8)]
+        releases.append(join(self.root_path, 'SRC_XVID/Raw.1997.11.03.HDTV.XviD-W4F'))
+        for i, path in enumerate(releases):
+            makedirs(path)
+            with open(join(path, 'release.avi'), 'w') as fp:
+                fp.write('x' * 1024**2)
+            mtime = time() - (5 - i if i < 3 else 6) * 86400
+            utime(path, (mtime, mtime))
+        # TV and XVID share the filesystem, so the target is only met once across both of them
+        conf.set('prune', 'free_target', str(filesystem.disk_usage(self.root_path).free + 1000 + 1536 * 1024))
+        try:
+            scanner = DirectoryScanner(conf)
+            scanner.registerChecker(Pruner(conf))
+            found = dict(scanner.findAll(self.sections))
+        finally:
+            conf.remove_option('prune', 'free_target')
+        self.assertEqual(['History.of.ECW.1997.11.04.HDTV.XviD-W4F', 'History.of.ECW.1997.11.05.HDTV.XviD-W4F'],
+                         sorted([basename(op.source) for op in found['TV']]))
+        self.assertEqual(['Raw.1997.11.03.HDTV.XviD-W4F'], [basename(op.source) for op in found['XVID']])
+        self.assertEqual([], found['DVDR'])
+
+    def testFindAllConcurrent(self):
+        conf.set('TV', 'sort_seasons', 'false')
+        scanner = DirectoryScanner(conf)
+        scanner.registerChecker(EmptyCheck(conf))
+        scanner.registerChecker(ReleaseCheck(conf))
+        serial = scanner.findAll(self.sections)
+        concurrent = scanner.findAll(self.sections, threads=3, mount_threads=2)
+        self.assertEqual(list(self.sections), [section for section, _ in concurrent])
+        self.assertEqual([[str(op) for op in ops] for _, ops in serial],
+                         [[str(op) for op in ops] for _, ops in concurrent])
+
+    def testStats(self):
+        conf.set('TV', 'sort_seasons', 'false')
+        scanner = DirectoryScanner(conf)
+        scanner.registerChecker(EmptyCheck(conf))
+        scanner.registerChecker(ReleaseCheck(conf))
+        changes = scanner.find('TV')
+        empty, release = scanner.checkerStats['EmptyCheck'], scanner.checkerStats['ReleaseCheck']
+        entries = scanner.sectionStats['TV'].entries
+        self.assertEqual(entries, empty.calls)
+        self.assertEqual(entries - empty.matches, release.calls)
+        self.assertEqual(len(changes), empty.matches + release.matches)
+        self.assertTrue(release.total_time >= release.max_time > 0)
+        self.assertEqual(0, release.errors + release.skips)
+        self.assertTrue(scanner.sectionStats['TV'].total_time >= scanner.sectionStats['TV'].enumerate_time)
+        summary = scanner.summary()
+        self.assertTrue(summary[1].startswith('EmptyCheck'))
+        self.assertTrue(summary[-1].startswith('TV'))
+
+    def testBatchScan(self):
+        conf.set('TV', 'sort_seasons', 'false')
+        found = {}
+        try:
+            for batch in ('0', '1', '7', '512'):
+                conf.set('general', 'scan_batch', batch)
+                scanner = DirectoryScanner(conf)
+                for checker in (AgeCheck, EmptyCheck, ReleaseCheck, Pruner):
+                    scanner.registerChecker(checker(conf))
+                conf.set('minimum_age', 'enabled', 'false')
+                found[batch] = [[str(op) for op in scanner.find(section)] for section in self.sections]
+                conf.set('minimum_age', 'enabled', 'true')
+                scanner = DirectoryScanner(conf)
+                scanner.registerChecker(AgeCheck(conf))
+                scanner.registerChecker(EmptyCheck(conf))
+                self.assertEqual([], scanner.find('TV'))
+                self.assertEqual(scanner.sectionStats['TV'].entries, scanner.checkerStats['AgeCheck'].skips)
+        finally:
+            conf.remove_option('general', 'scan_batch')
+        self.assertEqual(8, len(found['0'][0]))
+        for batch in ('1', '7', '512'):
+            self.assertEqual(found['0'], found[batch])
+
     def testSeasonDetection(self):
         conf.set('TV', 'sort_seasons', 'true')
         scanner = DirectoryScanner(conf)
@@ -0,0 +1,54 @@
+from os import makedirs, utime
+from os.path import exists, join, dirname
+from shutil import rmtree
+import unittest
+
+from msort.filesystem import Path, scandir
+from msort.table import EntryTable, ListColumn, nonzero
+
+class TestEntryTable(unittest.TestCase):
+    def setUp(self):
+        self.root_path = join(dirname(__file__), 'test_root')
+        if exists(self.root_path):
+            rmtree(self.root_path)
+        makedirs(join(self.root_path, 'empty_dir'))
+        makedirs(join(self.root_path, 'full_dir'))
+        for name, data in (('full_dir/file', 'x' * 10), ('empty_file', ''), ('file', 'x' * 5)):
+            with open(join(self.root_path, name), 'w') as fp:
+                fp.write(data)
+        for i, name in enumerate(('empty_dir', 'empty_file', 'file', 'full_dir')):
+            utime(join(self.root_path, name), (i * 100, i * 100))
+        self.table = EntryTable(sorted(scandir(self.root_path)) + [Path(join(self.root_path, 'missing'))])
+
+    def tearDown(self):
+        rmtree(self.root_path, ignore_errors=True)
+
+    def testColumns(self):
+        self.assertEqual(['empty_dir', 'empty_file', 'file', 'full_dir', 'missing'], self.table.names)
+        self.assertEqual([0, 100, 200, 300], list(self.table.mtime)[:4])
+        self.assertEqual([0, 0, 5, 10, -1], list(self.table.size))
+        self.assertEqual([True, False, False, True, False], list(self.table.is_dir))
+        self.assertEqual([True, True, True, True, False], list(self.table.valid))
+        self.assertEqual([0, 1], nonzero((self.table.size == 0) & (self.table.is_dir | self.table.is_file)))
+        self.assertEqual([2], nonzero(self.table.isin(set([join(self.root_path, 'file')]))))
+
+    def testTake(self):
+        self.table.size
+        taken = self.table.take([3, 1])
+        self.assertEqual(['full_dir', 'empty_file'], taken.names)
+        self.assertEqual([10, 0], list(taken.size))
+        self.assertEqual([300, 100], list(taken.mtime))
+
+    def testResults(self):
+        results = self.table.results(self.table.mtime >= 200, lambda path: path[-4:])
+        self.assertEqual([False, False, 'file', '_dir', False], results)
+
+    def testListColumn(self):
+        column = ListColumn([1, 2, 3])
+        self.assertEqual([False, True, True], list(column > 1))
+        self.assertEqual([True, False, False], list(~(column >= 2)))
+        self.assertEqual([False, True, False], list((column > 1) & (column < 3)))
+        self.assertEqual([True, False, True], list((column == 1) | (column == ListColumn([0, 0, 3]))))
+
+if __name__ == '__main__':
+    unittest.main()
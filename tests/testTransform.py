@@ -31,4 +31,14 @@ class TransformTest(unittest.TestCase):
         res = transform.split_uc_words('NOVA.S39E16.480p.HDTV.x264-mSD.mkv')
         self.assertEqual('NOVA', res[0])
 
+    def test_cleanup_memoized(self):
+        hits = transform._cleanup.cache_info().hits
+        first = transform.cleanup('the.daily.show.2012.03.01.hdtv.xvid-fqm.avi')
+        second = transform.cleanup('the.daily.show.2012.03.01.hdtv.xvid-fqm.avi')
+        self.assertEqual(first, second)
+        self.assertEqual(hits + 1, transform._cleanup.cache_info().hits)
+
+    def test_cleanup_sep(self):
+        self.assertEqual('Top_Gear_17x06', transform.cleanup('Top Gear - 17x06', '_'))
+
 if __name__ == '__main__':    unittest.main()
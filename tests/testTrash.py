@@ -0,0 +1,79 @@
+from os import makedirs, listdir
+from os.path import exists, join, isdir
+from shutil import rmtree
+from tempfile import mkdtemp
+import unittest
+
+from msort import operation
+from msort.filesystem import TRASH_DIR, mount_point
+from msort.operation import DeleteOperation
+from msort.trash import move_to_trash, trash_dir, trash_size, reap, Reaper, find_trash_dirs
+
+SHM = '/dev/shm'
+
+@unittest.skipUnless(isdir(SHM), 'needs a tmpfs mounted at /dev/shm')
+class TestTrash(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(dir=SHM)
+        self.folder = join(self.root, 'Some.Show.S01E01')
+        makedirs(join(self.folder, 'Sample'))
+        with open(join(self.folder, 'Sample', 'a.avi'), 'w') as fp:
+            fp.write('x' * 100)
+        self.trash = trash_dir(self.root)
+        self.existed = exists(self.trash)
+
+    def tearDown(self):
+        rmtree(self.root, ignore_errors=True)
+        if not self.existed:
+            rmtree(self.trash, ignore_errors=True)
+
+    def testMountPoint(self):
+        self.assertEqual(SHM, mount_point(self.folder))
+        self.assertEqual(join(SHM, TRASH_DIR), self.trash)
+
+    def testMoveToTrash(self):
+        target = move_to_trash(self.folder)
+        self.assertFalse(exists(self.folder))
+        self.assertTrue(exists(join(target, 'Sample', 'a.avi')))
+        self.assertTrue(target.endswith('Some.Show.S01E01'))
+
+    def testTrashSize(self):
+        size = trash_size(self.root)
+        move_to_trash(self.folder)
+        self.assertTrue(trash_size(self.root) >= size + 100)
+
+    def testReap(self):
+        move_to_trash(self.folder)
+        reaped, freed = reap(self.trash)
+        self.assertTrue(reaped >= 1)
+        self.assertTrue(freed >= 100)
+        self.assertEqual([], listdir(self.trash))
+
+    def testDeleteOperationTrash(self):
+        DeleteOperation(self.folder, trash=True)()
+        self.assertFalse(exists(self.folder))
+        self.assertTrue(listdir(self.trash))
+
+    def testDeleteOperationFallback(self):
+        def fail(path):
+            raise OSError('read only')
+        trash = operation.move_to_trash
+        operation.move_to_trash = fail
+        try:
+            DeleteOperation(self.folder, trash=True)()
+        finally:
+            operation.move_to_trash = trash
+        self.assertFalse(exists(self.folder))
+
+    def testReaper(self):
+        reaper = Reaper(find_trash_dirs([self.root, join(self.root, 'missing')]), interval=0.01)
+        self.assertEqual([self.trash], reaper.trash_dirs)
+        reaper.start()
+        DeleteOperation(self.folder, trash=True)()
+        reaper.stop()
+        self.assertFalse(reaper.is_alive())
+        self.assertEqual([], listdir(self.trash))
+        self.assertTrue(reaper.freed >= 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from os import makedirs, rename
+from os.path import join, dirname, exists
+from shutil import rmtree
+from time import time
+
+from init_test_config import conf
+
+from msort.filesystem import DirectoryScanner
+from msort.check.release import ReleaseCheck
+from msort.watch import Watcher
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = join(dirname(__file__), 'test_root')
+        self.source = join(self.root_path, 'TV')
+        makedirs(self.source)
+        conf.set('TV', 'sort_seasons', 'false')
+        self.scanner = DirectoryScanner(conf)
+        self.scanner.registerChecker(ReleaseCheck(conf))
+        self.watcher = Watcher(self.scanner, ['TV'], settle=5)
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.inotify.close()
+        if exists(self.root_path):
+            rmtree(self.root_path)
+
+    def testNewEntrySettles(self):
+        release = join(self.source, 'Crave.S01E01.HDTV.XviD-SYS')
+        makedirs(release)
+        self.watcher.poll(1)
+        self.assertEqual([('TV', release)], list(self.watcher.pending))
+        self.assertEqual({}, self.watcher.settled())
+        # Writes inside the entry postpone it
+        with open(join(release, 'crave.avi'), 'w') as fp: fp.write('x'*1000)
+        self.watcher.poll(1)
+        settled = self.watcher.settled(time() + 5)
+        self.assertEqual({'TV': [release]}, settled)
+        operations = self.scanner.findPaths('TV', settled['TV'])
+        self.assertEqual(1, len(operations))
+
+    def testMovedAway(self):
+        release = join(self.source, 'Crave.S01E01.HDTV.XviD-SYS')
+        makedirs(release)
+        self.watcher.poll(1)
+        rename(release, join(self.root_path, 'Crave.S01E01.HDTV.XviD-SYS'))
+        self.watcher.poll(1)
+        self.assertEqual({}, self.watcher.pending)
+        self.assertEqual(1, len(self.watcher.watches))
+
+if __name__ == '__main__': unittest.main()